@@ -1,12 +1,15 @@
 import os
-import struct
-import binascii
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
-from mpl_toolkits.basemap import Basemap
-import geohash
+from geo_utils import (add_lonlat, lonlat_usecols, build_geohash_pyramid,
+                       save_geohash_pyramid, load_geohash_pyramid_level,
+                       pyramid_key, geohash_pyramid_key)
+from svg_output import save_hybrid_svg
+from map_background import load_background, new_map, render_map_grid
+import accession_table
+from accession_table import to_days, day_bins, no_day
 
 # -------------------------------------------------------------------
 # CONFIGURATION
@@ -36,81 +39,96 @@ os.makedirs(out_dir, exist_ok=True)
 min_size = 30              # pt²
 scale    = 0.3            # additional pt² per extra sample
 
+# SVG: markers and map fills embedded as an image, text stays vector
+svg_raster_dpi = 300
+svg_compare    = False    # True: also time an all-vector SVG and print both sizes
+
 gh_prec = 2               # geohash precision (3 = ~150km, 4 = ~40km, 5 = ~5km)
+
+# aggregates for geohash precisions 1-5, rebuilt when csv_path, the build
+# parameters (keep, usecols, dtype, date_col) or the binning code change
+pyramid_path = os.path.join(
+    out_dir,
+    os.path.splitext(os.path.basename(csv_path))[0] + "_geohash_pyramid.npz")
+
+# batch mode: one extra map per precision × category × year, all drawn on
+# the same cached background (None = all categories / all years)
+map_grid        = False
+grid_precisions = [2, 3, 4]
+grid_categories = [None] + list(base_col)
+grid_years      = [None]            # e.g. [None] + list(range(2016, 2023))
+date_col        = "collection_date_sam"
+grid_dir        = os.path.join(out_dir, "grid")
 # -------------------------------------------------------------------
 
-## Functions
-
-# Translate WTK to lon/lat
-def wkb_to_lonlat(hexstr: str):
-    """
-    Decode a WKB POINT (hex) with or without SRID (EPSG:4326) → (lon, lat).
-
-    Handles both:
-        • 25-byte variant 0101… (little endian) or 0001… (big endian) with SRID
-        • 21-byte variant without SRID
-    Returns (np.nan, np.nan) if anything looks wrong.
-    """
-    try:
-        b = binascii.unhexlify(hexstr.strip())
-    except (binascii.Error, AttributeError):
-        return np.nan, np.nan
-
-    if len(b) < 21:         # too short to hold 2 doubles
-        return np.nan, np.nan
-
-    endian = "<" if b[0] == 1 else ">"
-    try:
-        if len(b) == 25:    # SRID header present
-            x = struct.unpack(endian + "d", b[9:17])[0]
-            y = struct.unpack(endian + "d", b[17:25])[0]
-        else:               # plain WKB point
-            x = struct.unpack(endian + "d", b[5:13])[0]
-            y = struct.unpack(endian + "d", b[13:21])[0]
-    except struct.error:
-        return np.nan, np.nan
-    return x, y
+def year_pyramid_path(year):
+    return pyramid_path.replace(".npz", f"_{year}.npz")
+
+
+def current_pyramid_key():
+    params = {"keep": sorted(keep), "usecols": usecols, "dtype": dtype, "date_col": date_col}
+    return pyramid_key(csv_path, params, [__file__, accession_table.__file__])
 
-def main():
-    df = pd.read_csv(csv_path, usecols=usecols, dtype=dtype, low_memory=False)
+
+def build_pyramid(key=""):
+    """Read, decode and bin the positive accessions once for all geohash precisions (and years)."""
+    cols = lonlat_usecols(csv_path, usecols)
+    header = pd.read_csv(csv_path, nrows=0).columns
+    if date_col in header:
+        cols = cols + [date_col]
+    df = pd.read_csv(csv_path, usecols=cols, dtype=dtype, low_memory=False)
 
     df = df.drop_duplicates(subset="acc", keep="first")
 
     df = df[df["metagenome_category"].isin(keep)].copy()
 
-    lonlat = df["WTK"].apply(wkb_to_lonlat)
+    # lon/lat are stored by the geolocation merge; only older tables need decoding
+    if "lon" not in df.columns:
+        df = add_lonlat(df, "WTK")
 
-    # unpack the tuples into two numeric columns
-    df["lon"] = lonlat.apply(lambda t: t[0]).astype("float32")
-    df["lat"] = lonlat.apply(lambda t: t[1]).astype("float32") 
+    df["lon"] = df["lon"].astype("float32")
+    df["lat"] = df["lat"].astype("float32")
 
     # drop rows where decoding failed
     df = df.dropna(subset=["lon", "lat"])
 
-    # Geohash cells
-    df["geo"] = [geohash.encode(lat, lon, precision=gh_prec)
-                 for lat, lon in zip(df["lat"], df["lon"])]
-
-    grouped = (
-        df.groupby(["geo", "metagenome_category"], observed=True)
-          .agg(lon=("lon", "mean"),
-               lat=("lat", "mean"),
-               n_samples=("acc", "size"))
-          .reset_index()
-    )
+    categories, levels = build_geohash_pyramid(
+        df["lon"], df["lat"], df["metagenome_category"].astype(str))
+    save_geohash_pyramid(pyramid_path, categories, levels, key)
+
+    # one pyramid per collection year, for the year maps of the grid
+    # (dates like "[2019-05-01]" or "[2020]" are parsed by to_days)
+    if date_col in df.columns:
+        days = to_days(df[date_col])
+        dated = days != no_day
+        year = day_bins(days[dated], "Y")
+        stem = os.path.basename(pyramid_path).replace(".npz", "_")
+        for old in os.listdir(out_dir):           # years of an earlier build
+            if old.startswith(stem) and old[len(stem):-4].isdigit():
+                os.remove(os.path.join(out_dir, old))
+        for y, sub in df[dated].groupby(year):
+            categories, levels = build_geohash_pyramid(
+                sub["lon"], sub["lat"], sub["metagenome_category"].astype(str))
+            save_geohash_pyramid(year_pyramid_path(int(y)), categories, levels, key)
+
+
+def load_points(precision, category=None, year=None):
+    """Bubble table for one precision, optionally one category and one year."""
+    path = pyramid_path if year is None else year_pyramid_path(year)
+    if not os.path.exists(path):                  # no samples that year
+        return None
+    grouped = load_geohash_pyramid_level(path, precision)
+    if category is not None:
+        grouped = grouped[grouped["metagenome_category"] == category].copy()
 
     # use the cell centre as the plotting coordinate
     grouped["size"] = min_size + grouped["n_samples"] * scale
     grouped["colour"] = grouped["metagenome_category"].map(base_col)
+    return grouped
 
-    fig, ax = plt.subplots(figsize=(13, 7))
-    m = Basemap(projection="moll", lon_0=0, resolution="c")
-    m.drawcoastlines(linewidth=0.4)
-    m.fillcontinents(color="#ededed", lake_color="white")
-    #m.drawparallels(np.arange(-90, 91, 30))
-    #m.drawmeridians(np.arange(0, 361, 60))
-    m.drawmapboundary(fill_color="white")
 
+def draw_overlay(fig, ax, m, grouped, out, title):
+    """Bubbles and both legends on a background from new_map, saved as PNG + SVG."""
     for cat in base_col:
         sub = grouped[grouped["metagenome_category"] == cat]
         if sub.empty:
@@ -151,7 +169,7 @@ def main():
 
     sizes_for_legend = min_size + np.array(counts_for_legend) * scale
     size_handles = [
-		plt.scatter([], [], s=s, marker='o', color='grey',
+		ax.scatter([], [], s=s, marker='o', color='grey',
 					edgecolors='face', alpha=0.5,
 					label=f"{int(c)}")
 		for s, c in zip(sizes_for_legend, counts_for_legend)
@@ -166,10 +184,47 @@ def main():
 	)
     ax.add_artist(leg_size)
 
-    plt.title("AMR positive unique accessions by metagenome category")
-    out = os.path.join(out_dir, f"map_plot_sizebubbles_geohash_bigger.png")
+    ax.set_title(title)
     fig.savefig(out, dpi=600)
-    fig.savefig(out.replace(".png", ".svg"))
+    save_hybrid_svg(fig, out.replace(".png", ".svg"),
+                    raster_dpi=svg_raster_dpi, compare=svg_compare)
+
+
+def grid_variants():
+    """One map per (precision, category, year) of the grid configuration."""
+    os.makedirs(grid_dir, exist_ok=True)
+    variants = []
+    for prec in grid_precisions:
+        for cat in grid_categories:
+            for year in grid_years:
+                grouped = load_points(prec, cat, year)
+                if grouped is None or grouped.empty:
+                    continue
+                name = f"map_gh{prec}_{cat or 'all'}_{year or 'allyears'}"
+                title = (f"AMR positive unique accessions, {cat or 'all categories'}, "
+                         f"{year or 'all years'} (geohash {prec})")
+                variants.append({"grouped": grouped, "title": title,
+                                 "out": os.path.join(grid_dir, name + ".png")})
+    return variants
+
+
+def main():
+    key = current_pyramid_key()
+    if geohash_pyramid_key(pyramid_path) != key:
+        build_pyramid(key)
+
+    # projection, coastlines and continents are drawn once and reused
+    background = load_background()
+
+    # count and mean lon/lat per (geohash cell, category) at gh_prec
+    fig, ax, m = new_map(background)
+    draw_overlay(fig, ax, m, load_points(gh_prec),
+                 os.path.join(out_dir, f"map_plot_sizebubbles_geohash_bigger.png"),
+                 "AMR positive unique accessions by metagenome category")
+    plt.close(fig)
+
+    if map_grid:
+        render_map_grid(background, grid_variants(), draw_overlay)
 
 
 if __name__ == "__main__":
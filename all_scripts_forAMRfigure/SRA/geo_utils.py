@@ -0,0 +1,277 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------------------------
+# WKB POINT decoding
+# -------------------------------------------------------------------
+
+# byte offset of the two doubles for each WKB point variant
+#   21 bytes: 1 (endian) + 4 (type) + 8 (x) + 8 (y)
+#   25 bytes: same, with a 4-byte SRID after the type (EWKB, EPSG:4326)
+wkb_point_offsets = {21: 5, 25: 9}
+
+
+def _decode_points(hexvals, nbytes):
+    """Decode a list of equal-length hex strings into an (n, 2) float array."""
+    buf = np.frombuffer(bytes.fromhex("".join(hexvals)), dtype=np.uint8)
+    buf = buf.reshape(-1, nbytes)
+    start = wkb_point_offsets[nbytes]
+    coords = np.ascontiguousarray(buf[:, start:start + 16])
+
+    out = np.empty((len(buf), 2), dtype=np.float64)
+    little = buf[:, 0] == 1
+    out[little] = coords[little].view("<f8")
+    out[~little] = coords[~little].view(">f8")
+    return out
+
+
+def wkb_to_lonlat(hex_col):
+    """
+    Decode a column of WKB POINTs (hex) with or without SRID (EPSG:4326) → (lon, lat).
+
+    Vectorised version of the old per-row decoder: all rows of one variant
+    are joined into a single byte buffer and read with np.frombuffer.
+    Handles both:
+        • 25-byte variant 0101… (little endian) or 0001… (big endian) with SRID
+        • 21-byte variant without SRID
+    Rows that are missing, not hex, or too short come back as NaN.
+    """
+    s = pd.Series(hex_col).astype("string").str.strip()
+    lon = np.full(len(s), np.nan)
+    lat = np.full(len(s), np.nan)
+
+    valid = s.str.fullmatch(r"(?:[0-9A-Fa-f]{2})+").fillna(False).to_numpy(dtype=bool)
+    nbytes = (s.str.len().fillna(0).to_numpy() // 2)
+
+    srid = valid & (nbytes == 25)
+    plain = valid & (nbytes >= 21) & (nbytes != 25)   # longer junk is read as a plain point
+
+    for sel, size in ((srid, 25), (plain, 21)):
+        if not sel.any():
+            continue
+        hexvals = s[sel].str.slice(0, 2 * size).tolist()
+        xy = _decode_points(hexvals, size)
+        lon[sel] = xy[:, 0]
+        lat[sel] = xy[:, 1]
+
+    return lon, lat
+
+
+def add_lonlat(df, wkb_col="WTK"):
+    """Add numeric lon / lat columns decoded from the WKB column."""
+    df = df.copy()
+    df["lon"], df["lat"] = wkb_to_lonlat(df[wkb_col])
+    return df
+
+
+def lonlat_usecols(csv_path, usecols, wkb_col="WTK"):
+    """
+    Columns to read from a geolocated table.
+
+    Tables written after the geolocation merge already carry numeric
+    lon / lat, so the WKB column is only requested for older tables.
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns
+    if {"lon", "lat"} <= set(header):
+        return [c for c in usecols if c != wkb_col] + ["lon", "lat"]
+    return list(usecols)
+
+
+# -------------------------------------------------------------------
+# Integer geohash cells and the multi-resolution aggregate pyramid
+# -------------------------------------------------------------------
+
+geohash_base32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+pyramid_max_precision = 5
+
+
+def geohash_cells(lon, lat, precision=pyramid_max_precision):
+    """
+    Integer geohash cell for every point (5 bits per geohash character).
+
+    Longitude and latitude bits are interleaved starting with longitude,
+    same as the string geohash, so the cell at a coarser precision p is
+    just cell >> 5 * (precision - p).
+    """
+    nbits = 5 * precision
+    lon_bits = (nbits + 1) // 2
+    lat_bits = nbits // 2
+
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    xi = np.floor((lon + 180.0) / 360.0 * (1 << lon_bits))
+    yi = np.floor((lat + 90.0) / 180.0 * (1 << lat_bits))
+    xi = np.clip(xi, 0, (1 << lon_bits) - 1).astype(np.int64)
+    yi = np.clip(yi, 0, (1 << lat_bits) - 1).astype(np.int64)
+
+    cells = np.zeros(len(lon), dtype=np.int64)
+    for j in range(lon_bits):
+        cells |= ((xi >> (lon_bits - 1 - j)) & 1) << (nbits - 1 - 2 * j)
+    for j in range(lat_bits):
+        cells |= ((yi >> (lat_bits - 1 - j)) & 1) << (nbits - 2 - 2 * j)
+    return cells
+
+
+def geohash_to_str(cells, precision):
+    """Turn integer cells back into geohash strings (for labels / debugging)."""
+    cells = np.asarray(cells, dtype=np.int64)
+    chars = np.array(list(geohash_base32))
+    out = np.full(len(cells), "", dtype=object)
+    for k in range(precision):
+        out = out + chars[(cells >> (5 * (precision - 1 - k))) & 31]
+    return out
+
+
+def _aggregate_cells(key, n, sum_lon, sum_lat):
+    uniq, inv = np.unique(key, return_inverse=True)
+    return (uniq,
+            np.bincount(inv, weights=n),
+            np.bincount(inv, weights=sum_lon),
+            np.bincount(inv, weights=sum_lat))
+
+
+def build_geohash_pyramid(lon, lat, category, max_precision=pyramid_max_precision):
+    """
+    Count and mean lon/lat per (geohash cell, category) for precisions 1..max_precision.
+
+    The points are aggregated once at the finest precision; the coarser
+    levels are rolled up from those sums, not from the points.
+    Returns the category labels and {precision: dict of arrays}.
+    """
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    cat_codes, categories = pd.factorize(pd.Series(category), sort=True)
+    n_cat = max(len(categories), 1)
+
+    cells = geohash_cells(lon, lat, max_precision)
+    key, n, sum_lon, sum_lat = _aggregate_cells(
+        cells * n_cat + cat_codes, np.ones(len(lon)), lon, lat)
+
+    levels = {}
+    for p in range(max_precision, 0, -1):
+        if p < max_precision:
+            parent = (key // n_cat) >> 5       # one geohash character less
+            key, n, sum_lon, sum_lat = _aggregate_cells(
+                parent * n_cat + key % n_cat, n, sum_lon, sum_lat)
+        levels[p] = {
+            "cell": key // n_cat,
+            "cat":  (key % n_cat).astype(np.int16),
+            "n":    n.astype(np.int64),
+            "lon":  sum_lon / n,
+            "lat":  sum_lat / n,
+        }
+    return np.asarray(categories, dtype=str), levels
+
+
+def pyramid_key(csv_path, params, code_files=()):
+    """
+    Key of one pyramid build: the CSV (size and mtime), the build parameters
+    (columns, dtypes, kept categories, ...) and the code that reads and bins
+    it. This module is always part of it.
+    """
+    stamps = []
+    for f in [csv_path, __file__, *code_files]:
+        st = os.stat(f)
+        stamps.append((os.path.abspath(f), st.st_size, st.st_mtime_ns))
+    blob = repr((stamps, sorted(params.items())))
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+def geohash_pyramid_key(path):
+    """Key a pyramid was saved with, None when the file is missing or has none."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as z:
+        return str(z["key"]) if "key" in z.files else None
+
+
+def save_geohash_pyramid(path, categories, levels, key=""):
+    arrays = {"categories": categories, "key": np.asarray(key)}
+    for p, level in levels.items():
+        arrays.update({f"p{p}_{k}": v for k, v in level.items()})
+    np.savez_compressed(path, **arrays)
+
+
+def load_geohash_pyramid_level(path, precision):
+    """Read one precision level of a saved pyramid as a grouped table."""
+    with np.load(path) as z:          # npz members are only read when accessed
+        categories = z["categories"]
+        level = {k: z[f"p{precision}_{k}"] for k in ("cell", "cat", "n", "lon", "lat")}
+    return pd.DataFrame({
+        "geo":                 level["cell"],
+        "metagenome_category": categories[level["cat"]],
+        "lon":                 level["lon"],
+        "lat":                 level["lat"],
+        "n_samples":           level["n"],
+    })
+
+
+# -------------------------------------------------------------------
+# Biosample geolocation releases
+# -------------------------------------------------------------------
+
+# placeholder points that mean "no geolocation" in the biosample tables
+null_points = [
+    "0101000020E61000000AD7A3703D4A41C06666666666660CC0",
+    "0101000020E6100000EC51B81E85EB0FC052B81E85EB913140",
+]
+
+# columns a geolocation merge adds to the hit table
+geo_release_columns = ["lat_lon", "WTK", "biome", "lon", "lat"]
+
+
+def load_geo_release(csv_path):
+    """
+    Biosample-geographical-location release as a table indexed by sample_name.
+
+    Null points are dropped, one row is kept per biosample and the WKB
+    point is decoded to lon / lat. The result is cached next to the CSV
+    (*.indexed.pkl) and reused while it is newer than the CSV.
+    """
+    cache = os.path.splitext(csv_path)[0] + ".indexed.pkl"
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(csv_path):
+        return pd.read_pickle(cache)
+
+    wanted = {"accession", "lat_lon", "attribute_name", "biome"}
+    geo = (
+        pd.read_csv(csv_path, usecols=lambda c: c in wanted, dtype=str)
+          # discard the null geolocations
+          .loc[lambda d: ~d["lat_lon"].isin(null_points)]
+          # rename columns to better names and acc to match card table
+          .rename(columns={
+              "lat_lon"       : "WTK",
+              "attribute_name": "lat_lon",
+              "accession"     : "sample_name"
+          })
+          .reindex(columns=["sample_name", "lat_lon", "WTK", "biome"])
+    )
+
+    n_dup = geo["sample_name"].duplicated().sum()
+    if n_dup:
+        print(f"{csv_path}: {n_dup} duplicated biosamples, keeping the first row")
+    geo = geo.drop_duplicates(subset="sample_name").set_index("sample_name")
+
+    geo = add_lonlat(geo, "WTK")
+    geo.to_pickle(cache)
+    return geo
+
+
+def diff_geo_releases(old, new):
+    """
+    Compare two releases from load_geo_release, biosample by biosample.
+
+    Returns a Series indexed by sample_name with one of
+    "added", "removed", "moved" (different point) or "unchanged".
+    """
+    keys = old.index.union(new.index)
+    o = old["WTK"].reindex(keys)
+    n = new["WTK"].reindex(keys)
+    status = np.select(
+        [~keys.isin(old.index),
+         ~keys.isin(new.index),
+         o.fillna("").to_numpy() != n.fillna("").to_numpy()],
+        ["added", "removed", "moved"],
+        default="unchanged")
+    return pd.Series(status, index=keys, name="status")
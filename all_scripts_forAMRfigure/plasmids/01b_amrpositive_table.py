@@ -1,17 +1,31 @@
 import pandas as pd
+from contig_ids import encode_contigs, sorted_index, inner_merge
 
-csv_df = pd.read_csv("../data/plasmids_sra_metadata.csv", dtype=str)       # has column "seq_name"
-tsv_df = pd.read_csv("../data/argnorm_output.tsv", sep="\t", dtype=str)  # has column "Contig id"
+plasmid_csv = "../data/plasmids_sra_metadata.csv"    # has column "seq_name"
+argnorm_tsv = "../data/argnorm_output.tsv"           # has column "Contig id"
+out_csv     = "../data/amr_metadata_full.csv"
+chunk_rows  = 250_000                                # plasmid rows per chunk
+
+# The AMR table is the small side: it is loaded whole and indexed once by
+# integer contig id (contig_ids.py). The plasmid catalog is streamed
+# through that index in chunks and the matches are appended to out_csv,
+# so memory is bounded by the AMR table, not by the number of plasmids.
+tsv_df = pd.read_csv(argnorm_tsv, sep="\t", dtype=str)
 
 # Change column name so that they match
 tsv_df = tsv_df.rename(columns={"Contig id": "seq_name"})
+amr_index = sorted_index(encode_contigs(tsv_df["seq_name"]))
+
+n_rows = n_matched = 0
+chunks = pd.read_csv(plasmid_csv, dtype=str, chunksize=chunk_rows)
+for i, csv_df in enumerate(chunks):
+    # Inner join: keep only the AMR-positive plasmids, same rows and order as pd.merge
+    matched = inner_merge(csv_df, tsv_df, on="seq_name", index=amr_index)
+    matched.to_csv(out_csv, index=False, mode="w" if i == 0 else "a", header=i == 0)
 
-amr_metadata_full = pd.merge(
-    csv_df,              # left side: the big metadata table
-    tsv_df,              # right side: AMR table
-    on="seq_name",       # common key
-    how="inner"          # keep only the matches (AMR-positive)
-)
+    n_rows += len(csv_df)
+    n_matched += len(matched)
+    print(f"chunk {i + 1}: {len(csv_df):,} plasmid rows → {len(matched):,} AMR records "
+          f"({n_matched:,} of {n_rows:,} so far)")
 
-amr_metadata_full.to_csv("../data/amr_metadata_full.csv", index=False)
-print(f"✔ Wrote {len(amr_metadata_full):,} records with AMR details to amr_metadata_full.csv")
+print(f"✔ Wrote {n_matched:,} records with AMR details to amr_metadata_full.csv")
@@ -1,12 +1,17 @@
 import os
-import struct
-import binascii
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
-from mpl_toolkits.basemap import Basemap
-import geohash
+import geo_utils
+from geo_utils import (add_lonlat, lonlat_usecols, build_geohash_pyramid,
+                       save_geohash_pyramid, load_geohash_pyramid_level,
+                       pyramid_key, geohash_pyramid_key)
+import svg_output
+from svg_output import save_hybrid_svg
+from plot_cache import fingerprint, render_once
+import map_background
+from map_background import load_background, new_map
 
 # -------------------------------------------------------------------
 # CONFIGURATION
@@ -36,80 +41,62 @@ os.makedirs(out_dir, exist_ok=True)
 min_size = 30              # pt²
 scale    = 0.3            # additional pt² per extra sample
 
+# SVG: markers and map fills embedded as an image, text stays vector
+svg_raster_dpi = 300
+svg_compare    = False    # True: also time an all-vector SVG and print both sizes
+
 gh_prec = 2               # geohash precision (3 = ~150km, 4 = ~40km, 5 = ~5km)
+
+# aggregates for geohash precisions 1-5, rebuilt when csv_path, the build
+# parameters (keep, usecols, dtype) or the binning code change
+pyramid_path = os.path.join(
+    out_dir,
+    os.path.splitext(os.path.basename(csv_path))[0] + "_geohash_pyramid.npz")
 # -------------------------------------------------------------------
 
-## Functions
-
-# Translate WTK to lon/lat
-def wkb_to_lonlat(hexstr: str):
-    """
-    Decode a WKB POINT (hex) with or without SRID (EPSG:4326) → (lon, lat).
-
-    Handles both:
-        • 25-byte variant 0101… (little endian) or 0001… (big endian) with SRID
-        • 21-byte variant without SRID
-    Returns (np.nan, np.nan) if anything looks wrong.
-    """
-    try:
-        b = binascii.unhexlify(hexstr.strip())
-    except (binascii.Error, AttributeError):
-        return np.nan, np.nan
-
-    if len(b) < 21:         # too short to hold 2 doubles
-        return np.nan, np.nan
-
-    endian = "<" if b[0] == 1 else ">"
-    try:
-        if len(b) == 25:    # SRID header present
-            x = struct.unpack(endian + "d", b[9:17])[0]
-            y = struct.unpack(endian + "d", b[17:25])[0]
-        else:               # plain WKB point
-            x = struct.unpack(endian + "d", b[5:13])[0]
-            y = struct.unpack(endian + "d", b[13:21])[0]
-    except struct.error:
-        return np.nan, np.nan
-    return x, y
+def current_pyramid_key():
+    params = {"keep": sorted(keep), "usecols": usecols, "dtype": dtype}
+    return pyramid_key(csv_path, params, [__file__])
 
-def main():
-    df = pd.read_csv(csv_path, usecols=usecols, dtype=dtype, low_memory=False)
+
+def build_pyramid(key=""):
+    """Read, decode and bin the positive accessions once for all geohash precisions."""
+    df = pd.read_csv(csv_path, usecols=lonlat_usecols(csv_path, usecols),
+                     dtype=dtype, low_memory=False)
 
     df = df.drop_duplicates(subset="acc", keep="first")
 
     df = df[df["metagenome_category"].isin(keep)].copy()
 
-    lonlat = df["WTK"].apply(wkb_to_lonlat)
+    # lon/lat are stored by the geolocation merge; only older tables need decoding
+    if "lon" not in df.columns:
+        df = add_lonlat(df, "WTK")
 
-    # unpack the tuples into two numeric columns
-    df["lon"] = lonlat.apply(lambda t: t[0]).astype("float32")
-    df["lat"] = lonlat.apply(lambda t: t[1]).astype("float32") 
+    df["lon"] = df["lon"].astype("float32")
+    df["lat"] = df["lat"].astype("float32")
 
     # drop rows where decoding failed
     df = df.dropna(subset=["lon", "lat"])
 
-    # Geohash cells
-    df["geo"] = [geohash.encode(lat, lon, precision=gh_prec)
-                 for lat, lon in zip(df["lat"], df["lon"])]
+    categories, levels = build_geohash_pyramid(
+        df["lon"], df["lat"], df["metagenome_category"].astype(str))
+    save_geohash_pyramid(pyramid_path, categories, levels, key)
+
+
+def draw_map(out):
+    key = current_pyramid_key()
+    if geohash_pyramid_key(pyramid_path) != key:
+        build_pyramid(key)
 
-    grouped = (
-        df.groupby(["geo", "metagenome_category"], observed=True)
-          .agg(lon=("lon", "mean"),
-               lat=("lat", "mean"),
-               n_samples=("acc", "size"))
-          .reset_index()
-    )
+    # count and mean lon/lat per (geohash cell, category) at gh_prec
+    grouped = load_geohash_pyramid_level(pyramid_path, gh_prec)
 
     # use the cell centre as the plotting coordinate
     grouped["size"] = min_size + grouped["n_samples"] * scale
     grouped["colour"] = grouped["metagenome_category"].map(base_col)
 
-    fig, ax = plt.subplots(figsize=(13, 7))
-    m = Basemap(projection="moll", lon_0=0, resolution="c")
-    m.drawcoastlines(linewidth=0.4)
-    m.fillcontinents(color="#ededed", lake_color="white")
-    #m.drawparallels(np.arange(-90, 91, 30))
-    #m.drawmeridians(np.arange(0, 361, 60))
-    m.drawmapboundary(fill_color="white")
+    # projection, coastlines and continents come from the background cache
+    fig, ax, m = new_map(load_background())
 
     for cat in base_col:
         sub = grouped[grouped["metagenome_category"] == cat]
@@ -167,9 +154,21 @@ def main():
     ax.add_artist(leg_size)
 
     plt.title("AMR positive unique accessions by metagenome category")
-    out = os.path.join(out_dir, f"map_plot_sizebubbles_geohash_bigger.png")
     fig.savefig(out, dpi=600)
-    fig.savefig(out.replace(".png", ".svg"))
+    save_hybrid_svg(fig, out.replace(".png", ".svg"),
+                    raster_dpi=svg_raster_dpi, compare=svg_compare)
+
+
+def main():
+    # redrawn only when the table, this script, the helpers that bin, draw
+    # and save it, or a map parameter change
+    out = os.path.join(out_dir, f"map_plot_sizebubbles_geohash_bigger.png")
+    key = fingerprint([csv_path, __file__, geo_utils.__file__,
+                       map_background.__file__, svg_output.__file__],
+                      {"gh_prec": gh_prec, "min_size": min_size,
+                       "scale": scale, "base_col": base_col,
+                       "svg_raster_dpi": svg_raster_dpi})
+    render_once([out, out.replace(".png", ".svg")], key, lambda: draw_map(out))
 
 
 if __name__ == "__main__":
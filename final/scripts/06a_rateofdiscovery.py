@@ -1,6 +1,7 @@
-import pandas as pd
 import matplotlib.pyplot as plt
-from collections import defaultdict
+import accession_table
+from accession_table import load_accession_table, discovery_counts
+from plot_cache import cached_data, fingerprint, render_once
 '''
 # Function to prepare tables to have date as year bins
 def date_collection(df: pd.DataFrame) -> pd.DataFrame:
@@ -28,119 +29,68 @@ def date_collection(df: pd.DataFrame) -> pd.DataFrame:
     )
     return df
 '''
-# Thirds of year instead
-def date_collection(df):
-    df = df.copy()
-    df['releasedate'] = pd.to_datetime(
-        df['releasedate'].str.strip('[]'), errors='coerce'
-    )
-    df = df.dropna(subset=['releasedate'])
-
-    def assign_third(month):
-        if 1 <= month <= 4:
-            return 'T1'
-        elif 5 <= month <= 8:
-            return 'T2'
-        else:
-            return 'T3'
-
-    df['year'] = df['releasedate'].dt.year
-    df['third'] = df['releasedate'].dt.month.apply(assign_third)
-    df['third_bin'] = df['year'].astype(str) + '-' + df['third']
-    return df
-
 # --------------------------------------------------------------------
 # 0 PROCESSING DATA
 # --------------------------------------------------------------------
 
-# collect accessions, one to collapse only on quarter, and another also on sample type
-seen = defaultdict(set)
-totals = defaultdict(set)
-
-# Input table
-for chunk in pd.read_csv(
-    "../data/card_metadata_aro_extended.csv",
-    chunksize=3000000,
-    low_memory=False
-    ):
-
-#    chunk = chunk[chunk["collection_date_sam"].notna()]
-#   chunk = chunk[chunk["metagenome_category"].notna()]
-    chunk = chunk[chunk["releasedate"].notna()]
-    chunk = date_collection(chunk)
-
-#    grouped = (
-#        chunk.groupby(["quarter_bin", "metagenome_category"])["acc"]
-#              .apply(set)
-#   )   
-
- #   grouped = (
- #       chunk.groupby(["quarter_bin", "organism_type"])["acc"]
- #             .apply(set)
- #   )
-
-    grouped = (
-    chunk.groupby(["third_bin"])["acc"]
-          .apply(set)
-    )
+# One row per accession (release / collection day, organism type,
+# metagenome category, continent), built by streaming the hit table once
+# and cached next to it. The counts per bin are cached too (plot_cache.py),
+# keyed by the CSV, this script, accession_table.py and the binning, so unchanged reruns do not even load
+# the accession table.
+hits_csv = "../data/card_metadata_aro_extended.csv"
+
+# Thirds of year instead of quarters (Jan-Apr, May-Aug, Sep-Dec), by release date
+timeline_params = {"date": "release_day", "freq": "T"}
+code_inputs = [__file__, accession_table.__file__]
 
-    for key, acc_set in grouped.items():
-        seen[key].update(acc_set)
+per_third = cached_data(
+    "discovery_per_third", [hits_csv] + code_inputs, timeline_params,
+    lambda: discovery_counts(load_accession_table(hits_csv), **timeline_params))
 
 # --------------------------------------------------------------------
 # 1 PLOT DISCOVERY TIMELINE OF AMRs ON ALL SAMPLES
 # --------------------------------------------------------------------
 
-# seen keys are (quarter_bin, sample_type).  Collapse on quarter only
-totals = defaultdict(set)
-
-for (q, _type), accs in seen.items():
-    totals[q].update(accs)          # merge sets so accessions stay unique
-
-per_quarter = (
-    pd.Series({q: len(accs) for q, accs in totals.items()}, name="unique_accessions")
-      .sort_index()
-)
-
-fig, ax = plt.subplots(figsize=(12, 4))
-per_quarter.plot.bar(ax=ax, width=0.9, color="#e9c46a")
-
-ax.set_title("Discovery timeline of AMR-positive total samples")
-ax.set_xlabel("")
-ax.set_ylabel("# SRA accessions AMR-positive")
-
-# 2. Identify even-year T1 bins (for regular ticks)
-even_year_pos = [
-    i for i, b in enumerate(totals.index)
-    if b.endswith('T1') and int(b.split('-')[0]) % 2 == 0
-]
-even_year_labs = [
-    b.split('-')[0] for b in totals.index
-    if b.endswith('T1') and int(b.split('-')[0]) % 2 == 0
-]
-
-# 3. Force add first and last bin labels
-first_pos = 0
-first_lab = totals.index[0].split('-')[0]
-
-last_pos = len(totals.index) - 1
-last_lab = totals.index[-1].split('-')[0]
-
-# Add them if they’re not already included
-tick_positions = sorted(set(even_year_pos + [first_pos, last_pos]))
-tick_labels = []
-for i in tick_positions:
-    year = totals.index[i].split('-')[0]
-    tick_labels.append(year)
-
-# 4. Apply ticks
-ax.set_xticks(tick_positions)
-ax.set_xticklabels(tick_labels, rotation=0)
-
-plt.tight_layout()
-fig.savefig("../data/discovery_timeline_amr_total_yellow_releasedate.png", dpi=600)
-fig.savefig("../data/discovery_timeline_amr_total_yellow_releasedate.svg")
-plt.close()
+timeline_png = "../data/discovery_timeline_amr_total_yellow_releasedate.png"
+
+def draw_timeline():
+    fig, ax = plt.subplots(figsize=(12, 4))
+    per_third.plot.bar(ax=ax, width=0.9, color="#e9c46a")
+
+    ax.set_title("Discovery timeline of AMR-positive total samples")
+    ax.set_xlabel("")
+    ax.set_ylabel("# SRA accessions AMR-positive")
+
+    # 2. Identify even-year T1 bins (for regular ticks)
+    even_year_pos = [
+        i for i, b in enumerate(per_third.index)
+        if b.endswith('T1') and int(b.split('-')[0]) % 2 == 0
+    ]
+
+    # 3. Force add first and last bin labels
+    first_pos = 0
+    last_pos = len(per_third.index) - 1
+
+    # Add them if they’re not already included
+    tick_positions = sorted(set(even_year_pos + [first_pos, last_pos]))
+    tick_labels = []
+    for i in tick_positions:
+        year = per_third.index[i].split('-')[0]
+        tick_labels.append(year)
+
+    # 4. Apply ticks
+    ax.set_xticks(tick_positions)
+    ax.set_xticklabels(tick_labels, rotation=0)
+
+    plt.tight_layout()
+    fig.savefig(timeline_png, dpi=600)
+    fig.savefig(timeline_png.replace(".png", ".svg"))
+    plt.close()
+
+# redrawn only when the table, this script or the binning change
+render_once([timeline_png, timeline_png.replace(".png", ".svg")],
+            fingerprint([hits_csv] + code_inputs, timeline_params), draw_timeline)
 '''
 # --------------------------------------------------------------------
 # 1 SAME, BUT COLOR STACK BARS BY ORGANISM CATEGORY (METAGENOME OR ISOLATE)
@@ -0,0 +1,194 @@
+import os
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------------------------
+# One row per accession
+# -------------------------------------------------------------------
+# Every discovery timeline counts distinct accessions per date bin, and
+# every accession has a single release date, collection date, organism
+# type, metagenome category and continent. So the hit tables are reduced
+# once to one row per accession (dates as integer days since 1970-01-01,
+# labels as categoricals). After that any binning or stratification is a
+# single bincount over that small table.
+
+no_day = np.iinfo(np.int32).min      # missing date
+
+table_columns = {
+    "acc":                                 "acc",
+    "releasedate":                         "release_day",
+    "collection_date_sam":                 "collection_day",
+    "organism_type":                       "organism_type",
+    "organism":                            "organism",
+    "metagenome_category":                 "metagenome_category",
+    "geo_loc_name_country_continent_calc": "continent",
+    "bioproject":                          "bioproject",
+    "mbases":                              "mbases",
+}
+
+date_columns = {"releasedate": "release_day", "collection_date_sam": "collection_day"}
+label_columns = ["organism_type", "metagenome_category", "continent", "bioproject"]
+
+
+def to_days(col):
+    """Date strings (optionally in [brackets]) → int32 days since 1970-01-01, no_day if missing."""
+    # a chunk has far fewer distinct dates than rows: parse each one once
+    codes, uniques = pd.factorize(pd.Series(col, dtype=object))
+    d = pd.to_datetime(pd.Series(uniques, dtype="string").str.strip("[]"),
+                       errors="coerce", utc=True, format="mixed")
+    days = d.dt.tz_localize(None).to_numpy().astype("datetime64[D]").astype(np.int64)
+    days[d.isna().to_numpy()] = no_day
+    days = np.append(days, no_day).astype(np.int32)     # code -1 (NaN) → no_day
+    return days[codes]
+
+
+def earliest_days(days):
+    """Earliest non-missing day per index value (no_day if all are missing)."""
+    top = np.iinfo(np.int32).max
+    return (days.replace(no_day, top).groupby(level=0).min()
+                .replace(top, no_day).astype(np.int32))
+
+
+def build_accession_table(csv_path, chunk_size=3_000_000):
+    """
+    Stream a hit table and keep one row per accession.
+
+    Only the columns from table_columns that the file has are read. The
+    release and collection days are the earliest seen for the accession;
+    labels come from its first row. organism_type is derived from the
+    organism name (Metagenome / Isolate) when the file has no such column.
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns
+    usecols = [c for c in table_columns if c in header]
+
+    parts = []
+    reader = pd.read_csv(csv_path, usecols=usecols, dtype=str,
+                         chunksize=chunk_size, low_memory=False)
+    for i, chunk in enumerate(reader):
+        chunk = chunk.dropna(subset=["acc"])
+        for src, dst in date_columns.items():
+            if src in chunk:
+                chunk[src] = to_days(chunk[src])
+        # earliest dates per accession, then the first row for the labels
+        dates = [c for c in date_columns if c in chunk]
+        first = chunk.drop_duplicates(subset="acc").set_index("acc")
+        if dates:
+            first[dates] = earliest_days(chunk.set_index("acc")[dates]).reindex(first.index)
+        parts.append(first)
+        print(f"{csv_path}: chunk {i+1}, {len(chunk)} rows, {len(first)} accessions")
+
+    table = pd.concat(parts)
+    if table.index.has_duplicates:
+        dates = [c for c in date_columns if c in table]
+        merged = table[~table.index.duplicated()].copy()
+        if dates:
+            merged[dates] = earliest_days(table[dates]).reindex(merged.index)
+        table = merged
+
+    table = table.rename(columns=table_columns).rename_axis("acc").reset_index()
+    if "organism_type" not in table and "organism" in table:
+        is_meta = table["organism"].str.contains("metagenome", case=False, na=False)
+        table["organism_type"] = np.where(is_meta, "Metagenome", "Isolate")
+    table = table.drop(columns="organism", errors="ignore")
+
+    for c in date_columns.values():
+        if c in table:
+            table[c] = table[c].astype(np.int32)
+    for c in label_columns:
+        if c in table:
+            table[c] = table[c].astype("category")
+    if "mbases" in table:
+        table["mbases"] = pd.to_numeric(table["mbases"], errors="coerce").astype(np.float32)
+    return table
+
+
+def load_accession_table(csv_path, cache_path=None, chunk_size=3_000_000):
+    """
+    Per-accession table for csv_path, cached as *.accessions.pkl next to it.
+
+    The cache is rebuilt when it is missing or older than the CSV.
+    """
+    if cache_path is None:
+        cache_path = os.path.splitext(csv_path)[0] + ".accessions.pkl"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+        return pd.read_pickle(cache_path)
+    table = build_accession_table(csv_path, chunk_size)
+    table.to_pickle(cache_path)
+    return table
+
+
+# -------------------------------------------------------------------
+# Date bins and discovery counts
+# -------------------------------------------------------------------
+
+def day_bins(days, freq="Q"):
+    """
+    Integer bin for every day: "Y" year, "Q" quarter, "T" thirds (Jan-Apr, May-Aug, Sep-Dec),
+    "M" month, or an int n for n-day bins counted from 1970-01-01.
+
+    Bins are consecutive integers, so neighbouring periods differ by 1.
+    """
+    d = np.asarray(days, dtype="datetime64[D]")
+    if isinstance(freq, (int, np.integer)):
+        return d.astype(np.int64) // int(freq)
+    year = d.astype("datetime64[Y]").astype(np.int64) + 1970
+    month0 = d.astype("datetime64[M]").astype(np.int64) % 12
+    if freq == "Y":
+        return year
+    if freq == "Q":
+        return year * 4 + month0 // 3
+    if freq == "T":
+        return year * 3 + month0 // 4
+    if freq == "M":
+        return year * 12 + month0
+    raise ValueError(f"unknown freq {freq!r}, use 'Y', 'Q', 'T', 'M' or a number of days")
+
+
+def bin_labels(bins, freq="Q"):
+    """Index for day_bins values: years, quarter / month periods, '2010-T1' strings or bin start dates."""
+    bins = np.asarray(bins, dtype=np.int64)
+    if isinstance(freq, (int, np.integer)):
+        return pd.DatetimeIndex((bins * int(freq)).astype("datetime64[D]"), name="bin_start")
+    if freq == "Y":
+        return pd.Index(bins, name="year")
+    if freq == "Q":
+        return pd.PeriodIndex.from_ordinals(bins - 1970 * 4, freq="Q").rename("quarter_bin")
+    if freq == "T":
+        return pd.Index([f"{b // 3}-T{b % 3 + 1}" for b in bins], name="third_bin")
+    if freq == "M":
+        return pd.PeriodIndex.from_ordinals(bins - 1970 * 12, freq="M").rename("month_bin")
+    raise ValueError(f"unknown freq {freq!r}, use 'Y', 'Q', 'T', 'M' or a number of days")
+
+
+def discovery_counts(table, date="release_day", freq="Q", by=None):
+    """
+    Accessions per date bin, optionally split by a label column.
+
+    Accessions without the date (or without the label) are left out.
+    Only bins with at least one accession are returned, in order.
+    Returns a Series, or a bins × labels DataFrame when `by` is given.
+    """
+    days = table[date].to_numpy()
+    ok = days != no_day
+    if by is not None:
+        col = table[by].astype("category")
+        codes, labels = col.cat.codes.to_numpy(), col.cat.categories
+        ok &= codes >= 0
+    bins = day_bins(days[ok], freq)
+    lo = bins.min() if len(bins) else 0
+    rel = bins - lo
+
+    if by is None:
+        counts = np.bincount(rel)
+        keep = np.flatnonzero(counts)
+        return pd.Series(counts[keep], index=bin_labels(keep + lo, freq),
+                         name="unique_accessions")
+
+    n_lab = len(labels)
+    counts = np.bincount(rel * n_lab + codes[ok],
+                         minlength=(rel.max() + 1 if len(rel) else 0) * n_lab)
+    counts = counts.reshape(-1, n_lab)
+    keep = np.flatnonzero(counts.sum(axis=1))
+    used = counts.sum(axis=0) > 0          # labels without any dated accession are dropped
+    return pd.DataFrame(counts[keep][:, used], index=bin_labels(keep + lo, freq),
+                        columns=pd.Index(labels[used], name=by))
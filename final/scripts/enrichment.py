@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------
+# Balanced-subsampling log₂ enrichment
+# -------------------------------------------------
+# Drawing n_per_cat accessions without replacement from a category with
+# `total` accessions, of which `positives` are AMR-positive, gives a
+# hypergeometric number of positives. So every balanced replicate can be
+# drawn straight from the counts, without building or sampling any sets.
+
+
+def category_counts(df_total, df_amr, cat_col, id_col, cats):
+    """
+    Distinct ids per category in the total table, and how many of them are AMR-positive.
+
+    Positives are counted on the (category, id) pairs present in both
+    tables, same as intersecting the AMR set with the total set.
+    Categories without any total ids are dropped.
+    """
+    total_pairs = df_total.loc[df_total[cat_col].isin(cats), [cat_col, id_col]].drop_duplicates()
+    amr_pairs   = df_amr.loc[df_amr[cat_col].isin(cats), [cat_col, id_col]].drop_duplicates()
+
+    totals    = total_pairs.groupby(cat_col).size().reindex(cats, fill_value=0)
+    positives = (amr_pairs.merge(total_pairs, on=[cat_col, id_col])
+                          .groupby(cat_col).size()
+                          .reindex(cats, fill_value=0))
+
+    keep = totals > 0
+    return positives[keep], totals[keep]
+
+
+def balanced_enrichment(positives, totals, rng, n_boot=10_000, ci=95):
+    """
+    log₂ enrichment of AMR-positives per category after balancing sample sizes.
+
+    Every category is subsampled to the smallest category size. The point
+    estimate is one seeded replicate, as in the original set-based
+    scripts; the percentile CI comes from n_boot replicates drawn
+    at once as an (n_boot × categories) hypergeometric matrix.
+
+    Returns a table indexed by category with the counts, `enrichment`
+    and `ci_low` / `ci_high`.
+    """
+    positives = positives.astype(np.int64)
+    totals    = totals.reindex(positives.index).astype(np.int64)
+    n_per_cat = int(totals.min())
+    ngood = positives.to_numpy()
+    nbad  = (totals - positives).to_numpy()
+
+    def log2_enrichment(amrs):
+        # (amrs / n_per_cat) / (sum(amrs) / (n_per_cat * k))
+        density_overall = amrs.sum(axis=-1, keepdims=True) / amrs.shape[-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.log2(amrs / density_overall)
+
+    point = rng.hypergeometric(ngood, nbad, n_per_cat)
+    boot  = rng.hypergeometric(ngood, nbad, n_per_cat, size=(n_boot, len(ngood)))
+
+    alpha = (100 - ci) / 2
+    boot_enr = log2_enrichment(boot)
+    return pd.DataFrame({
+        "positives":   positives,
+        "total":       totals,
+        "n_per_cat":   n_per_cat,
+        "amr_sampled": point,
+        "enrichment":  log2_enrichment(point),
+        "ci_low":      np.nanpercentile(boot_enr, alpha, axis=0),
+        "ci_high":     np.nanpercentile(boot_enr, 100 - alpha, axis=0),
+    }, index=positives.index)
+
+
+def enrichment_xerr(res):
+    """Asymmetric error bars (2 × n) for a barh plot of an enrichment table."""
+    return np.vstack([res["enrichment"] - res["ci_low"],
+                      res["ci_high"] - res["enrichment"]]).clip(min=0)
+
+
+# -------------------------------------------------
+# Balanced bootstrap of per-accession counts
+# -------------------------------------------------
+# The mean of n_per_cat accessions drawn without replacement only depends
+# on how many of them carry each count value, which is a multivariate
+# hypergeometric draw on the category's value histogram. One call gives
+# a whole (replicates × distinct values) matrix; the replicate sums are a
+# matrix product with the values.
+
+boot_chunk_size = 1_000         # replicates per task, also fixes the RNG streams
+parallel_min_boot = 10_000      # below this the chunks run in-process
+
+
+def _boot_means_chunk(args):
+    histograms, n_per_cat, n_boot, seed = args
+    rng = np.random.default_rng(seed)
+    means = np.empty((n_boot, len(histograms)))
+    for j, (values, colors) in enumerate(histograms):
+        draws = rng.multivariate_hypergeometric(colors, n_per_cat, size=n_boot)
+        means[:, j] = draws @ values / n_per_cat
+    return means
+
+
+def balanced_boot_means(values_by_cat, n_boot=10_000, seed=42, n_workers=None):
+    """
+    Means of balanced subsamples, one column per category and one row per replicate.
+
+    values_by_cat maps category → per-accession values; every category is
+    subsampled (without replacement) to the size of the smallest one.
+    Replicates are drawn in chunks of boot_chunk_size with their own
+    seed, so the result does not depend on the number of workers.
+    """
+    cats = list(values_by_cat)
+    n_per_cat = min(len(v) for v in values_by_cat.values())
+    histograms = []
+    for c in cats:
+        values, colors = np.unique(np.asarray(values_by_cat[c]), return_counts=True)
+        histograms.append((values.astype(np.float64), colors.astype(np.int64)))
+
+    sizes = [min(boot_chunk_size, n_boot - i) for i in range(0, n_boot, boot_chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(histograms, n_per_cat, n, s) for n, s in zip(sizes, seeds)]
+
+    if n_boot >= parallel_min_boot and n_workers != 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            chunks = list(pool.map(_boot_means_chunk, tasks))
+    else:
+        chunks = [_boot_means_chunk(t) for t in tasks]
+
+    return pd.DataFrame(np.vstack(chunks), columns=cats), n_per_cat
+
+
+def mean_enrichment(values_by_cat, n_boot=10_000, seed=42, ci=95, n_workers=None):
+    """
+    log₂ enrichment of each category's balanced mean vs. the average over categories.
+
+    The point estimate is the mean over replicates, as in the original
+    100-replicate loop. CIs are percentile intervals of the per-replicate
+    enrichment, and p_value is the two-sided bootstrap p-value for an
+    enrichment of 0.
+    """
+    boot, n_per_cat = balanced_boot_means(values_by_cat, n_boot, seed, n_workers)
+
+    mean_per_cat = boot.mean()
+    enrichment = np.log2(mean_per_cat / mean_per_cat.mean())
+    boot_enr = np.log2(boot.div(boot.mean(axis=1), axis=0))
+
+    alpha = (100 - ci) / 2
+    n_le = (boot_enr <= 0).sum()
+    n_ge = (boot_enr >= 0).sum()
+    p_value = np.minimum(1.0, 2 * (np.minimum(n_le, n_ge) + 1) / (n_boot + 1))
+
+    return pd.DataFrame({
+        "accessions": pd.Series({c: len(v) for c, v in values_by_cat.items()}),
+        "n_per_cat":  n_per_cat,
+        "mean":       mean_per_cat,
+        "enrichment": enrichment,
+        "ci_low":     boot_enr.quantile(alpha / 100),
+        "ci_high":    boot_enr.quantile(1 - alpha / 100),
+        "p_value":    p_value,
+    })
@@ -0,0 +1,96 @@
+import os
+import time
+import pickle
+import hashlib
+import matplotlib
+import matplotlib.pyplot as plt
+
+# -------------------------------------------------------------------
+# Cached Basemap backgrounds
+# -------------------------------------------------------------------
+# Building the Basemap projection and drawing coastlines, continents and
+# the map boundary is the same work for every map, whatever the overlay.
+# It is done once per set of background parameters: the figure, its axes
+# and the Basemap instance are pickled together (the coastline and land
+# path collections go with the figure) under ../data/map_plots, and every
+# map afterwards starts from an unpickled copy. render_map_grid draws a
+# whole list of overlay variants on fresh copies of one background.
+
+map_cache_dir = "../data/map_plots/background_cache"
+
+background_defaults = {
+    "figsize":     (13, 7),
+    "projection":  "moll",
+    "lon_0":       0,
+    "resolution":  "c",
+    "land_color":  "#ededed",
+    "lake_color":  "white",
+    "ocean_color": "white",
+    "coast_width": 0.4,
+}
+
+
+def _draw_background(figsize, projection, lon_0, resolution,
+                     land_color, lake_color, ocean_color, coast_width):
+    from mpl_toolkits.basemap import Basemap
+    fig, ax = plt.subplots(figsize=figsize)
+    m = Basemap(projection=projection, lon_0=lon_0, resolution=resolution, ax=ax)
+    m.drawcoastlines(linewidth=coast_width)
+    m.fillcontinents(color=land_color, lake_color=lake_color)
+    m.drawmapboundary(fill_color=ocean_color)
+    return fig, ax, m
+
+
+def _background_key(params):
+    # pickled figures are only readable by the same matplotlib / basemap
+    from mpl_toolkits import basemap
+    blob = repr((sorted(params.items()), matplotlib.__version__, basemap.__version__))
+    return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+
+def load_background(cache_dir=map_cache_dir, **params):
+    """
+    Pickled (fig, ax, m) background for the given parameters (see background_defaults).
+
+    Read from cache_dir when it was built before, otherwise drawn and
+    written there. Pass the result to new_map for every map to draw.
+    """
+    params = {**background_defaults, **params}
+    path = os.path.join(cache_dir, f"background-{_background_key(params)}.pkl")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    t0 = time.perf_counter()
+    fig, ax, m = _draw_background(**params)
+    blob = pickle.dumps((fig, ax, m), protocol=pickle.HIGHEST_PROTOCOL)
+    plt.close(fig)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(blob)
+    print(f"map background drawn in {time.perf_counter() - t0:.2f} s, cached in {path}")
+    return blob
+
+
+def new_map(background):
+    """Fresh (fig, ax, m) copy of a background from load_background."""
+    return pickle.loads(background)
+
+
+def render_map_grid(background, variants, draw):
+    """
+    Draw every variant on its own copy of one background.
+
+    variants is a list of keyword dicts; draw(fig, ax, m, **variant)
+    adds the overlay and saves the figure. Returns the seconds per variant.
+    """
+    seconds = []
+    t_all = time.perf_counter()
+    for variant in variants:
+        t0 = time.perf_counter()
+        fig, ax, m = new_map(background)
+        draw(fig, ax, m, **variant)
+        plt.close(fig)
+        seconds.append(time.perf_counter() - t0)
+    print(f"rendered {len(variants)} maps in {time.perf_counter() - t_all:.1f} s")
+    return seconds
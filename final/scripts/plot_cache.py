@@ -0,0 +1,103 @@
+import os
+import json
+import pickle
+import hashlib
+
+# -------------------------------------------------------------------
+# Plot cache: aggregated data and figures keyed by their inputs
+# -------------------------------------------------------------------
+# A key is the hash of the input files' fingerprints plus the plot
+# parameters (precision, date window, category lists, ...). Aggregated
+# plotting data is pickled under its key, and a figure is redrawn only
+# when the key stored for its output files changes. Scripts list their
+# own __file__ and the helper modules that do the aggregation among the
+# inputs, so editing a CSV, that code or a parameter gives a new key and
+# there is nothing to invalidate by hand. Other files are not tracked.
+
+plot_cache_dir = "../data/plot_cache"
+sample_bytes = 1 << 20                   # per sampled block in mode="sample"
+
+
+def file_fingerprint(path, mode="stat"):
+    """
+    Fingerprint of one input file.
+
+    mode="stat": size and modification time (cheap, the default).
+    mode="sample": size plus a hash of the first, middle and last MiB,
+    for files that get copied around with new mtimes.
+    """
+    st = os.stat(path)
+    if mode == "stat":
+        return f"{st.st_size}:{st.st_mtime_ns}"
+    if mode != "sample":
+        raise ValueError(f"unknown mode {mode!r}, use 'stat' or 'sample'")
+    h = hashlib.sha1(str(st.st_size).encode())
+    with open(path, "rb") as f:
+        for offset in sorted({0, max(st.st_size // 2 - sample_bytes // 2, 0),
+                              max(st.st_size - sample_bytes, 0)}):
+            f.seek(offset)
+            h.update(f.read(sample_bytes))
+    return f"{st.st_size}:{h.hexdigest()}"
+
+
+def fingerprint(inputs, params=None, mode="stat"):
+    """Key for a list of input files and a dict of parameters (values must have a stable repr)."""
+    parts = [(os.path.abspath(p), file_fingerprint(p, mode)) for p in inputs]
+    blob = repr((parts, sorted((params or {}).items())))
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+def cached_data(name, inputs, params, build, mode="stat", cache_dir=plot_cache_dir):
+    """
+    build() once per key, then load its result from cache_dir.
+
+    Entries are named <name>-<key>.pkl; older entries of the same name
+    are removed when a new one is written.
+    """
+    key = fingerprint(inputs, params, mode)
+    path = os.path.join(cache_dir, f"{name}-{key[:16]}.pkl")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    data = build()
+    os.makedirs(cache_dir, exist_ok=True)
+    for old in os.listdir(cache_dir):
+        if old.startswith(f"{name}-") and old.endswith(".pkl"):
+            os.remove(os.path.join(cache_dir, old))
+    with open(path, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return data
+
+
+def _stamps_path(cache_dir):
+    return os.path.join(cache_dir, "figures.json")
+
+
+def _read_stamps(cache_dir):
+    try:
+        with open(_stamps_path(cache_dir)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def render_once(outputs, key, draw, cache_dir=plot_cache_dir):
+    """
+    Call draw() (which saves `outputs`) unless all outputs exist and were drawn with `key`.
+
+    Returns True when the figure was drawn, False when it was skipped.
+    """
+    stamps = _read_stamps(cache_dir)
+    paths = [os.path.abspath(p) for p in outputs]
+    if all(os.path.exists(p) and stamps.get(p) == key for p in paths):
+        print("unchanged, skipped:", ", ".join(os.path.basename(p) for p in outputs))
+        return False
+
+    draw()
+    stamps = _read_stamps(cache_dir)          # re-read: draw() may take a while
+    stamps.update({p: key for p in paths})
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(_stamps_path(cache_dir), "w") as f:
+        json.dump(stamps, f, indent=1, sort_keys=True)
+    return True
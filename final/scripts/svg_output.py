@@ -0,0 +1,92 @@
+import os
+import time
+import tempfile
+from matplotlib.collections import Collection
+from matplotlib.lines import Line2D
+from matplotlib.patches import Patch
+from matplotlib.spines import Spine
+from matplotlib.text import Text
+from matplotlib.axis import Axis
+from matplotlib.legend import Legend
+
+# -------------------------------------------------------------------
+# Hybrid SVG output
+# -------------------------------------------------------------------
+# Maps and faceted bubble plots hold thousands of markers and long
+# coastline / LOWESS paths. Written as vector paths they make SVGs that
+# are slow to save and slower to open. Here the dense layers (large scatter
+# and line collections, detailed map fills, long lines) are embedded as
+# images at raster_dpi, while text, ticks, spines, legends and small
+# layers stay vector, so the SVG can still be edited for labels and
+# layout. An embedded image costs a few hundred kB per axes, so layers
+# below the size thresholds are cheaper as vectors.
+
+svg_raster_dpi = 300
+min_line_points = 50        # shorter lines (trend segments, ticks) stay vector
+min_collection_points = 5000    # smaller collections and patches (markers / path vertices) stay vector
+vector_types = (Spine, Text, Axis, Legend)      # never rasterized
+
+
+def _is_dense(artist):
+    if isinstance(artist, vector_types):            # Spine is a Patch too
+        return False
+    if isinstance(artist, Collection):              # markers, coastlines, fills
+        n_vertices = sum(len(p.vertices) for p in artist.get_paths())
+        return max(len(artist.get_offsets()), n_vertices) >= min_collection_points
+    if isinstance(artist, Patch):                   # detailed map fills
+        return len(artist.get_path().vertices) >= min_collection_points
+    if isinstance(artist, Line2D):
+        return len(artist.get_xdata()) >= min_line_points
+    return False
+
+
+def rasterize_dense(fig):
+    """Mark the dense data artists of every axes as rasterized; returns how many."""
+    n = 0
+    for ax in fig.axes:
+        frame = {id(ax.patch)} | {id(s) for s in ax.spines.values()}
+        for artist in ax.get_children():
+            if id(artist) not in frame and _is_dense(artist):
+                artist.set_rasterized(True)
+                n += 1
+    check_vector(fig)
+    return n
+
+
+def check_vector(fig):
+    """Raise if any spine, text, axis or legend of fig is marked rasterized."""
+    raster = [a for a in fig.findobj(lambda a: isinstance(a, vector_types))
+              if a.get_rasterized()]
+    if raster:
+        raise ValueError(f"{len(raster)} text / axis artists marked rasterized, "
+                         f"e.g. {raster[0]!r}; they must stay vector")
+
+
+def _timed_save(fig, path, **kwargs):
+    t0 = time.perf_counter()
+    fig.savefig(path, format="svg", **kwargs)
+    return time.perf_counter() - t0, os.path.getsize(path)
+
+
+def save_hybrid_svg(fig, path, raster_dpi=svg_raster_dpi, compare=False, **kwargs):
+    """
+    Save fig as an SVG with its dense layers rasterized at raster_dpi.
+
+    fig may be a Figure or a seaborn grid (anything with .figure or
+    .savefig). With compare=True the all-vector SVG is written to a
+    temporary file first and both sizes and save times are printed.
+    Extra keyword arguments go to savefig (e.g. bbox_inches).
+    """
+    figure = getattr(fig, "figure", fig)
+    if compare:
+        with tempfile.TemporaryDirectory() as tmp:
+            vec_s, vec_b = _timed_save(figure, os.path.join(tmp, "vector.svg"), **kwargs)
+    n = rasterize_dense(figure)
+    hyb_s, hyb_b = _timed_save(figure, path, dpi=raster_dpi, **kwargs)
+
+    msg = (f"{os.path.basename(path)}: {n} layers rasterized at {raster_dpi} dpi, "
+           f"{hyb_b / 1e6:.2f} MB in {hyb_s:.2f} s")
+    if compare:
+        msg += f" (all vector: {vec_b / 1e6:.2f} MB in {vec_s:.2f} s)"
+    print(msg)
+    return {"file": path, "seconds": hyb_s, "bytes": hyb_b}
@@ -1,14 +1,11 @@
+import numpy as np
 import pandas as pd
 
-sra_db = pd.read_csv("../../data/SRA_metadata_before20231211.csv", dtype=str)
-plasmid_db = pd.read_csv("../data/plasmid_data.tsv", sep="\t", dtype=str)
-
-# SRA table has accession numbers in the format "ERR2138710"
-# Plasmid table has contig numbers in the format "ERR2138710_20"
-plasmid_db["acc"] = plasmid_db["seq_name"].str.split("_").str[0]
-
-# Instead of printing the entire plasmid sequence, I will keep the plasmid length, in case there is some correlations in AMR findings to that
-plasmid_db["plasmid_length"] = plasmid_db["sequence"].str.len()
+plasmid_tsv  = "../data/plasmid_data.tsv"
+sra_csv      = "../../data/SRA_metadata_before20231211.csv"
+lengths_path = "../data/plasmid_lengths.pkl"     # compact (acc, contig, plasmid_length) table
+block_bytes  = 64 << 20                          # TSV is scanned 64 MiB at a time
+sra_chunk    = 500_000                           # SRA rows per chunk
 
 sra_columns_to_keep = [
     "acc",
@@ -23,13 +20,146 @@ sra_columns_to_keep = [
     "releasedate"
 ]
 
+
+# -------------------------------------------------------------------
+# Plasmid lengths straight from the TSV bytes
+# -------------------------------------------------------------------
+# Only the length of each plasmid sequence is kept, so the sequence column
+# is never turned into strings: every block is scanned for tab / newline
+# offsets with numpy, and a sequence's length is the distance between the
+# tabs around it. Only the short seq_name field is decoded.
+
+def _name_matrix(buf, start, end):
+    """seq_name bytes of every line as a zero-padded (lines × longest name) uint8 matrix."""
+    width = int((end - start).max())
+    cols = np.arange(width)
+    idx = np.minimum(start[:, None] + cols, len(buf) - 1)
+    return np.where(cols < (end - start)[:, None], buf[idx], 0).astype(np.uint8)
+
+
+def _split_names(names):
+    """
+    acc (text before the first '_') and contig number (digits after it) per row.
+
+    Contig ids have the form "ERR2138710_20"; anything else raises, so the
+    seq_name written out (acc + "_" + contig) is always the original one.
+    """
+    n, width = names.shape
+    cols = np.arange(width)
+    length = (names != 0).sum(1)
+    under = names == ord("_")
+    first = np.where(under.any(1), under.argmax(1), -1)
+    digits = (cols > first[:, None]) & (cols < length[:, None])
+    is_digit = (names >= ord("0")) & (names <= ord("9"))
+    n_digits = length - first - 1
+
+    ok = ((first > 0) & (n_digits > 0) & (under.sum(1) == 1) & (~digits | is_digit).all(1)
+          & ((n_digits == 1) | (names[np.arange(n), np.minimum(first + 1, width - 1)] != ord("0"))))
+    if not ok.all():
+        bad = bytes(names[np.flatnonzero(~ok)[0]]).rstrip(b"\0").decode()
+        raise ValueError(f"unexpected seq_name {bad!r}, expected <accession>_<contig number>")
+
+    power = np.where(digits, length[:, None] - 1 - cols, 0)
+    contig = np.where(digits, (names.astype(np.int64) - ord("0")) * 10 ** power, 0).sum(1)
+    acc = np.where(cols < first[:, None], names, 0).astype(np.uint8)
+    acc = acc.view(f"S{width}").ravel()
+    return acc, contig
+
+
+def _scan_lines(buf, n_fields, name_col, seq_col):
+    """(acc, contig, length) arrays for the complete lines in buf."""
+    newline = np.flatnonzero(buf == ord("\n"))
+    tabs = np.flatnonzero(buf == ord("\t"))
+    line_start = np.r_[0, newline[:-1] + 1]
+    n_tabs = np.diff(np.r_[0, np.searchsorted(tabs, newline)])
+
+    cr = buf[np.maximum(newline - 1, 0)] == ord("\r")
+    filled = newline - line_start > cr             # skip empty lines
+    if (n_tabs[filled] != n_fields - 1).any():
+        raise ValueError(f"line with {n_tabs[filled][n_tabs[filled] != n_fields - 1][0] + 1} "
+                         f"fields, expected {n_fields}")
+    tabs = tabs.reshape(-1, n_fields - 1)
+    line_start, line_end = line_start[filled], newline[filled] - cr[filled]   # \r\n endings
+    if not filled.any():                           # block of empty lines only
+        return np.array([], dtype="S1"), np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    def bounds(j):
+        start = line_start if j == 0 else tabs[:, j - 1] + 1
+        end = line_end if j == n_fields - 1 else tabs[:, j]
+        return start, end
+
+    seq_start, seq_end = bounds(seq_col)
+    acc, contig = _split_names(_name_matrix(buf, *bounds(name_col)))
+    return acc, contig, seq_end - seq_start
+
+
+def scan_plasmid_lengths(path, block_bytes=block_bytes):
+    """
+    Compact (acc, contig, plasmid_length) table of a plasmid TSV, in file order.
+
+    The file is read in blocks of block_bytes; a line cut by a block end
+    is carried over to the next block.
+    """
+    parts = []
+    with open(path, "rb") as f:
+        header = f.readline().rstrip(b"\r\n").split(b"\t")
+        n_fields = len(header)
+        name_col, seq_col = header.index(b"seq_name"), header.index(b"sequence")
+
+        carry = b""
+        while True:
+            block = f.read(block_bytes)
+            data = carry + (block if block else b"\n" if carry else b"")
+            if not data:
+                break
+            cut = data.rfind(b"\n") + 1
+            if cut:
+                parts.append(_scan_lines(np.frombuffer(data, np.uint8, count=cut),
+                                         n_fields, name_col, seq_col))
+            carry = data[cut:]
+
+    acc, contig, length = (np.concatenate(a) for a in zip(*parts)) if parts else ([], [], [])
+    return pd.DataFrame({
+        "acc":            pd.Categorical(pd.Series(acc, dtype=object).str.decode("ascii")),
+        "contig":         np.asarray(contig, dtype=np.int32),
+        "plasmid_length": np.asarray(length, dtype=np.int64),
+    })
+
+
+# -------------------------------------------------------------------
+# SRA metadata of the plasmid accessions only
+# -------------------------------------------------------------------
+def read_sra_for(accessions, chunk_size=sra_chunk):
+    """
+    SRA rows of the given accessions, with only sra_columns_to_keep.
+
+    The SRA table is streamed in chunks and each chunk is cut down to the
+    plasmid accessions before it is kept (a semi-join), so memory follows
+    the plasmid set, not the SRA table. Labels come back as categoricals.
+    """
+    accessions = pd.Index(accessions)
+    kept = [chunk[accessions.get_indexer(chunk["acc"]) >= 0]
+            for chunk in pd.read_csv(sra_csv, usecols=sra_columns_to_keep, dtype=str,
+                                     chunksize=chunk_size)]
+    sra = pd.concat(kept, ignore_index=True)[sra_columns_to_keep]
+    return sra.astype({c: "category" for c in sra_columns_to_keep if c != "acc"})
+
+
+# Instead of the entire plasmid sequence, I keep the plasmid length, in case there is some correlations in AMR findings to that
+plasmid_db = scan_plasmid_lengths(plasmid_tsv)
+plasmid_db.to_pickle(lengths_path)
+
+sra_db = read_sra_for(plasmid_db["acc"].cat.categories)
+
+# SRA table has accession numbers in the format "ERR2138710"
+# Plasmid table has contig numbers in the format "ERR2138710_20"
+plasmid_db["seq_name"] = plasmid_db["acc"].astype(str) + "_" + plasmid_db["contig"].astype(str)
+plasmid_db["acc"] = plasmid_db["acc"].astype(str)
+
 merged_db = (
     plasmid_db[["acc", "seq_name", "plasmid_length"]]
-        .merge(sra_db[sra_columns_to_keep], on="acc", how="left")
+        .merge(sra_db, on="acc", how="left")
 )
 
 merged_db.to_csv("../data/plasmids_sra_metadata.csv", index=False)
 print("Merged plasmid and SRA metadata saved to 'plasmids_sra_metadata.csv")
-
-
-
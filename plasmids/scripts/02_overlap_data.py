@@ -1,16 +1,15 @@
-# 1. Load the tables
+# 1. Load the tables (only the id columns)
 import pandas as pd
-csv_df = pd.read_csv("../data/plasmids_sra_metadata.csv", dtype=str)       # has column "seq_name"
-tsv_df = pd.read_csv("../data/argnorm_output.tsv", sep="\t", dtype=str)  # has column "Contig id"
+from contig_ids import encode_contigs, overlap_counts
+csv_df = pd.read_csv("../data/plasmids_sra_metadata.csv", usecols=["seq_name"], dtype=str)
+tsv_df = pd.read_csv("../data/argnorm_output.tsv", sep="\t", usecols=["Contig id"], dtype=str)
 
-# 2. Build unique-ID sets
-seq_set    = set(csv_df["seq_name"].dropna().unique())
-contig_set = set(tsv_df["Contig id"].dropna().unique())
+# 2. Unique ids as sorted integer arrays (ERR2138710_20 → one uint64)
+seq_ids    = encode_contigs(csv_df["seq_name"])
+amr_ids    = encode_contigs(tsv_df["Contig id"])
 
 # 3. Quick sanity check / counts
-total_seq     = len(seq_set)
-total_contig  = len(contig_set)
-both_overlap  = len(seq_set & contig_set)
+total_seq, total_contig, both_overlap = overlap_counts(seq_ids, amr_ids)
 print(f"Plasmids total: {total_seq}")
 print(f"AMR-positive: {total_contig}")
 print(f"In both: {both_overlap}")
@@ -21,7 +20,7 @@ from matplotlib_venn import venn2
 
 fig, ax = plt.subplots(figsize=(4,4))
 
-v = venn2([seq_set, contig_set],
+v = venn2(subsets=(total_seq - both_overlap, total_contig - both_overlap, both_overlap),
           set_labels=("Total plasmids", "AMR-positive plasmids"), ax=ax)
 
 # ── Hide the empty part ───────────────────────────
@@ -33,18 +32,18 @@ plt.savefig("../data/venn_plasmids_amr.png", dpi=600)
 plt.savefig("../data/venn_plasmids_amr.svg")
 plt.close()
 
-sizes = [len(contig_set), len(seq_set) - len(contig_set)]
+sizes = [total_contig, total_seq - total_contig]
 labels = ["AMR-positive plasmids", "Total plasmids"]
 
 fig, ax = plt.subplots(figsize=(4,4), subplot_kw=dict(aspect="equal"))
 
 # Outer ring (total seq_name)
-ax.pie([len(seq_set)], radius=1, wedgeprops=dict(width=0.3, edgecolor='w'),
-       labels=[f"Total plasmids ({len(seq_set)})"])
+ax.pie([total_seq], radius=1, wedgeprops=dict(width=0.3, edgecolor='w'),
+       labels=[f"Total plasmids ({total_seq})"])
 
 # Inner ring (those seq_names that are Contig ids)
-ax.pie([len(contig_set)], radius=1-0.3, wedgeprops=dict(width=0.3, edgecolor='w'),
-       labels=[f"AMR-positive plasmids ({len(contig_set)})"])
+ax.pie([total_contig], radius=1-0.3, wedgeprops=dict(width=0.3, edgecolor='w'),
+       labels=[f"AMR-positive plasmids ({total_contig})"])
 
 plt.tight_layout()
 plt.savefig("../data/ring_plasmids_amr.png", dpi=600)
@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from enrichment import category_counts, balanced_enrichment, enrichment_xerr
 
 # -------------------------------------------------
 # file paths
@@ -13,43 +14,29 @@ plot_png2   = "../data/amr_organism_enrichment_norm_sq.png"
 plot_svg2   = "../data/amr_organism_enrichment_norm_sq.svg"
 
 rng = np.random.default_rng(42)          # reproducible random seed
+n_boot = 10_000                          # balanced replicates for the CIs
 
 # -------------------------------------------------
 # 1. load data
 # -------------------------------------------------
-df_total = pd.read_csv(total_file, dtype=str, low_memory=False)
-df_amr   = pd.read_csv(amr_file,   dtype=str, low_memory=False)
+usecols  = ["seq_name", "organism_type", "metagenome_category"]
+df_total = pd.read_csv(total_file, usecols=usecols, dtype=str, low_memory=False)
+df_amr   = pd.read_csv(amr_file,   usecols=usecols, dtype=str, low_memory=False)
 
 # ────────────────────────────────────────────────────────────────
 # PART A  ·  ISOLATE  vs  METAGENOME  (balanced)
 # ────────────────────────────────────────────────────────────────
 cats_org = ["Isolate", "Metagenome"]
 
-# sets of unique plasmid ids (seq_name) per category
-total_sets_org = {c: set(df_total.loc[df_total["organism_type"] == c, "seq_name"])
-                  for c in cats_org}
-amr_sets_org   = {c: set(df_amr  .loc[df_amr  ["organism_type"] == c, "seq_name"])
-                  for c in cats_org}
+# unique plasmid ids (seq_name) per category, total and AMR-positive;
+# categories with zero records in df_total are dropped
+pos_org, tot_org = category_counts(df_total, df_amr, "organism_type", "seq_name", cats_org)
 
-# drop categories with zero records in df_total
-total_sets_org = {c: s for c, s in total_sets_org.items() if len(s) > 0}
-amr_sets_org   = {c: amr_sets_org[c] for c in total_sets_org.keys()}
-cats_org       = list(total_sets_org.keys())
-
-n_per_cat = min(len(s) for s in total_sets_org.values())
-
-totals_bal, amrs_bal = {}, {}
-for c in cats_org:
-    sampled = rng.choice(list(total_sets_org[c]), n_per_cat, replace=False)
-    sampled_set = set(sampled)
-    totals_bal[c] = n_per_cat
-    amrs_bal[c]   = len(amr_sets_org[c] & sampled_set)
-
-series_tot = pd.Series(totals_bal)
-series_amr = pd.Series(amrs_bal)
-
-density_overall = series_amr.sum() / series_tot.sum()
-enrichment_org  = np.log2((series_amr / series_tot) / density_overall)
+# balanced to the smallest category, AMR-positives drawn as hypergeometric counts
+res_org = balanced_enrichment(pos_org, tot_org, rng, n_boot=n_boot)
+res_org.to_csv(plot_png1.replace(".png", ".csv"))
+print(res_org)
+enrichment_org = res_org["enrichment"]
 
 # ---- plot isolate vs metagenome --------------------------------
 palette_org = {
@@ -62,7 +49,8 @@ vals      = enrichment_org.loc[cats_plot]
 colors    = [palette_org.get(c, "#bbbbbb") for c in cats_plot]
 
 fig, ax = plt.subplots(figsize=(4, 4))
-ax.barh(cats_plot, vals, color=colors, edgecolor="black", alpha=0.9)
+ax.barh(cats_plot, vals, color=colors, edgecolor="black", alpha=0.9,
+        xerr=enrichment_xerr(res_org.loc[cats_plot]), capsize=3)
 ax.axvline(0, color="black", linewidth=1)
 
 ax.set_xlabel("log₂ enrichment of AMR-positive plasmids\n"
@@ -95,31 +83,14 @@ df_total_meta = df_total[mask_total]
 
 cats_meta = sorted(df_total_meta["metagenome_category"].unique())
 
-total_sets_meta = {c: set(df_total_meta.loc[df_total_meta["metagenome_category"] == c, "seq_name"])
-                   for c in cats_meta}
-amr_sets_meta   = {c: set(df_amr_meta  .loc[df_amr_meta  ["metagenome_category"] == c, "seq_name"])
-                   for c in cats_meta}
-
-# drop empty categories
-total_sets_meta = {c: s for c, s in total_sets_meta.items() if len(s) > 0}
-amr_sets_meta   = {c: amr_sets_meta[c] for c in total_sets_meta.keys()}
-cats_meta       = list(total_sets_meta.keys())
-
-n_per_cat = min(len(s) for s in total_sets_meta.values())
-
-totals_bal_meta, amrs_bal_meta = {}, {}
-for c in cats_meta:
-    sampled = rng.choice(list(total_sets_meta[c]), n_per_cat, replace=False)
-    sampled_set = set(sampled)
-    totals_bal_meta[c] = n_per_cat
-    amrs_bal_meta[c]   = len(amr_sets_meta[c] & sampled_set)
-
-series_tot_meta = pd.Series(totals_bal_meta)
-series_amr_meta = pd.Series(amrs_bal_meta)
+# empty categories are dropped
+pos_meta, tot_meta = category_counts(df_total_meta, df_amr_meta,
+                                     "metagenome_category", "seq_name", cats_meta)
 
-density_overall_meta = series_amr_meta.sum() / series_tot_meta.sum()
-enrichment_meta      = np.log2((series_amr_meta / series_tot_meta) /
-                               density_overall_meta)
+res_meta = balanced_enrichment(pos_meta, tot_meta, rng, n_boot=n_boot)
+res_meta.to_csv(plot_png2.replace(".png", ".csv"))
+print(res_meta)
+enrichment_meta = res_meta["enrichment"]
 
 # ---- plot metagenome categories --------------------------------
 palette_meta = {
@@ -136,7 +107,8 @@ vals      = enrichment_meta.loc[cats_plot]
 colors    = [palette_meta.get(c, "#bbbbbb") for c in cats_plot]
 
 fig, ax = plt.subplots(figsize=(4, 4))
-ax.barh(cats_plot, vals, color=colors, edgecolor="black", alpha=0.9)
+ax.barh(cats_plot, vals, color=colors, edgecolor="black", alpha=0.9,
+        xerr=enrichment_xerr(res_meta.loc[cats_plot]), capsize=3)
 ax.axvline(0, color="black", linewidth=1)
 
 ax.set_xlabel("log₂ enrichment of AMR-positive plasmids\n"
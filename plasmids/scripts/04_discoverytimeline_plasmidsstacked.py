@@ -1,59 +1,27 @@
-import pandas as pd
 import matplotlib.pyplot as plt
+from plasmid_timeline import load_plasmid_table, stacked_timeline
 
-# Helper: bin into quarters
-def bin_by_quarter(df):
-    df = df.copy()
-    df['releasedate'] = pd.to_datetime(
-        df['releasedate'].str.strip('[]'), errors='coerce'
-    )
-    df = df.dropna(subset=['releasedate'])
-    df['quarter_bin'] = df['releasedate'].dt.to_period("Q")
-    return df
+total_csv = "../data/plasmids_sra_metadata_extended.csv"
+amr_csv   = "../data/amr_metadata_extended.csv"
 
-def bin_by_third(df):
-    df = df.copy()
-    df['releasedate'] = pd.to_datetime(
-        df['releasedate'].str.strip('[]'), errors='coerce'
-    )
-    df = df.dropna(subset=['releasedate'])
+freq   = "T"      # release-date bins for the figure: thirds (Jan-Apr, May-Aug, Sep-Dec)
+# the same counts split by these labels are written next to the figure as CSV
+strata = ["metagenome_category", "geo_loc_name_country_continent_calc"]
 
-    def assign_third(month):
-        if 1 <= month <= 4:
-            return 'T1'
-        elif 5 <= month <= 8:
-            return 'T2'
-        else:
-            return 'T3'
+# 1. Read the data: one row per distinct (plasmid id, release day, labels),
+#    cached as *.plasmids.pkl next to each CSV
+df_total = load_plasmid_table(total_csv)
+df_amr   = load_plasmid_table(amr_csv)
 
-    df['year'] = df['releasedate'].dt.year
-    df['third'] = df['releasedate'].dt.month.apply(assign_third)
-    df['third_bin'] = df['year'].astype(str) + '-' + df['third']
-    return df
+# 2. + 3. Unique plasmids per third, total and AMR-positive, on the union of bins
+#         (freq="Q" for quarters, "M" for months, or a number of days)
+counts = stacked_timeline(df_total, df_amr, freq)
+total_counts = counts["total"]
+amr_counts   = counts["amr_positive"]
 
-# 1. Read the data
-df_total = pd.read_csv("../data/plasmids_sra_metadata_extended.csv", dtype=str)
-df_amr   = pd.read_csv("../data/amr_metadata_extended.csv", dtype=str)
-
-# 2. Filter and bin
-#df_total_q = bin_by_quarter(df_total)
-#df_amr_q   = bin_by_quarter(df_amr)
-
-df_total_t = bin_by_third(df_total)
-df_amr_t   = bin_by_third(df_amr)
-
-# 3. Build unique accession sets per quarter
-#total_counts = df_total_q.groupby("quarter_bin")["seq_name"].nunique()
-#amr_counts   = df_amr_q.groupby("quarter_bin")["seq_name"].nunique()
-
-total_counts = df_total_t.groupby("third_bin")["seq_name"].nunique()
-amr_counts   = df_amr_t.groupby("third_bin")["seq_name"].nunique()
-
-
-# Align both series to the same index
-all_quarters = sorted(set(total_counts.index) | set(amr_counts.index))
-total_counts = total_counts.reindex(all_quarters, fill_value=0)
-amr_counts   = amr_counts.reindex(all_quarters, fill_value=0)
+for col in strata:
+    stacked_timeline(df_total, df_amr, freq, by=col).to_csv(
+        f"../data/discovery_timeline_plasmids_amr_{col}.csv")
 
 # 4. Plot stacked bars
 fig, ax = plt.subplots(figsize=(12, 4))
@@ -70,17 +38,10 @@ even_year_pos = [
     i for i, b in enumerate(total_counts.index)
     if b.endswith('T1') and int(b.split('-')[0]) % 2 == 0
 ]
-even_year_labs = [
-    b.split('-')[0] for b in total_counts.index
-    if b.endswith('T1') and int(b.split('-')[0]) % 2 == 0
-]
 
 # 3. Force add first and last bin labels
 first_pos = 0
-first_lab = total_counts.index[0].split('-')[0]
-
 last_pos = len(total_counts.index) - 1
-last_lab = total_counts.index[-1].split('-')[0]
 
 # Add them if they’re not already included
 tick_positions = sorted(set(even_year_pos + [first_pos, last_pos]))
@@ -1,6 +1,6 @@
 import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
+from enrichment import mean_enrichment, enrichment_xerr
 
 # -------------------------------------------------
 # file paths
@@ -26,78 +26,73 @@ category_colors = {
 chunksize = 10_000_000
 usecols = ["acc", "metagenome_category", "seq_name"]
 
-per_acc_chunks = []
+n_bootstraps = 10_000       # balanced replicates; spread over processes from 10k on
+table_csv = plot_png.replace(".png", ".csv")
 
-for chunk in pd.read_csv(csv_path, usecols=usecols, chunksize=chunksize, low_memory=False):
-    chunk = chunk[chunk["metagenome_category"].isin(wanted_categories)]
-    counts = (
-        chunk.groupby(["metagenome_category", "acc"])
-             .size()
-             .rename("count")
-             .reset_index()
+
+def main():
+    per_acc_chunks = []
+
+    for chunk in pd.read_csv(csv_path, usecols=usecols, chunksize=chunksize, low_memory=False):
+        chunk = chunk[chunk["metagenome_category"].isin(wanted_categories)]
+        counts = (
+            chunk.groupby(["metagenome_category", "acc"])
+                 .size()
+                 .rename("count")
+                 .reset_index()
+        )
+        per_acc_chunks.append(counts)
+
+    per_acc = pd.concat(per_acc_chunks)
+    per_acc = (
+        per_acc.groupby(["metagenome_category", "acc"])["count"]
+               .sum()
+               .reset_index()
     )
-    per_acc_chunks.append(counts)
 
-per_acc = pd.concat(per_acc_chunks)
-per_acc = (
-    per_acc.groupby(["metagenome_category", "acc"])["count"]
-           .sum()
-           .reset_index()
-)
+    # -------------------------------------------------
+    # balanced sampling and log₂ enrichment
+    # -------------------------------------------------
 
-# -------------------------------------------------
-# balanced sampling and log₂ enrichment
-# -------------------------------------------------
+    # per-category count vectors; subsampled to the smallest category in
+    # every replicate (enrichment.mean_enrichment)
+    values_by_cat = {
+        cat: g.to_numpy()
+        for cat, g in per_acc.groupby("metagenome_category")["count"]
+    }
 
-# 1. Create dict of seq_names per category
-groups = per_acc.groupby("metagenome_category")["acc"].unique().to_dict()
+    res = mean_enrichment(values_by_cat, n_boot=n_bootstraps, seed=42)
+    res.to_csv(table_csv)
+    print(res)
 
-# 2. Map seq_name to AMR count
-seq_to_count = per_acc.set_index("acc")["count"].to_dict()
+    log2_enrichment = res["enrichment"].to_dict()
 
-# 3. Balanced sampling
-rng = np.random.default_rng(42)
-n_per_cat = min(len(accs) for accs in groups.values())
-n_bootstraps = 100
+    # -------------------------------------------------
+    # plot
+    # -------------------------------------------------
+    cats_sorted = sorted(log2_enrichment, key=log2_enrichment.get)
+    vals = [log2_enrichment[cat] for cat in cats_sorted]
+    colors = [category_colors.get(cat, "#bbbbbb") for cat in cats_sorted]
 
-boot_means = {cat: [] for cat in groups}
+    fig, ax = plt.subplots(figsize=(4, 4))
+    ax.barh(cats_sorted, vals, color=colors, edgecolor="black", alpha=0.9,
+            xerr=enrichment_xerr(res.loc[cats_sorted]), capsize=3)
+    ax.axvline(0, color="black", linewidth=1)
 
-for _ in range(n_bootstraps):
-    for cat, accs in groups.items():
-        sampled = rng.choice(accs, size=n_per_cat, replace=False)
-        mean_amr = np.mean([seq_to_count[acc] for acc in sampled])
-        boot_means[cat].append(mean_amr)
+    #ax.set_xlabel("log₂ enrichment of AMR genes in plasmids per SRA accession\nvs. average across categories", fontsize=11)
+    ax.set_ylabel("")
+    ax.grid(axis="x", linestyle="--", linewidth=0.5, alpha=0.5)
 
-# 4. Compute per-category means and enrichment
-mean_per_cat = {cat: np.mean(vals) for cat, vals in boot_means.items()}
-overall_mean = np.mean(list(mean_per_cat.values()))
+    xmax, xmin = max(vals), min(vals)
+    pad = (xmax - xmin) * 0.02
+    ax.text(xmin - pad, len(cats_sorted) + 0.3, "← fewer AMR genes per SRA accession", ha="left", va="center")
+    ax.text(xmax + pad, len(cats_sorted) + 0.3, "more AMR genes per SRA accession →", ha="right", va="center")
 
-log2_enrichment = {
-    cat: np.log2(mean / overall_mean)
-    for cat, mean in mean_per_cat.items()
-}
+    plt.tight_layout()
+    plt.savefig(plot_png, dpi=600)
+    plt.savefig(plot_svg)
+    plt.close()
 
-# -------------------------------------------------
-# plot
-# -------------------------------------------------
-cats_sorted = sorted(log2_enrichment, key=log2_enrichment.get)
-vals = [log2_enrichment[cat] for cat in cats_sorted]
-colors = [category_colors.get(cat, "#bbbbbb") for cat in cats_sorted]
-
-fig, ax = plt.subplots(figsize=(4, 4))
-ax.barh(cats_sorted, vals, color=colors, edgecolor="black", alpha=0.9)
-ax.axvline(0, color="black", linewidth=1)
-
-#ax.set_xlabel("log₂ enrichment of AMR genes in plasmids per SRA accession\nvs. average across categories", fontsize=11)
-ax.set_ylabel("")
-ax.grid(axis="x", linestyle="--", linewidth=0.5, alpha=0.5)
-
-xmax, xmin = max(vals), min(vals)
-pad = (xmax - xmin) * 0.02
-ax.text(xmin - pad, len(cats_sorted) + 0.3, "← fewer AMR genes per SRA accession", ha="left", va="center")
-ax.text(xmax + pad, len(cats_sorted) + 0.3, "more AMR genes per SRA accession →", ha="right", va="center")
-
-plt.tight_layout()
-plt.savefig(plot_png, dpi=600)
-plt.savefig(plot_svg)
-plt.close()
+
+if __name__ == "__main__":
+    main()
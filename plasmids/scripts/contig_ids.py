@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------------------------
+# Integer contig ids
+# -------------------------------------------------------------------
+# Plasmid contigs are named <run accession>_<contig number>, e.g.
+# ERR2138710_20. They are encoded as one uint64: the accession (prefix
+# index << 30 | run number) in the high 32 bits and the contig number in
+# the low 32 bits. Sets, overlaps, deduplication and joins between the
+# plasmid and AMR tables then run on sorted integer arrays instead of
+# Python strings. Only canonical names are encoded (known prefix, at least
+# acc_digits zero-padded digits, no leading zeros in the contig number),
+# so decode_contigs gives back the exact original string.
+
+acc_prefixes = ("SRR", "ERR", "DRR")
+acc_digits = 6                 # run numbers are zero-padded to 6 digits
+acc_bits = 30
+contig_bits = 32
+no_id = np.iinfo(np.uint64).max
+
+
+def _char_matrix(names):
+    """Names as a zero-padded (n × longest name) uint8 matrix; missing names are empty rows."""
+    s = pd.Series(names, dtype=object)
+    raw = np.array(s.where(s.notna(), "").tolist(), dtype="S")
+    width = max(raw.dtype.itemsize, 1)
+    return raw.astype(f"S{width}").view(np.uint8).reshape(len(raw), width)
+
+
+def _digit_value(m, start, stop):
+    """Integer value of m[i, start[i]:stop[i]], whether it is all digits, and its first character."""
+    value = np.zeros(len(m), dtype=np.uint64)
+    ok = stop > start
+    for j in range(m.shape[1]):                  # one pass per character column
+        col = m[:, j]
+        inside = (start <= j) & (j < stop)
+        ok &= ~inside | ((col >= ord("0")) & (col <= ord("9")))
+        value = np.where(inside, value * np.uint64(10) + (col - np.uint8(ord("0"))), value)
+    first = m[np.arange(len(m)), np.clip(start, 0, m.shape[1] - 1)]
+    return value, ok, first
+
+
+def encode_contigs(names, strict=True):
+    """
+    seq_name / Contig id strings → uint64 ids (missing names → no_id).
+
+    With strict=True a name that is not a canonical <accession>_<number>
+    raises ValueError; with strict=False it becomes no_id too.
+    """
+    m = _char_matrix(names)
+    n, width = m.shape
+    length = (m != 0).sum(1)
+    missing = length == 0
+
+    prefix = np.full(n, -1)
+    for i, p in enumerate(acc_prefixes):
+        if width >= len(p):
+            hit = (m[:, :len(p)] == np.frombuffer(p.encode(), np.uint8)).all(1)
+            prefix[hit] = i
+    under = m == ord("_")
+    sep = np.where(under.any(1), under.argmax(1), -1)
+    n_acc = sep - 3
+
+    acc_num, acc_ok, acc_first = _digit_value(m, np.full(n, 3), sep)
+    contig, contig_ok, contig_first = _digit_value(m, sep + 1, length)
+    ok = ((prefix >= 0) & (sep > 0) & (under.sum(1) == 1) & acc_ok & contig_ok
+          & ((n_acc == acc_digits) | ((n_acc > acc_digits) & (acc_first != ord("0"))))
+          & ((length - sep - 1 == 1) | (contig_first != ord("0")))
+          & (n_acc <= 10) & (length - sep - 1 <= 10)         # no uint64 overflow
+          & (acc_num < 2 ** acc_bits) & (contig < 2 ** contig_bits))
+
+    bad = ~ok & ~missing
+    if strict and bad.any():
+        name = bytes(m[np.flatnonzero(bad)[0]]).rstrip(b"\0").decode()
+        raise ValueError(f"cannot encode contig id {name!r}, expected e.g. ERR2138710_20")
+
+    ids = np.full(n, no_id, dtype=np.uint64)
+    acc = (prefix[ok].astype(np.uint64) << np.uint64(acc_bits)) | acc_num[ok]
+    ids[ok] = (acc << np.uint64(contig_bits)) | contig[ok]
+    return ids
+
+
+def accession_codes(ids):
+    """Accession part (prefix index << 30 | run number) of contig ids."""
+    return np.asarray(ids, dtype=np.uint64) >> np.uint64(contig_bits)
+
+
+def contig_numbers(ids):
+    return np.asarray(ids, dtype=np.uint64) & np.uint64((1 << contig_bits) - 1)
+
+
+def decode_accessions(codes):
+    """Accession codes → accession strings, e.g. ERR2138710."""
+    codes = np.asarray(codes, dtype=np.uint64)
+    prefix = np.array(acc_prefixes, dtype=object)[(codes >> np.uint64(acc_bits)).astype(np.int64)]
+    number = pd.Series(codes & np.uint64((1 << acc_bits) - 1)).astype(str).str.zfill(acc_digits)
+    return prefix + number.to_numpy(dtype=object)
+
+
+def decode_contigs(ids):
+    """uint64 ids → the original seq_name strings (no_id → None)."""
+    ids = np.asarray(ids, dtype=np.uint64)
+    out = np.full(len(ids), None, dtype=object)
+    ok = ids != no_id
+    out[ok] = (decode_accessions(accession_codes(ids[ok])) + "_"
+               + pd.Series(contig_numbers(ids[ok])).astype(str).to_numpy(dtype=object))
+    return out
+
+
+# -------------------------------------------------------------------
+# Set operations and joins on sorted id arrays
+# -------------------------------------------------------------------
+def unique_ids(ids):
+    """Sorted distinct ids, without no_id (the integer version of set(...dropna()))."""
+    ids = np.unique(np.asarray(ids, dtype=np.uint64))
+    return ids[ids != no_id]
+
+
+def overlap_counts(a, b):
+    """(|A|, |B|, |A ∩ B|) of two id arrays, duplicates and no_id ignored."""
+    a, b = unique_ids(a), unique_ids(b)
+    return len(a), len(b), int(isin_sorted(a, b).sum())
+
+
+def isin_sorted(ids, sorted_ids):
+    """Whether each id is in the sorted array sorted_ids (binary search, no re-sort)."""
+    ids = np.asarray(ids, dtype=np.uint64)
+    pos = np.minimum(np.searchsorted(sorted_ids, ids), max(len(sorted_ids) - 1, 0))
+    return (sorted_ids[pos] == ids) & (ids != no_id) if len(sorted_ids) else np.zeros(len(ids), bool)
+
+
+def sorted_index(ids):
+    """(order, sorted ids) of an id array, to join many left chunks against it."""
+    ids = np.asarray(ids, dtype=np.uint64)
+    order = np.argsort(ids, kind="stable")
+    return order, ids[order]
+
+
+def inner_join_index(left, right=None, index=None):
+    """
+    Row positions (left_idx, right_idx) of an inner join on ids.
+
+    Same pairs and order as pd.merge(how="inner"): left rows in order,
+    each followed by all its right matches in right order. Missing ids
+    (no_id) never match, where pandas would pair up NaN keys. Pass
+    index=sorted_index(right) instead of right to reuse the sort.
+    """
+    left = np.asarray(left, dtype=np.uint64)
+    order, sorted_right = sorted_index(right) if index is None else index
+
+    lo = np.searchsorted(sorted_right, left, side="left")
+    hi = np.searchsorted(sorted_right, left, side="right")
+    counts = np.where(left == no_id, 0, hi - lo)
+
+    left_idx = np.repeat(np.arange(len(left)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_idx = order[np.repeat(lo, counts) + offset]
+    return left_idx, right_idx
+
+
+def inner_merge(left, right, on="seq_name", index=None):
+    """
+    pd.merge(left, right, on=on, how="inner") through integer contig ids.
+
+    Rows, row order and columns (with the _x / _y suffixes for clashing
+    names) come out as from pandas; rows with a missing id are dropped.
+    With index=sorted_index(encode_contigs(right[on])) the right side is
+    not re-encoded and re-sorted, e.g. when left arrives in chunks.
+    """
+    if index is None:
+        index = sorted_index(encode_contigs(right[on]))
+    left_idx, right_idx = inner_join_index(encode_contigs(left[on]), index=index)
+    right = right.drop(columns=on)
+    clash = set(left.columns) & set(right.columns)
+    return pd.concat([
+        left.iloc[left_idx].reset_index(drop=True).rename(columns={c: f"{c}_x" for c in clash}),
+        right.iloc[right_idx].reset_index(drop=True).rename(columns={c: f"{c}_y" for c in clash}),
+    ], axis=1)
@@ -0,0 +1,105 @@
+import os
+import numpy as np
+import pandas as pd
+from accession_table import to_days, no_day, day_bins, bin_labels
+from contig_ids import encode_contigs, no_id
+
+# -------------------------------------------------------------------
+# Distinct plasmids per date bin
+# -------------------------------------------------------------------
+# A plasmid table (all plasmids, or the AMR hits with one row per gene) is
+# reduced once to its distinct (contig id, release day, labels) rows: ids
+# from contig_ids.py, days as int32 since 1970-01-01, labels as
+# categoricals. Counting distinct plasmids per bin, for any bin width and
+# any split, is then one sort of (group, id) pairs.
+
+timeline_columns = ["seq_name", "releasedate"]
+label_columns = ["metagenome_category", "organism_type",
+                 "geo_loc_name_country_continent_calc"]
+
+
+def build_plasmid_table(csv_path, chunk_size=2_000_000):
+    """Stream a plasmid table and keep its distinct (id, release_day, labels) rows."""
+    header = pd.read_csv(csv_path, nrows=0).columns
+    labels = [c for c in label_columns if c in header]
+    parts = []
+    for chunk in pd.read_csv(csv_path, usecols=timeline_columns + labels, dtype=str,
+                             chunksize=chunk_size):
+        part = pd.DataFrame({"id": encode_contigs(chunk["seq_name"]),
+                             "release_day": to_days(chunk["releasedate"])})
+        for c in labels:
+            part[c] = chunk[c].to_numpy()
+        parts.append(part.drop_duplicates())
+
+    table = pd.concat(parts, ignore_index=True).drop_duplicates(ignore_index=True)
+    return table.astype({c: "category" for c in labels})
+
+
+def load_plasmid_table(csv_path, cache_path=None, chunk_size=2_000_000):
+    """
+    Distinct-plasmid table for csv_path, cached as *.plasmids.pkl next to it.
+
+    The cache is rebuilt when it is missing or older than the CSV.
+    """
+    if cache_path is None:
+        cache_path = os.path.splitext(csv_path)[0] + ".plasmids.pkl"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+        return pd.read_pickle(cache_path)
+    table = build_plasmid_table(csv_path, chunk_size)
+    table.to_pickle(cache_path)
+    return table
+
+
+def distinct_counts(table, freq="T", by=None):
+    """
+    Distinct plasmids per release-date bin, optionally split by label columns.
+
+    freq is any day_bins frequency ("Y", "Q", "T", "M" or a number of
+    days). A plasmid is counted once per bin (and label) it has rows in,
+    like groupby(bin)["seq_name"].nunique(). Rows without id, date or
+    label are left out, and only non-empty groups are returned. Returns
+    a Series indexed by bin, or by (bin, *by).
+    """
+    by = [by] if isinstance(by, str) else list(by or [])
+    days = table["release_day"].to_numpy()
+    ids = table["id"].to_numpy()
+    ok = (days != no_day) & (ids != no_id)
+    labels = []
+    for c in by:
+        col = table[c].astype("category")
+        labels.append((col.cat.codes.to_numpy(), col.cat.categories))
+        ok &= labels[-1][0] >= 0
+
+    bins = day_bins(days[ok], freq)
+    lo = bins.min() if len(bins) else 0
+    group = bins - lo
+    for codes, cats in labels:
+        group = group * len(cats) + codes[ok]
+    ids = ids[ok]
+
+    # distinct (group, id) pairs: one lexsort, then a count per group
+    order = np.lexsort((ids, group))
+    g, i = group[order], ids[order]
+    first = np.r_[True, (g[1:] != g[:-1]) | (i[1:] != i[:-1])][:len(g)]
+    groups, counts = np.unique(g[first], return_counts=True)
+
+    levels = []
+    for codes, cats in reversed(labels):
+        levels.insert(0, cats[groups % len(cats)])
+        groups = groups // len(cats)
+    index = bin_labels(groups + lo, freq)
+    if by:
+        index = pd.MultiIndex.from_arrays([index] + levels, names=[index.name] + by)
+    return pd.Series(counts, index=index, name="unique_plasmids")
+
+
+def stacked_timeline(total, amr, freq="T", by=None):
+    """
+    Total and AMR-positive distinct plasmids per bin (and labels).
+
+    total and amr are tables from load_plasmid_table. The result has
+    columns total and amr_positive on the union of their groups, in order.
+    """
+    out = pd.concat({"total":        distinct_counts(total, freq, by),
+                     "amr_positive": distinct_counts(amr, freq, by)}, axis=1)
+    return out.fillna(0).astype(np.int64).sort_index()
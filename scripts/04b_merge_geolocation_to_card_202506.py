@@ -1,34 +1,76 @@
+import os
+import time
 import pandas as pd
+from geo_utils import load_geo_release, diff_geo_releases, geo_release_columns
 
 # Biosample-geographical-location table 506, new one
-geo = (
-    pd.read_csv("../data/biosample_geographical_location.202506.csv", dtype=str)
-      # discard the null geolocations
-      .loc[lambda d: ~d['lat_lon'].isin([
-          "0101000020E61000000AD7A3703D4A41C06666666666660CC0",
-          "0101000020E6100000EC51B81E85EB0FC052B81E85EB913140"
-      ])]
-      # rename columns to better names and acc to match card table
-      .rename(columns={
-          "lat_lon"       : "WTK",
-          "attribute_name": "lat_lon",  
-          "accession"     : "sample_name"       
-      })
-      [["sample_name", "lat_lon", "WTK", "biome"]]
-)
+geo_path = "../data/biosample_geographical_location.202506.csv"
+# Release used for the previous merge, to report what changed (skipped if missing)
+prev_geo_path = "../data/biosample_geographical_location.202503.csv"
 
 # CARD metadata table
+card_path = "../data/full_card_metadata_aro_allfilters_metagenomes_WHOcategories.csv"
+out_path  = "../data/full_card_metadata_aro_allfilters_metagenomes_WHOcategories_latlon.csv"
+# Per-biosample geolocation of the CARD table (used by refresh_mode = "dimension")
+dim_path  = "../data/full_card_metadata_aro_allfilters_metagenomes_WHOcategories_biosample_geo.csv"
 
-card = pd.read_csv("../data/full_card_metadata_aro_allfilters_metagenomes_WHOcategories.csv", dtype=str)
+# "stream"    : rewrite the CARD table chunk by chunk with the new geolocation columns
+# "dimension" : only refresh the per-biosample table, joined on sample_name when needed
+refresh_mode = "stream"
+chunk_size = 2_000_000
 
-# Remove columns from previous geolocation merge
-card = card.drop(columns=[c for c in ("lat_lon", "WTK", "biome") if c in card.columns])
 
-# Merge and save
+# Indexed geolocation tables (cached next to the CSVs after the first run)
+geo = load_geo_release(geo_path)
+print(f"{len(geo)} biosamples with geolocation in {geo_path}", flush=True)
 
-merged = pd.merge(card, geo, on="sample_name", how="left")
+if prev_geo_path and os.path.exists(prev_geo_path):
+    status = diff_geo_releases(load_geo_release(prev_geo_path), geo)
+    print("Biosamples compared to the previous release:")
+    print(status.value_counts().to_string(), flush=True)
 
-merged.to_csv(
-    "../data/full_card_metadata_aro_allfilters_metagenomes_WHOcategories_latlon.csv",
-    index=False
-)
+start = time.time()
+
+def card_sample_names():
+    """Biosamples of the CARD table, read one column at a time in chunks."""
+    keys = pd.Index([], dtype=object)
+    for chunk in pd.read_csv(card_path, usecols=["sample_name"], dtype=str, chunksize=chunk_size):
+        keys = keys.union(pd.Index(chunk["sample_name"].dropna().unique()))
+    return keys
+
+
+if refresh_mode == "dimension":
+    if os.path.exists(dim_path):
+        dim = pd.read_csv(dim_path, dtype=str, index_col="sample_name", keep_default_na=False)
+        keys = dim.index
+        # CARD table changed since the last refresh: add its new biosamples
+        if os.path.getmtime(card_path) > os.path.getmtime(dim_path):
+            keys = keys.union(card_sample_names())
+    else:
+        # First run: collect the biosamples of the CARD table once
+        dim = None
+        keys = card_sample_names()
+
+    new_dim = geo.reindex(keys)
+    if dim is not None:
+        moved = (dim["WTK"].to_numpy() != new_dim["WTK"].reindex(dim.index).fillna("").to_numpy()).sum()
+        print(f"{moved} of {len(dim)} CARD biosamples changed geolocation, "
+              f"{len(keys) - len(dim)} new", flush=True)
+    new_dim.rename_axis("sample_name").to_csv(dim_path)
+    print(f"Wrote {dim_path} in {time.time() - start:.1f} s")
+
+else:
+    # Stream the CARD table and join each chunk on the indexed geolocation table
+    n_rows, n_geo = 0, 0
+    reader = pd.read_csv(card_path, dtype=str, chunksize=chunk_size, low_memory=False)
+    for i, chunk in enumerate(reader):
+        # Remove columns from previous geolocation merge
+        chunk = chunk.drop(columns=[c for c in geo_release_columns if c in chunk.columns])
+        chunk = chunk.join(geo, on="sample_name")
+
+        chunk.to_csv(out_path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+        n_rows += len(chunk)
+        n_geo  += chunk["WTK"].notna().sum()
+        print(f"Chunk {i+1}: {n_rows} rows written, {n_geo} with geolocation", flush=True)
+
+    print(f"Wrote {out_path} in {time.time() - start:.1f} s")
@@ -8,56 +8,90 @@ def log_progress(message):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{timestamp}] {message}", flush=True)
 
+# File paths
+geo_file = "./data/biosample_geographical_location.202503.csv"
+hits_file = "./data/card_metadata_aro.csv"
+output_file = "./data/card_metadata_aro_geolocation.csv"
+biosample_output_file = "./data/biosample_geolocation.csv"
+
+# Output mode
+#   "per_hit"       : geolocation columns added to every hit row (card_metadata_aro_geolocation.csv)
+#   "per_biosample" : geolocation written once per biosample found in the hit table,
+#                     to be joined on sample_name when needed (biosample_geolocation.csv)
+output_mode = "per_hit"
+
+chunk_size = 2000000
+
+# Geolocation file column -> output column
+geo_columns = {
+    "atribute_name": "Country",
+    "attribute_value": "lat_lon",
+    "lat_lon": "WKT",
+    "elevation": "elevation",
+    "country": "country_abv",
+    "biome": "biome",
+    "confidence": "geoloc_confidence_0-6",
+}
+
 log_progress("Starting data processing")
 
-# Step 1: Load SRA metadata as a dictionary (small file optimization)
+# Step 1: Load the geolocation table once, deduplicated and indexed by biosample
 log_progress("Loading geolocation data file into memory")
-metadata_dict = {}
+header = pd.read_csv(geo_file, nrows=0).columns
+present = [c for c in geo_columns if c in header]
 
-df = pd.read_csv("./data/biosample_geographical_location.202503.csv", dtype=str)
+geo = pd.read_csv(geo_file, usecols=["accession"] + present, dtype=str)
 
 # Filter out rows that do not contain geolocation information
-df = df[df['lat_lon'] != '0101000020E61000000AD7A3703D4A41C06666666666660CC0']
-
-for _, row in df.iterrows():
-    metadata_dict[row["accession"]] = {
-        "Country": row.get("atribute_name", ""),
-        "lat_lon": row.get("attribute_value", ""),
-        "WKT": row.get("lat_lon", ""),
-        "elevation": row.get("elevation", ""),
-        "country_abv": row.get("country", ""),
-        "biome": row.get("biome", ""),
-        "geoloc_confidence_0-6": row.get("confidence", "")
-    }
-
-log_progress("Metadata loading complete")
-
-# Step 2: Process the large alignment file in chunks and merge
-output_file = "./data/card_metadata_aro_geolocation.csv"
+geo = geo[geo['lat_lon'] != '0101000020E61000000AD7A3703D4A41C06666666666660CC0']
+
+# Columns missing from this release are kept empty, same as before
+for c in geo_columns:
+    if c not in geo.columns:
+        geo[c] = ""
+
+geo = (
+    geo.drop_duplicates(subset="accession", keep="last")
+       .set_index("accession")
+       [list(geo_columns)]
+       .rename(columns=geo_columns)
+)
+
+log_progress(f"Metadata loading complete. {len(geo)} biosamples with geolocation")
+
+# Step 2: Stream the hit table and join each chunk on sample_name
 first_chunk = True  # To write the header only once
 total_processed = 0
+seen_biosamples = pd.Index([], dtype=object)
 start_time = time.time()
 
-for i, chunk in enumerate(pd.read_csv("./data/card_metadata_aro.csv", dtype=str, chunksize=2000000)):
+reader = pd.read_csv(hits_file, dtype=str, chunksize=chunk_size,
+                     usecols=["sample_name"] if output_mode == "per_biosample" else None)
+
+for i, chunk in enumerate(reader):
     chunk_start = time.time()
     log_progress(f"Processing alignment chunk {i+1}")
-    
-    # Merge by mapping sample_name to metadata_dict
-    chunk = chunk.assign(**{
-        "Country": chunk["sample_name"].map(lambda x: metadata_dict.get(x, {}).get("Country", "")),
-        "lat_lon": chunk["sample_name"].map(lambda x: metadata_dict.get(x, {}).get("lat_lon", "")),
-        "WKT": chunk["sample_name"].map(lambda x: metadata_dict.get(x, {}).get("WKT", "")),
-        "elevation": chunk["sample_name"].map(lambda x: metadata_dict.get(x, {}).get("elevation", "")),
-        "country_abv": chunk["sample_name"].map(lambda x: metadata_dict.get(x, {}).get("country_abv", "")),
-        "biome": chunk["sample_name"].map(lambda x: metadata_dict.get(x, {}).get("biome", "")),
-        "geoloc_confidence_0-6": chunk["sample_name"].map(lambda x: metadata_dict.get(x, {}).get("geoloc_confidence_0-6", ""))
-    })
-    
-    # Save merged chunk
-    chunk.to_csv(output_file, mode='w' if first_chunk else 'a', index=False, header=first_chunk)
-    first_chunk = False  # Ensure only the first chunk writes headers
-    
+
+    if output_mode == "per_biosample":
+        # Only the biosample keys are needed; geolocation is written once at the end
+        seen_biosamples = seen_biosamples.union(pd.Index(chunk["sample_name"].dropna().unique()))
+    else:
+        # One keyed join instead of a dictionary lookup per row and column
+        chunk = chunk.join(geo, on="sample_name")
+        chunk[list(geo_columns.values())] = chunk[list(geo_columns.values())].fillna("")
+
+        # Save merged chunk
+        chunk.to_csv(output_file, mode='w' if first_chunk else 'a', index=False, header=first_chunk)
+        first_chunk = False  # Ensure only the first chunk writes headers
+
     total_processed += len(chunk)
     log_progress(f"Chunk {i+1} processed in {time.time() - chunk_start:.2f} seconds")
 
-log_progress(f"Processing complete. Total records processed: {total_processed}")
\ No newline at end of file
+if output_mode == "per_biosample":
+    biosample_geo = geo.loc[geo.index.intersection(seen_biosamples)]
+    biosample_geo.rename_axis("sample_name").to_csv(biosample_output_file)
+    log_progress(f"Wrote geolocation for {len(biosample_geo)} of {len(seen_biosamples)} "
+                 f"biosamples to {biosample_output_file}")
+
+log_progress(f"Processing complete. Total records processed: {total_processed} "
+             f"in {time.time() - start_time:.2f} seconds")
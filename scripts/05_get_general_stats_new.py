@@ -1,105 +1,150 @@
 import pandas as pd
+import numpy as np
 import sys
 sys.stdout.flush()
 
+# Only keep assay types that contain most of the genome/gene sequences
+assay_types_to_keep = [
+    "WGS", "WGA", "RNA-Seq", "Synthetic-Long-Read",
+    "WCS", "Hi-C", "ssRNA-seq", "FL-cDNA", "EST",
+    "CLONE", "CLONEEND", "POOLCLONE"
+]
+
+# Organisms that fall into one of the metagenome categories
+metagenome_category_organisms = [
+    "human gut metagenome", "human metagenome", "human oral metagenome", "human skin metagenome",
+    "human feces metagenome", "human vaginal metagenome", "human nasopharyngeal metagenome",
+    "human lung metagenome", "human saliva metagenome", "human reproductive system metagenome",
+    "human urinary tract metagenome", "human eye metagenome", "human blood metagenome",
+    "human bile metagenome", "human tracheal metagenome", "human brain metagenome",
+    "human milk metagenome", "human semen metagenome", "human skeleton metagenome",
+    "bovine gut metagenome", "bovine metagenome", "pig gut metagenome", "pig metagenome",
+    "chicken gut metagenome", "chicken metagenome", "sheep gut metagenome", "sheep metagenome",
+    "fish metagenome", "fish gut metagenome",
+    "marine metagenome", "seawater metagenome",
+    "freshwater metagenome", "lake water metagenome", "groundwater metagenome",
+    "soil metagenome",
+    "wastewater metagenome",
+    "plant metagenome", "root metagenome", "leaf metagenome"
+]
+
+# One bit per funnel criterion, in funnel order.
+# The later criteria are cumulative on the row level (a row only counts as
+# "metagenome" if it also has date and continent), same as before.
+funnel_bits = [
+    "available",
+    "col_date_available",
+    "continent_available",
+    "date_and_continent_available",
+    "metagenome_available",
+    "metagenome_assaytype_available",
+    "metagenome_category_available",
+]
+
+usecols = ["acc", "collection_date_sam", "geo_loc_name_country_continent_calc",
+           "organism", "assay_type"]
+
+
+def row_bitmask(chunk):
+    """Return one uint8 per row with a bit set for every funnel criterion the row passes."""
+    date_mask = (chunk['collection_date_sam'].notna() &
+                 (chunk['collection_date_sam'] != 'uncalculated'))
+    continent_mask = (chunk['geo_loc_name_country_continent_calc'].notna() &
+                      (chunk['geo_loc_name_country_continent_calc'] != 'uncalculated'))
+    continentdate_mask = continent_mask & date_mask
+    metagenome_mask = (chunk['organism'].str.contains("metagenome", case=False, na=False) &
+                       continentdate_mask)
+    metagenome_assaytype_mask = chunk['assay_type'].isin(assay_types_to_keep) & metagenome_mask
+    metagenomecategory_mask = (chunk['organism'].isin(metagenome_category_organisms) &
+                               metagenome_assaytype_mask)
+
+    masks = [
+        np.ones(len(chunk), dtype=bool),
+        date_mask.to_numpy(),
+        continent_mask.to_numpy(),
+        continentdate_mask.to_numpy(),
+        metagenome_mask.to_numpy(),
+        metagenome_assaytype_mask.to_numpy(),
+        metagenomecategory_mask.to_numpy(),
+    ]
+    bits = np.zeros(len(chunk), dtype=np.uint8)
+    for b, m in enumerate(masks):
+        bits |= m.astype(np.uint8) << b
+    return bits
+
+
+def accession_bitmasks(csv_path, chunk_size=30000000):
+    """
+    Stream a table with the funnel columns and OR the row bitmasks per accession.
+
+    Works for both the AMR hit table and the SRA metadata table.
+    Memory is one accession index plus one byte per distinct accession.
+    Returns (accession Index, uint8 array of bitmasks, number of rows read).
+    """
+    acc_index = pd.Index([], dtype=object)
+    acc_bits = np.zeros(0, dtype=np.uint8)
+    total_rows = 0
+
+    reader = pd.read_csv(csv_path, usecols=usecols, dtype=str,
+                         chunksize=chunk_size, low_memory=False)
+    for i, chunk in enumerate(reader):
+        total_rows += len(chunk)
+        chunk = chunk[chunk['acc'].notna()]
+
+        # Reduce to one mask per accession inside the chunk first
+        codes, uniques = pd.factorize(chunk['acc'])
+        chunk_bits = np.zeros(len(uniques), dtype=np.uint8)
+        np.bitwise_or.at(chunk_bits, codes, row_bitmask(chunk))
+
+        # Map chunk accessions to the global index, appending the new ones
+        pos = acc_index.get_indexer(uniques)
+        new = pos == -1
+        if new.any():
+            pos[new] = np.arange(len(acc_index), len(acc_index) + new.sum())
+            acc_index = acc_index.append(pd.Index(uniques[new]))
+            acc_bits = np.concatenate([acc_bits, np.zeros(new.sum(), dtype=np.uint8)])
+        acc_bits[pos] |= chunk_bits
+
+        print(f"Processed chunk {i+1} with {len(chunk)} rows, {len(acc_index)} accessions so far")
+
+    return acc_index, acc_bits, total_rows
+
+
+def funnel_counts(acc_bits):
+    """Number of accessions with each funnel bit set."""
+    return {name: int(np.count_nonzero(acc_bits & (1 << b)))
+            for b, name in enumerate(funnel_bits)}
+
+
 def process_csv_files(sra_metadata_path, card_metadata_path, chunk_size=30000000):
-    # Initialize counters and sets
-    total_sra_count = 0
-    unique_accessions = set()
-    with_dates = set()
-    with_continent = set()
-    with_date_continent = set()
-    with_metagenome = set()
-    with_metagenome_assaytype = set()
-    with_metagenomecategory = set()
-
-    # Process SRA_metadata.csv to get total count
+    # SRA side: same pass, only the funnel columns are read
     print("Processing SRA_metadata.csv...")
-    for chunk in pd.read_csv(sra_metadata_path, chunksize=chunk_size, low_memory=False):
-        total_sra_count += len(chunk)
+    _, sra_bits, total_sra_count = accession_bitmasks(sra_metadata_path, chunk_size)
+    sra_funnel = funnel_counts(sra_bits)
     print(f"Total SRA entries: {total_sra_count}")
-    
-    # Process card_metadata_filtered.csv
+
+    # AMR side
     print("Processing card_metadata_aro.csv...")
-    
-    # Create the iterator outside the loop
-    chunks_iterator = pd.read_csv(card_metadata_path, chunksize=chunk_size, low_memory=False)
-
-
-    for i, chunk in enumerate(chunks_iterator):
-        # Process accessions
-        acc_values = chunk['acc'].dropna().unique()
-        unique_accessions.update(acc_values)
-        
-        # Identify rows with dates
-        date_mask = chunk['collection_date_sam'].notna() & chunk['collection_date_sam'] != 'uncalculated'
-        date_rows = chunk[date_mask]
-        date_accs = date_rows['acc'].unique()
-        with_dates.update(date_accs)
-        
-        # Identify rows with continent
-        continent_mask = chunk['geo_loc_name_country_continent_calc'].notna() & chunk['geo_loc_name_country_continent_calc'] != 'uncalculated'
-        continent_accs = chunk.loc[continent_mask, 'acc'].unique()
-        with_continent.update(continent_accs)
-        
-         # Identify rows with continent and date
-        continentdate_mask = continent_mask & date_mask
-        continentdate_accs = chunk.loc[continentdate_mask, 'acc'].unique()
-        with_date_continent.update(continentdate_accs)
-
-        # Identify rows with metagenome        
-        metagenome_mask = chunk['organism'].notna() & chunk['organism'].str.contains("metagenome", case=False) & continentdate_mask
-        metagenome_accs = chunk.loc[metagenome_mask, 'acc'].unique()
-        with_metagenome.update(metagenome_accs)
-
-        # Identify rows with metagenome and assay type
-        metagenome_assaytype_mask = chunk['assay_type'].notna() & \
-            chunk['assay_type'].isin([
-                "WGS", "WGA", "RNA-Seq", "Synthetic-Long-Read",
-                "WCS", "Hi-C", "ssRNA-seq", "FL-cDNA", "EST",
-                "CLONE", "CLONEEND", "POOLCLONE"
-            ]) & metagenome_mask
-        metagenome_assaytype_accs = chunk.loc[metagenome_assaytype_mask, 'acc'].unique()
-        with_metagenome_assaytype.update(metagenome_assaytype_accs)
-
-        # Identify rows with metagenome category
-        metagenomecategory_mask = chunk['organism'].notna() & chunk['organism'].isin([
-            "human gut metagenome", "human metagenome", "human oral metagenome", "human skin metagenome",
-            "human feces metagenome", "human vaginal metagenome", "human nasopharyngeal metagenome",
-            "human lung metagenome", "human saliva metagenome", "human reproductive system metagenome",
-            "human urinary tract metagenome", "human eye metagenome", "human blood metagenome",
-            "human bile metagenome", "human tracheal metagenome", "human brain metagenome",
-            "human milk metagenome", "human semen metagenome", "human skeleton metagenome",
-            "bovine gut metagenome", "bovine metagenome", "pig gut metagenome", "pig metagenome",
-            "chicken gut metagenome", "chicken metagenome", "sheep gut metagenome", "sheep metagenome",
-            "fish metagenome", "fish gut metagenome", 
-            "marine metagenome", "seawater metagenome",
-            "freshwater metagenome", "lake water metagenome", "groundwater metagenome",
-            "soil metagenome",
-            "wastewater metagenome",
-            "plant metagenome", "root metagenome", "leaf metagenome"
-        ]) & metagenome_assaytype_mask
-        metagenomecategory_accs = chunk.loc[metagenomecategory_mask, 'acc'].unique()
-        with_metagenomecategory.update(metagenomecategory_accs)
-
-        print(f"Processed chunk {i+1} with {len(chunk)} rows")
-    
+    _, amr_bits, _ = accession_bitmasks(card_metadata_path, chunk_size)
+    amr_funnel = funnel_counts(amr_bits)
 
     # Create summary table
     summary_df = pd.DataFrame({
         "Total_SRA": [total_sra_count],
-        "Samples_with_AMR": [len(unique_accessions)],
-        "col_date_available": [len(with_dates)],
-        "continent_available": [len(with_continent)],
-        "date_and_continent_available": [len(with_date_continent)],
-        "metagenome_available": [len(with_metagenome)],
-        "metagenome_assaytype_available": [len(with_metagenome_assaytype)],
-        "metagenome_category_available": [len(with_metagenomecategory)]
+        "Samples_with_AMR": [amr_funnel["available"]],
+        **{name: [amr_funnel[name]] for name in funnel_bits[1:]}
     })
-    
+
+    sra_summary_df = pd.DataFrame({
+        "Total_SRA": [total_sra_count],
+        "Unique_SRA_accessions": [sra_funnel["available"]],
+        **{name: [sra_funnel[name]] for name in funnel_bits[1:]}
+    })
+
     # Save summary to CSV
     summary_df.to_csv('../data/summary_statistics_new.csv', index=False)
-    
+    sra_summary_df.to_csv('../data/summary_statistics_sra_new.csv', index=False)
+
     return summary_df
 
 # Example usage
@@ -107,7 +152,7 @@ if __name__ == "__main__":
     # Replace with actual file paths
     sra_path = "../data/SRA_metadata_before20231211.csv"
     card_path = "../data/card_metadata_aro_geolocation.csv"
-    
+
     # Adjust chunk size based on available memory
     result = process_csv_files(sra_path, card_path, chunk_size=30000000)
-    print(result)
\ No newline at end of file
+    print(result)
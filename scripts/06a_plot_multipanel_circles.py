@@ -2,19 +2,29 @@ import pandas as pd
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
-from statsmodels.nonparametric.smoothers_lowess import lowess
+from trend_stats import lowess_curves, curve_dict
+from prevalence_cube import load_cube, prevalence, positive_dims, total_dims
+from svg_output import save_hybrid_svg
+
+# SVG output: bubbles and LOWESS curves embedded as an image, text stays vector
+svg_raster_dpi = 300
+svg_compare    = False    # True: also time an all-vector SVG and print both sizes
 
 # --------------------------------------------------------------------
 # 0 PRE-PROCESSING DATA
 # --------------------------------------------------------------------
 
-# Input table
-amr_df = pd.read_csv(
+# Input tables as prevalence cubes: one bitmap of accessions per
+# collection quarter × continent × metagenome category (× drug class for
+# the AMR hits), built once and cached next to the CSVs. Rows without a
+# date, continent or metagenome category are left out, and every
+# ARO_DrugClass entry is split on ';' (most AMR notations specify
+# different drug resistance for one same marker).
+amr_cube = load_cube(
     "../data/full_card_metadata_aro_allfilters_metagenomes2.csv",
-    low_memory=False)
+    positive_dims)
 
-sra_df = pd.read_csv("../data/SRA_metadata_allfilters.csv", 
-    low_memory=False)
+sra_cube = load_cube("../data/SRA_metadata_allfilters.csv", total_dims)
 
 # Only keep most relevant drug classes (9)
 drug_classes_to_keep = {
@@ -25,95 +35,38 @@ drug_classes_to_keep = {
     "glycylcycline", "cephalosporin"
 }
 
-# Function to prepare tables to have date / location / metagenome category
-def date_collection_metagenome(df):
-    df = df.copy()
-    df['collection_date_sam'] = pd.to_datetime(
-        df['collection_date_sam'].str.strip('[]'),
-        errors='coerce')
-    df = df.dropna(subset=['collection_date_sam',
-                           'metagenome_category'])
-    df['year_bin'] = df['collection_date_sam'].dt.year # Generate yearly bins
-    return df
-
-amr_df = date_collection_metagenome(amr_df)
-sra_df = date_collection_metagenome(sra_df)
-
-# Get individual instances for each drug class 
-# (given that most AMR notations will specify different drug resistance for one same marker)
-amr_df = (
-    amr_df.assign(ARO_DrugClass=amr_df['ARO_DrugClass'].dropna().str.split(';'))
-      .explode('ARO_DrugClass')
-      .query("ARO_DrugClass in @drug_classes_to_keep")
-)
-
 # --------------------------------------------------------------------
 # 1 CREATE COUNTS AND SET NORMALIZATION
 # --------------------------------------------------------------------
 
-SAMPLE_ID = 'acc'
-
-## Count total number of samples per continent / year / metagenome
-total_samples_df = (
-    sra_df
-      .drop_duplicates(subset=[SAMPLE_ID])
-      .groupby(['geo_loc_name_country_continent_calc',
-                'metagenome_category',
-                'year_bin'], as_index=False)
-      .agg(total_samples=(SAMPLE_ID, 'count'))
-)
+cube_columns = {"drug_class": "ARO_DrugClass",
+                "continent":  "geo_loc_name_country_continent_calc",
+                "year":       "year_bin",
+                "positive":   "positive_samples",
+                "total":      "total_samples"}
 
-## Count positive samples for each drug class
-# If a specific accession has one hit or more -> included
-# We count a specific time in 
-positive_samples_df = (
-    amr_df
-      .drop_duplicates(subset=[SAMPLE_ID, 'ARO_DrugClass']) # ≥1 hit -> 1 flag
-      .groupby(['ARO_DrugClass',
-                'geo_loc_name_country_continent_calc',
-                'metagenome_category',
-                'year_bin'], as_index=False)
-      .agg(positive_samples=(SAMPLE_ID, 'count'))
+## Positive samples for each drug class over total samples per continent / year / metagenome
+# If a specific accession has one hit or more -> included (distinct accessions per cell)
+continent_data = (
+    prevalence(amr_cube, sra_cube,
+               ["drug_class", "continent", "metagenome_category", "year"],
+               where={"drug_class": drug_classes_to_keep})
+      .reset_index()
+      .rename(columns=cube_columns)
 )
 # Before I had .query("positive_samples >= 3")
 # It might be too strict on continents with very few data, and too lax for the big sampled ones
 
-## Merge counts and calculate prevalence
-#Continent data
-continent_data = (
-    positive_samples_df
-      .merge(total_samples_df,
-             on=['geo_loc_name_country_continent_calc',
-                 'metagenome_category',
-                 'year_bin'],
-             how='left', validate='many_to_one')
-      .assign(prevalence=lambda d: d.positive_samples / d.total_samples)
-)
-
-# Worldwide data
-world_total = (
-    total_samples_df
-      .groupby(['metagenome_category', 'year_bin'], as_index=False)
-      .agg(total_samples=('total_samples', 'sum'))
+# Worldwide data: union of the continent cells
+world_data = (
+    prevalence(amr_cube, sra_cube,
+               ["drug_class", "metagenome_category", "year"],
+               where={"drug_class": drug_classes_to_keep})
+      .reset_index()
+      .rename(columns=cube_columns)
       .assign(geo_loc_name_country_continent_calc='Worldwide')
 )
 
-world_pos = (
-    positive_samples_df
-      .groupby(['ARO_DrugClass', 'metagenome_category', 'year_bin'],
-               as_index=False)
-      .agg(positive_samples=('positive_samples', 'sum'))
-      .assign(geo_loc_name_country_continent_calc='Worldwide')
-)
-
-world_data = (world_pos
-    .merge(world_total,
-           on=['geo_loc_name_country_continent_calc',
-               'metagenome_category', 'year_bin'],
-           how='left')
-    .assign(prevalence=lambda d: d.positive_samples / d.total_samples)
-)
-
 # Combine both continent and worldwide data
 dot_data = pd.concat([continent_data, world_data], ignore_index=True)
 
@@ -125,6 +78,25 @@ dot_data = pd.concat([continent_data, world_data], ignore_index=True)
 # I chose to not filter bins and increase size range of bubbles so that the small data ones will look very very small
 # Moreover, the LOWESS line has reduced opacity and one can visualize if there are big areas with no data points.
 
+# --------------------------------------------------------------------
+# 1b LOWESS TRENDS (cached)
+# --------------------------------------------------------------------
+# One curve per (drug class, continent, metagenome category) with ≥ 5
+# points (LOWESS needs ≥ 3; 5 for better smoothing). The curves are kept
+# in lowess_cache and only refitted for groups whose points or frac
+# changed, so re-rendering the figures does not redo the smoothing.
+lowess_frac    = 0.55         # smoothing window [0-1]
+lowess_cache   = "../data/lowess_curves_multipanel.pkl"
+lowess_workers = 1            # > 1 fits in a process pool
+
+trend_keys = ['ARO_DrugClass', 'geo_loc_name_country_continent_calc',
+              'metagenome_category']
+curves = curve_dict(
+    lowess_curves(dot_data, trend_keys, 'year_bin', 'prevalence',
+                  frac=lowess_frac, min_points=5,
+                  cache_path=lowess_cache, n_workers=lowess_workers),
+    trend_keys, 'year_bin')
+
 # --------------------------------------------------------------------
 # 2 FACETTED BUBBLE PLOT
 # --------------------------------------------------------------------
@@ -172,19 +144,12 @@ for (row_label, col_label), ax in g.axes_dict.items():
         ax.set_axis_off() # keep grid tidy if facet is empty
         continue
 
-    # fit + plot one LOWESS curve per metagenome category
-    # one LOWESS curve per metagenome category
-    for cat, grp in sub.groupby('metagenome_category'):
-        if len(grp) < 5: # LOWESS needs ≥ 3 points (changed to 5 for better smoothing)
+    # plot one cached LOWESS curve per metagenome category
+    for cat in sorted(sub['metagenome_category'].unique()):
+        if (drug, cont, cat) not in curves: # fewer than 5 points
             continue
-        pts = grp.sort_values('year_bin')
-        z   = lowess(
-                endog = pts['prevalence'],
-                exog  = pts['year_bin'],
-                frac  = 0.55, # smoothing window [0-1]
-                return_sorted=True
-        )
-        ax.plot(z[:, 0], z[:, 1],
+        x, y = curves[(drug, cont, cat)]
+        ax.plot(x, y,
                 color     = color_dict[cat],
                 linewidth = 5,
                 alpha     = .85, # translucent / overlaps visible
@@ -255,7 +220,8 @@ plt.close(leg_fig)
 # export the main multi-panel plot
 plt.tight_layout()
 g.savefig("../data/bubbles_lowess_faceted2_smaller.png", dpi=600)
-g.savefig("../data/bubbles_lowess_faceted2.svg")
+save_hybrid_svg(g, "../data/bubbles_lowess_faceted2.svg",
+                raster_dpi=svg_raster_dpi, compare=svg_compare)
 
 
 # --------------------------------------------------------------------
@@ -305,12 +271,9 @@ for cat in sorted(dot_data["metagenome_category"].unique()):
             ax.set_axis_off()
             continue
         
-        if len(pts) >= 5:              # need ≥5 for smoother curve
-            smoothed = lowess(pts["prevalence"],
-                              pts["year_bin"],
-                              frac=0.55,
-                              return_sorted=True)
-            ax.plot(smoothed[:, 0], smoothed[:, 1],
+        if (drug, cont, cat) in curves:    # need ≥5 for smoother curve
+            x, y = curves[(drug, cont, cat)]
+            ax.plot(x, y,
                     color     = color_dict[cat],
                     linewidth = 5,
                     alpha     = .85,
@@ -342,7 +305,8 @@ for cat in sorted(dot_data["metagenome_category"].unique()):
     # --- d. export ----------------------------------------------------
     base = slugify(cat)
     g_cat.savefig(out_dir / f"bubbles_lowess_faceted_{base}_smaller.png", dpi=600)
-    g_cat.savefig(out_dir / f"bubbles_lowess_faceted_{base}.svg")
+    save_hybrid_svg(g_cat, str(out_dir / f"bubbles_lowess_faceted_{base}.svg"),
+                    raster_dpi=svg_raster_dpi, compare=svg_compare)
     plt.close(g_cat.figure)          # important to free memory in long loops
 
 print("Per-category figures saved to:", out_dir.resolve())
@@ -387,13 +351,10 @@ for (row_lab, col_lab), ax in g_world.axes_dict.items():
     if pts.empty:
         ax.set_axis_off()
         continue
-    if len(pts) >= 5:
-        smoothed = lowess(
-            pts["prevalence"], pts["year_bin"],
-            frac=0.55, return_sorted=True
-        )
+    if (drug, "Worldwide", cat) in curves:
+        x, y = curves[(drug, "Worldwide", cat)]
         ax.plot(
-            smoothed[:, 0], smoothed[:, 1],
+            x, y,
             color     = color_dict[cat],
             linewidth = 5,
             alpha     = .85,
@@ -454,4 +415,5 @@ plt.close(leg_fig)
 # --- F. export the main figure ----------------------------------------------
 plt.tight_layout()
 g_world.savefig("../data/bubbles_lowess_worldwide.png", dpi=600)
-g_world.savefig("../data/bubbles_lowess_worldwide.svg")
\ No newline at end of file
+save_hybrid_svg(g_world, "../data/bubbles_lowess_worldwide.svg",
+                raster_dpi=svg_raster_dpi, compare=svg_compare)
\ No newline at end of file
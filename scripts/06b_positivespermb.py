@@ -1,38 +1,36 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+from accession_table import load_accession_table, to_days, day_bins, no_day
+from trend_stats import moment_sums, moment_stats
 
 # --------------------------------------------------------------------
 # 0 PRE-PROCESSING DATA
 # --------------------------------------------------------------------
 
-# Input table
-amr_df = pd.read_csv(
-    "../data/full_card_metadata_aro_allfilters_metagenomes2.csv",
-    low_memory=False)
-
-sra_df = pd.read_csv("../data/SRA_metadata_allfilters.csv", 
-    low_memory=False)
-
-# Function to prepare tables to have date as year bins
-def date_collection(df):
-    df = df.copy()
-    df['collection_date_sam'] = pd.to_datetime(
-        df['collection_date_sam'].str.strip('[]'),
-        errors='coerce')
-    df = df.dropna(subset=['collection_date_sam'])
-    df['year_bin'] = df['collection_date_sam'].dt.year.astype('Int64') # Generate yearly bins
-    return df
+# The SRA table reduced to one row per accession (collection day,
+# continent, metagenome category, mbases), cached next to the CSV
+sra_acc = load_accession_table("../data/SRA_metadata_allfilters.csv")
 
-def clean_mb(df): # Keep only rows with valid mbases > 0
-    df = df.copy()
-    df['mbases'] = pd.to_numeric(df['mbases'], errors='coerce')
-    df = df[df['mbases'].notna() & (df['mbases'] > 0)]
+def clean_mb(df): # Keep only rows with a collection date and valid mbases > 0
+    df = df[(df['collection_day'] != no_day) &
+            df['mbases'].notna() & (df['mbases'] > 0)].copy()
+    df['year_bin'] = day_bins(df['collection_day'], "Y") # Generate yearly bins
     return df
 
-amr_df = date_collection(amr_df)
-sra_df = date_collection(sra_df)
-sra_df = clean_mb(sra_df)
+def hit_counts(csv_path, accs, chunk_size=3_000_000):
+    """Hits per accession in accs, streamed from the hit table (hits without a collection date are skipped)."""
+    index  = pd.Index(accs)
+    counts = np.zeros(len(index), dtype=np.int64)
+    reader = pd.read_csv(csv_path, usecols=['acc', 'collection_date_sam'],
+                         dtype=str, chunksize=chunk_size)
+    for chunk in reader:
+        dated = chunk.loc[to_days(chunk['collection_date_sam']) != no_day, 'acc']
+        pos   = index.get_indexer(dated)
+        counts += np.bincount(pos[pos >= 0], minlength=len(index))
+    return counts
+
+sra_acc = clean_mb(sra_acc)
 
 '''
 ## Debugging
@@ -58,43 +56,30 @@ print(sra_df.loc[bad, 'year_bin'].value_counts().sort_index())
 
 SAMPLE_ID = 'acc'
 SAMPLE_SIZE = 'mbases'
+STRATA = ['continent', 'metagenome_category']
 
-# count hits per sample (amr_df may have ≥1 row per hit)
-hits_per_sample = (amr_df
-                   .groupby(SAMPLE_ID)
-                   .size()
-                   .rename('hit_count')
-                   .reset_index())
-
-# bring in mbases for every sample; samples with no hits get hit_count = 0
-samples = (sra_df[[SAMPLE_ID, SAMPLE_SIZE, 'year_bin']]
-           .merge(hits_per_sample, on=SAMPLE_ID, how='left')
-           .fillna({'hit_count': 0}))
+# hits per sample, one pass over the hit table; samples with no hits get hit_count = 0
+samples = sra_acc[[SAMPLE_ID, SAMPLE_SIZE, 'year_bin'] + STRATA].copy()
+samples['hit_count'] = hit_counts(
+    "../data/full_card_metadata_aro_allfilters_metagenomes2.csv", samples[SAMPLE_ID])
 
 # rate per sample
-samples['hits_per_mb'] = samples['hit_count'] / samples[SAMPLE_SIZE]
+samples['hits_per_mb'] = samples['hit_count'] / samples[SAMPLE_SIZE].astype(np.float64)
+samples['positive']    = samples['hit_count'] > 0
 
 # --------------------------------------------------------------------
 # 2 STATS PER YEAR BIN
 # --------------------------------------------------------------------
-def summarise(group):
-    n  = len(group)
-    mu = group['hits_per_mb'].mean()
-    sd = group['hits_per_mb'].std(ddof=1)
-    se = sd / np.sqrt(n)
-    return pd.Series({'mean': mu, 'sd': sd, 'se': se, 'n': n})
-
-all_stats = (
-    samples
-    .groupby('year_bin')
-    .apply(summarise, include_groups=False)
-)
-
-pos_stats = (
-    samples[samples['hit_count'] > 0]
-    .groupby('year_bin')
-    .apply(summarise, include_groups=False)
-)
+# n, Σx, Σx² per year / continent / category / positive once; every
+# summary below is a sum over these cells
+sums = moment_sums(samples, ['year_bin'] + STRATA + ['positive'], 'hits_per_mb')
+
+def summarise(by, positives_only=False):
+    cells = sums[sums.index.get_level_values('positive')] if positives_only else sums
+    return moment_stats(cells.groupby(level=by, dropna=False).sum())
+
+all_stats = summarise('year_bin')
+pos_stats = summarise('year_bin', positives_only=True).reindex(all_stats.index)
 
 # --------------------------------------------------------------------
 # 3  PLOT
@@ -144,3 +129,11 @@ summary = (pd.concat({'all': all_stats, 'positive': pos_stats},
            .swaplevel(axis=1))
 
 summary.to_csv("../data/positives_per_mb_summary.csv")
+
+# same statistics per continent and per metagenome category
+for stratum in STRATA:
+    strat = (pd.concat({'all': summarise(['year_bin', stratum]),
+                        'positive': summarise(['year_bin', stratum], positives_only=True)},
+                       axis=1, names=['group', None])
+             .swaplevel(axis=1))
+    strat.to_csv(f"../data/positives_per_mb_summary_{stratum}.csv")
@@ -1,31 +1,15 @@
-import pandas as pd
 import seaborn as sns          # only for the palette used in circles plot
 import matplotlib.pyplot as plt
 import numpy as np
+from accession_table import load_accession_table, discovery_counts
 
 # --------------------------------------------------------------------
 # 0 PRE-PROCESSING DATA
 # --------------------------------------------------------------------
 
-# Input table
-amr_df = pd.read_csv(
-    "../data/full_card_metadata_aro_allfilters_metagenomes2.csv",
-    low_memory=False)
-
-# Function to prepare tables to have date as year bins
-def date_collection(df):
-    df = df.copy()
-    df['collection_date_sam'] = pd.to_datetime(
-        df['collection_date_sam'].str.strip('[]'),
-        errors='coerce')
-    df = df.dropna(subset=['collection_date_sam'])
-    df['quarter_bin'] = (
-        df['collection_date_sam']
-            .dt.to_period('Q') # Generate 4 bins per year
-    )
-    return df
-
-amr_df = date_collection(amr_df)
+# Input table, reduced to one row per accession (cached next to the CSV)
+amr_acc = load_accession_table(
+    "../data/full_card_metadata_aro_allfilters_metagenomes2.csv")
 
 '''
 ## Debugging
@@ -49,12 +33,8 @@ print(sra_df.loc[bad, 'year_bin'].value_counts().sort_index())
 # 1 PLOT DISCOVERY TIMELINE OF AMRs ON SAMPLES WITHIN METAGENOME_CATEGORY
 # --------------------------------------------------------------------
 
-per_quarter = (
-    amr_df
-      .groupby("quarter_bin")["acc"]
-      .nunique()                 # unique AMR-positive samples
-      .sort_index()              # ensures chronological order
-)
+# unique AMR-positive samples per collection quarter, in chronological order
+per_quarter = discovery_counts(amr_acc, date="collection_day", freq="Q")
 
 fig, ax = plt.subplots(figsize=(12, 4))
 per_quarter.plot.bar(ax=ax, width=0.9)
@@ -79,13 +59,9 @@ plt.close()
 # 1 SAME, BUT COLOR STACK BARS BY METAGENOME CATEGORY
 # --------------------------------------------------------------------
 
-quarter_cat = (
-    amr_df
-      .groupby(["quarter_bin", "metagenome_category"])["acc"]
-      .nunique()               # count distinct accessions
-      .unstack(fill_value=0)   # columns = categories
-      .sort_index()            # chronological order
-)
+# distinct accessions, columns = categories
+quarter_cat = discovery_counts(amr_acc, date="collection_day", freq="Q",
+                               by="metagenome_category")
 
 n_cols  = quarter_cat.shape[1]
 cblind  = sns.color_palette("colorblind", n_colors=n_cols)
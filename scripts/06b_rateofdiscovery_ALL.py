@@ -1,69 +1,23 @@
-import pandas as pd
 import matplotlib.pyplot as plt
-from collections import defaultdict
 import numpy as np
-
-# Function to prepare tables to have date as year bins
-def date_collection(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df['collection_date_sam'] = pd.to_datetime(
-        df['collection_date_sam'].str.strip('[]'),
-        errors='coerce')
-    df = df.dropna(subset=['collection_date_sam'])
-    df['quarter_bin'] = (
-        df['collection_date_sam']
-            .dt.to_period('Q') # Generate 4 bins per year
-    )
-    return df
-
-# Function to classify sample into Metagenome or Isolate
-def classify_sample(df: pd.DataFrame) -> pd.DataFrame:
-    # Add 'sample_type' = 'Metagenome' or 'Isolate'
-    is_meta = df["organism"].str.contains("metagenome", case=False, na=False)
-    df = df.copy()
-    df["sample_type"] = is_meta.map({True: "Metagenome", False: "Isolate"})
-    return df
+from accession_table import load_accession_table, discovery_counts
 
 # --------------------------------------------------------------------
 # 0 PROCESSING DATA
 # --------------------------------------------------------------------
 
-# collect accessions, one to collapse only on quarter, and another also on sample type
-seen = defaultdict(set)
-totals = defaultdict(set)
-
-# Input table
-for chunk in pd.read_csv(
+# One row per accession with its collection day and organism type
+# (Metagenome if the organism name contains "metagenome", else Isolate).
+# Built once by streaming the hit table, then loaded from the cache.
+acc_table = load_accession_table(
     "../data/new_full_card_metadata_aro_dateloc_organism.csv",
-    chunksize=80000000,
-    low_memory=False
-    ):
-
-    chunk = date_collection(chunk)
-    chunk = classify_sample(chunk)
-
-    grouped = (
-        chunk.groupby(["quarter_bin", "sample_type"])["acc"]
-              .apply(set)
-    )
-
-    for key, acc_set in grouped.items():
-        seen[key].update(acc_set)
+    chunk_size=80000000)
 
 # --------------------------------------------------------------------
 # 1 PLOT DISCOVERY TIMELINE OF AMRs ON ALL SAMPLES
 # --------------------------------------------------------------------
 
-# seen keys are (quarter_bin, sample_type).  Collapse on quarter only
-totals = defaultdict(set)
-
-for (q, _type), accs in seen.items():
-    totals[q].update(accs)          # merge sets so accessions stay unique
-
-per_quarter = (
-    pd.Series({q: len(accs) for q, accs in totals.items()}, name="unique_accessions")
-      .sort_index()
-)
+per_quarter = discovery_counts(acc_table, date="collection_day", freq="Q")
 
 fig, ax = plt.subplots(figsize=(12, 4))
 per_quarter.plot.bar(ax=ax, width=0.9)
@@ -88,18 +42,8 @@ plt.close()
 # 1 SAME, BUT COLOR STACK BARS BY ORGANISM CATEGORY (METAGENOME OR ISOLATE)
 # --------------------------------------------------------------------
 
-records = [
-    {"quarter_bin": q, "sample_type": t, "unique_accessions": len(accs)}
-    for (q, t), accs in seen.items()
-]
-
-quarter_type = (
-    pd.DataFrame(records)
-      .pivot(index="quarter_bin", columns="sample_type", values="unique_accessions")
-      .fillna(0)
-      .astype(int)
-      .sort_index()
-)
+quarter_type = discovery_counts(acc_table, date="collection_day", freq="Q",
+                                by="organism_type")
 
 for col in ["Metagenome", "Isolate"]:
     quarter_type[col] = quarter_type.get(col, 0)
@@ -7,14 +7,16 @@ import numpy as np
 # 0 PRE-PROCESSING DATA
 # --------------------------------------------------------------------
 
-# Input table
+# Input table (only the columns used below)
+usecols = ["bioproject", "collection_date_sam", "metagenome_category",
+           "geo_loc_name_country_continent_calc"]
 amr_df = pd.read_csv(
     "../data/full_card_metadata_aro_allfilters_metagenomes2.csv",
-    low_memory=False)
+    usecols=usecols, low_memory=False)
 
-#sra_df = pd.read_csv("../data/SRA_metadata_allfilters.csv", low_memory=False) # Old one
+#sra_df = pd.read_csv("../data/SRA_metadata_allfilters.csv", usecols=usecols, low_memory=False) # Old one
 
-sra_df = pd.read_csv("../data/SRA_metadata_allfilters_logan.csv", low_memory=False) # New one with only SRA entries that were assembled in Logan
+sra_df = pd.read_csv("../data/SRA_metadata_allfilters_logan.csv", usecols=usecols, low_memory=False) # New one with only SRA entries that were assembled in Logan
 
 def date_collection(df):
     df = df.copy()
@@ -61,47 +63,54 @@ continent_colors = dict(zip(
     ["#ff595e", "#ff924c", "#ffca3a", "#8ac926", "#1982c4", "#6a4c93"]
 ))
 
-def agg_quarter_continent(df, category):
+def continent_weights(df):
     """
-    Return a quarters per continent table of BioProject *weights*.
+    BioProject *weights* for every quarter × continent × category at once.
 
-    Each BioProject contributes a total weight of 1 per quarter,
-    divided equally among the continents it appears in that quarter.
+    Each BioProject contributes a total weight of 1 per quarter and
+    category, divided equally among the continents it appears in that
+    quarter. Returns (weights, quarters, continents, categories), with
+    weights a 3-D array indexed [quarter, continent, category].
     """
-    subset = (
-        df[df["metagenome_category"] == category]
-          .loc[:, ["quarter_bin",
-                   "bioproject",
-                   "geo_loc_name_country_continent_calc"]]
-    )
-
-    # For every (quarter, BioProject) pair, count its continents
-    continent_counts = (
-        subset.drop_duplicates()                               # unique rows
-              .groupby(["quarter_bin", "bioproject"])
-              ["geo_loc_name_country_continent_calc"]
-              .nunique()
-              .rename("n_cont")
-    )
-
-    # Merge back to compute the fractional weight = 1 / n_cont
-    subset = subset.drop_duplicates().merge(
-        continent_counts,
-        on=["quarter_bin", "bioproject"],
-        how="left"
-    )
-    subset["weight"] = 1 / subset["n_cont"]
-
-    out = (
-        subset.groupby(
-                ["quarter_bin", "geo_loc_name_country_continent_calc"]
-              )["weight"]
-              .sum()
-              .unstack(fill_value=0)
-              .reindex(columns=continent_order, fill_value=0)
-              .sort_index()
-    )
-    return out
+    keys = ["quarter_bin", BIOPROJECT_COL,
+            "geo_loc_name_country_continent_calc", "metagenome_category"]
+    sub = df[keys].dropna()
+
+    # integer codes, labels sorted
+    (q, quarters), (b, _), (c, continents), (k, categories) = (
+        pd.factorize(sub[col], sort=True) for col in keys)
+    n_q, n_b, n_c, n_k = len(quarters), b.max() + 1, len(continents), len(categories)
+
+    # unique (quarter, BioProject, continent, category) rows
+    q, b, c, k = (a.astype(np.int64) for a in (q, b, c, k))
+    row = np.unique(((q * n_k + k) * n_b + b) * n_c + c)
+    c = row % n_c
+    project = row // n_c                     # (quarter, category, BioProject)
+    k = project // n_b % n_k
+    q = project // n_b // n_k
+
+    # continents per (quarter, category, BioProject) → weight = 1 / n_cont
+    _, inv, n_cont = np.unique(project, return_inverse=True, return_counts=True)
+    weight = 1 / n_cont[inv]
+
+    weights = np.bincount((q * n_c + c) * n_k + k, weights=weight,
+                          minlength=n_q * n_c * n_k).reshape(n_q, n_c, n_k)
+    return (weights, pd.Index(quarters, name="quarter_bin"),
+            pd.Index(continents), pd.Index(categories))
+
+
+def agg_quarter_continent(weights_cube, category):
+    """Quarters × continent_order table of BioProject weights for one category."""
+    weights, quarters, continents, categories = weights_cube
+    if category not in categories:
+        return pd.DataFrame(columns=continent_order, index=quarters[:0], dtype=float)
+    w = weights[:, :, categories.get_loc(category)]
+    seen = w.sum(axis=1) > 0                 # quarters with any BioProject
+    return (pd.DataFrame(w[seen], index=quarters[seen], columns=continents)
+              .reindex(columns=continent_order, fill_value=0))
+
+amr_weights = continent_weights(amr_df)
+sra_weights = continent_weights(sra_df)
 
 # --------------------------------------------------------------------
 # 3  PLOTS  – loop once per metagenome category
@@ -112,7 +121,7 @@ cat2color  = dict(zip(categories, palette))
 
 for cat in categories:
     # ---------- POSITIVE DISCOVERY   (stacked by continent) ----------
-    pos_df = agg_quarter_continent(amr_df, cat)
+    pos_df = agg_quarter_continent(amr_weights, cat)
     fig, ax = plt.subplots(figsize=(11, 3.5))
     pos_df.plot(kind="bar", stacked=True, width=0.9, ax=ax,
                 color=[continent_colors[c] for c in pos_df.columns])
@@ -130,7 +139,7 @@ for cat in categories:
     plt.close()
 
     # ---------- TOTAL VS POSITIVE  +  CONTINENT STACK ---------------
-    tot_cont_df = agg_quarter_continent(sra_df, cat)      # totals by continent
+    tot_cont_df = agg_quarter_continent(sra_weights, cat)      # totals by continent
     aligned_idx = tot_cont_df.index
     x = np.arange(len(aligned_idx)); w = 0.42
 
@@ -1,67 +1,36 @@
-import pandas as pd
 import seaborn as sns          # only for the palette used in circles plot
 import matplotlib.pyplot as plt
 import numpy as np
+from accession_table import load_accession_table, discovery_counts
 
 # --------------------------------------------------------------------
 # 0 PRE-PROCESSING DATA
 # --------------------------------------------------------------------
 
-# Input table
-amr_df = pd.read_csv(
-    "../data/full_card_metadata_aro_allfilters_metagenomes2.csv",
-    low_memory=False)
+# Input tables, reduced to one row per accession (cached next to each CSV)
+amr_acc = load_accession_table(
+    "../data/full_card_metadata_aro_allfilters_metagenomes2.csv")
 
-#sra_df = pd.read_csv("../data/SRA_metadata_allfilters.csv", low_memory=False) # Old one
+#sra_acc = load_accession_table("../data/SRA_metadata_allfilters.csv") # Old one
 
-sra_df = pd.read_csv("../data/SRA_metadata_allfilters_logan.csv", low_memory=False) # New one with only SRA entries that were assembled in Logan
-
-# Function to prepare tables to have date as year bins
-def date_collection(df):
-    df = df.copy()
-    df['collection_date_sam'] = pd.to_datetime(
-        df['collection_date_sam'].str.strip('[]'),
-        errors='coerce')
-    df = df.dropna(subset=['collection_date_sam'])
-    df['quarter_bin'] = (
-        df['collection_date_sam']
-            .dt.to_period('Q') # Generate 4 bins per year
-    )
-    return df
-
-amr_df = date_collection(amr_df)
-sra_df = date_collection(sra_df)
+sra_acc = load_accession_table("../data/SRA_metadata_allfilters_logan.csv") # New one with only SRA entries that were assembled in Logan
 
 # --------------------------------------------------------------------
 # 1  COUNT UNIQUE ACCESSIONS  (total vs. positives)
 # --------------------------------------------------------------------
 # Total samples per (quarter, category)
-tot_counts = (
-    sra_df
-      .groupby(["quarter_bin", "metagenome_category"])["acc"] 
-      .nunique()
-)
+tot_counts = discovery_counts(sra_acc, date="collection_day", freq="Q",
+                              by="metagenome_category")
 
 # Positives per (quarter, category)
-pos_counts = (
-    amr_df
-      .groupby(["quarter_bin", "metagenome_category"])["acc"]
-      .nunique()
-)
+pos_counts = discovery_counts(amr_acc, date="collection_day", freq="Q",
+                              by="metagenome_category")
 
 # Total db for stacking
-tot_df = (
-    tot_counts
-      .unstack(fill_value=0)
-      .sort_index()
-)
+tot_df = tot_counts
 
 # Pos db for plotting
-pos_df = (
-    pos_counts
-      .unstack(fill_value=0)
-      .reindex(index=tot_df.index, columns=tot_df.columns, fill_value=0)
-)
+pos_df = pos_counts.reindex(index=tot_df.index, columns=tot_df.columns, fill_value=0)
 
 # Colour-blind palette, one colour per category
 categories     = tot_df.columns.tolist()
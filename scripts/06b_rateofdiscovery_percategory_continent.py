@@ -1,49 +1,34 @@
-import pandas as pd
 import seaborn as sns # only for the palette used in circles plot
 import matplotlib.pyplot as plt
 import numpy as np
+from prevalence_cube import load_cube, distinct_counts, quarter_index, positive_dims, total_dims
 
 # --------------------------------------------------------------------
 # 0 PRE-PROCESSING DATA
 # --------------------------------------------------------------------
 
-# Input table
-amr_df = pd.read_csv(
+# Input tables as prevalence cubes: one bitmap of accessions per
+# collection quarter × continent × metagenome category (× drug class for
+# the AMR hits), built once and cached next to the CSVs (prevalence_cube.py).
+# Distinct accessions for any coarser grouping are the size of the union
+# of its cells.
+amr_cube = load_cube(
     "../data/full_card_metadata_aro_allfilters_metagenomes2.csv",
-    low_memory=False)
-
-sra_df = pd.read_csv("../data/SRA_metadata_allfilters_logan.csv", low_memory=False) # New one with only-Logan available entries
-
-# Function to prepare tables to have date as year bins
-def date_collection(df):
-    df = df.copy()
-    df['collection_date_sam'] = pd.to_datetime(
-        df['collection_date_sam'].str.strip('[]'),
-        errors='coerce')
-    df = df.dropna(subset=['collection_date_sam'])
-    df['quarter_bin'] = (
-        df['collection_date_sam']
-            .dt.to_period('Q') # Generate 4 bins per year
-    )
-    return df
+    positive_dims)   # same cube as 06a; drug classes are unioned away
+
+sra_cube = load_cube("../data/SRA_metadata_allfilters_logan.csv", total_dims) # New one with only-Logan available entries
 
-amr_df = date_collection(amr_df)
-sra_df = date_collection(sra_df)
+def quarter_table(cube, by, where=None):
+    """Distinct accessions per quarter (PeriodIndex) × `by`."""
+    out = distinct_counts(cube, ["quarter", by], where).unstack(fill_value=0)
+    out.index = quarter_index(out.index)
+    return out
 
 # Positive samples vs Total
-tot_cat_df = (
-    sra_df
-      .groupby(["quarter_bin", "metagenome_category"])["acc"]
-      .nunique()
-      .unstack(fill_value=0)
-      .sort_index()
-)
+tot_cat_df = quarter_table(sra_cube, "metagenome_category")
 
 pos_cat_df = (
-    amr_df
-      .groupby(["quarter_bin", "metagenome_category"])["acc"]
-      .nunique()
-      .unstack(fill_value=0)
+    quarter_table(amr_cube, "metagenome_category")
       .reindex(index=tot_cat_df.index, columns=tot_cat_df.columns, fill_value=0)
 )
 
@@ -58,14 +43,10 @@ continent_colors = dict(zip(
     ["#ff595e", "#ff924c", "#ffca3a", "#8ac926", "#1982c4", "#6a4c93"]
 ))
 
-def agg_quarter_continent(df, category):
+def agg_quarter_continent(cube, category):
     out = (
-        df[df["metagenome_category"] == category]
-        .groupby(["quarter_bin", "geo_loc_name_country_continent_calc"])["acc"]
-        .nunique()
-        .unstack(fill_value=0)
+        quarter_table(cube, "continent", where={"metagenome_category": category})
         .reindex(columns=continent_order, fill_value=0)
-        .sort_index()
     )
     return out
 
@@ -73,7 +54,7 @@ def agg_quarter_continent(df, category):
 # --------------------------------------------------------------------
 # 1  PLOTS  – loop once per metagenome category
 # --------------------------------------------------------------------
-categories = sorted(amr_df["metagenome_category"].dropna().unique())
+categories = sorted({key[2] for key in amr_cube["cells"]})
 
 # One fixed colour per metagenome category (same colour-blind palette as bubbles plot)
 palette    = sns.color_palette("colorblind", n_colors=len(categories))
@@ -81,7 +62,7 @@ cat2color  = dict(zip(categories, palette))
 
 for cat in categories:
     # positives only
-    pos_df  = agg_quarter_continent(amr_df, cat)
+    pos_df  = agg_quarter_continent(amr_cube, cat)
 
     fig, ax = plt.subplots(figsize=(11, 3.5))
     pos_df.plot(kind="bar", stacked=True, ax=ax, width=0.9,
@@ -107,7 +88,7 @@ for cat in categories:
     # LEFT BAR  (totals vs positives)
     # draw grey for every quarter; draw coloured layer only if >0
     # always draw the grey layer
-    tot_cont_df = agg_quarter_continent(sra_df, cat)
+    tot_cont_df = agg_quarter_continent(sra_cube, cat)
     fig, ax = plt.subplots(figsize=(11, 3.5))
 
     aligned_idx = tot_cont_df.index          # master index for this figure
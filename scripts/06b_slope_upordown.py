@@ -2,7 +2,8 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from statsmodels.stats.proportion import proportions_ztest
+from trend_stats import grouped_ols, proportions_ztest_arrays, bh_adjust
+from render_farm import render_jobs
 
 """
 Slope-graph of AMR prevalence:
@@ -35,11 +36,16 @@ ERA_A_YEARS = range(2000, 2012)          # 2000-11
 ERA_B_YEARS = range(2012, 2024)          # 2012-23
 ERA_LABELS  = ("2000-11", "2012-23")
 
+P_COL = "p_adj"        # significance mask: Benjamini-Hochberg per era, or "p" for raw
+
+RENDER_WORKERS = None  # figure-rendering processes; None = one per CPU
+
 # ---------------------------------------------------------------#
 # 1 · Load both tables
 # ---------------------------------------------------------------#
-hits_df = pd.read_csv(HITS_CSV, low_memory=False)
-meta_df = pd.read_csv(META_CSV, low_memory=False)
+meta_cols = [SAMPLE_ID, "collection_date_sam", CONT_COL, CAT_COL]
+hits_df = pd.read_csv(HITS_CSV, usecols=meta_cols + ["ARO_DrugClass"], low_memory=False)
+meta_df = pd.read_csv(META_CSV, usecols=meta_cols, low_memory=False)
 
 # ---------------------------------------------------------------#
 # 2 · Common tidy-up
@@ -117,51 +123,44 @@ wide = era_df.pivot_table(
             values=["positive", "total", "prevalence"]
        ).dropna(axis=0)
 
-def ztest_row(row):
-    pos_a, tot_a = row["positive"][ERA_LABELS[0]], row["total"][ERA_LABELS[0]]
-    pos_b, tot_b = row["positive"][ERA_LABELS[1]], row["total"][ERA_LABELS[1]]
-    stat, p = proportions_ztest([pos_a, pos_b], [tot_a, tot_b])
-    return pd.Series({
-        "prev_A": row["prevalence"][ERA_LABELS[0]],
-        "prev_B": row["prevalence"][ERA_LABELS[1]],
-        "delta" : row["prevalence"][ERA_LABELS[1]] -
-                  row["prevalence"][ERA_LABELS[0]],
-        "p"     : p
-    })
+# two-proportion z-test for all groups at once
+era_a, era_b = ERA_LABELS
+_, p = proportions_ztest_arrays(wide["positive"][era_a], wide["total"][era_a],
+                                wide["positive"][era_b], wide["total"][era_b])
 
-slope_tbl = wide.apply(ztest_row, axis=1).reset_index()
+slope_tbl = pd.DataFrame({
+    "prev_A": wide["prevalence"][era_a],
+    "prev_B": wide["prevalence"][era_b],
+    "delta" : wide["prevalence"][era_b] - wide["prevalence"][era_a],
+    "p"     : p,
+    "p_adj" : bh_adjust(p),
+}, index=wide.index).reset_index()
 
 # ---------------------------------------------------------------#
 # A · compute within-era slopes  (one number per era per group)
 # ---------------------------------------------------------------#
-from scipy.stats import linregress
-
-def slope_within_era(group):
-    """Return slope & p of prevalence ~ year within one era."""
-    if group['year_bin'].nunique() < 3:        # too few points
-        return pd.Series({'slope': np.nan, 'p': np.nan})
-    res = linregress(group['year_bin'], group['prevalence'])
-    return pd.Series({'slope': res.slope, 'p': res.pvalue})
-
 # attach era label first
 df['era'] = df['year_bin'].map(era_label)
 df_era    = df.dropna(subset=['era'])
 
-slopes = (df_era
-    .groupby(['era',               # 2000-11  /  2012-23
-              'ARO_DrugClass',
-              CONT_COL,
-              CAT_COL])
-    .apply(slope_within_era)
-    .reset_index()
-)
+# slope & p of prevalence ~ year for every group at once
+# (NaN when a group has fewer than 3 distinct years)
+slopes = (grouped_ols(df_era,
+                      ['era',               # 2000-11  /  2012-23
+                       'ARO_DrugClass',
+                       CONT_COL,
+                       CAT_COL],
+                      'year_bin', 'prevalence', min_unique_x=3)
+          .rename(columns={'pvalue': 'p'})
+          .reset_index())
+slopes['p_adj'] = slopes.groupby('era')['p'].transform(bh_adjust)
 
 # ---------------------------------------------------------------#
 # B · build the pivot table with multi-index columns
 # ---------------------------------------------------------------#
-# choose which era you want; loop if you want both in a single run
-for era_label in ERA_LABELS:                 # ('2000-11', '2012-23')
-    era_slopes = slopes.query("era == @era_label")
+# one heat-map per era, rendered in parallel (render_farm.py)
+def plot_era_trend(era_label, era_slopes):
+    """Heat-map of the within-era slopes, drug × (continent, category)."""
 
     # wide table: rows = drug, columns = (continent, category)
     table = era_slopes.pivot_table(
@@ -176,14 +175,14 @@ for era_label in ERA_LABELS:                 # ('2000-11', '2012-23')
     pvals = era_slopes.pivot_table(
                 index='ARO_DrugClass',
                 columns=[CONT_COL, CAT_COL],
-                values='p'
+                values=P_COL
             )
     mask = pvals >= 0.05       # True where slope is NOT significant
 
     # -----------------------------------------------------------#
     # D · plot as a heat-map
     # -----------------------------------------------------------#
-    plt.figure(figsize=(12, 5))
+    fig = plt.figure(figsize=(12, 5))
     sns.heatmap(table,
                 cmap='vlag',
                 center=0,           # white = flat
@@ -192,10 +191,18 @@ for era_label in ERA_LABELS:                 # ('2000-11', '2012-23')
                 mask=mask,          # hide non-significant slopes
                 cbar_kws=dict(label="Slope of prevalence / year"))
     plt.title(f"Trend inside era {era_label}\n"
-              "(red = decline, blue = increase, blank = p≥0.05)")
+              f"(red = decline, blue = increase, blank = {P_COL}≥0.05)")
     plt.tight_layout()
-    plt.savefig(f"../data/within_era_trend_{era_label}.png", dpi=300)
-    plt.savefig(f"../data/within_era_trend_{era_label}.svg")
+    return fig
+
+jobs = [
+    dict(func=plot_era_trend,
+         args=(era_label, slopes.query("era == @era_label")),
+         out=f"../data/within_era_trend_{era_label}.png", dpi=300)
+    for era_label in ERA_LABELS                 # ('2000-11', '2012-23')
+]
+render_jobs(jobs, n_workers=RENDER_WORKERS,
+            manifest="../data/within_era_trend_render_manifest.csv")
 
 
 
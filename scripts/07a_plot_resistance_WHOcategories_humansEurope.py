@@ -4,6 +4,8 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 import numpy as np
+from render_farm import render_jobs
+from who_timeline import drug_classes, category_base, drug_timelines, hit_columns
 
 # ------------------------------------------------------------------
 # 0  CONFIG
@@ -11,6 +13,7 @@ import numpy as np
 input_file = "../data/full_card_metadata_aro_allfilters_metagenomes_WHOcategories.csv"
 out_dir    = "../data/who_category_timelines_human_europe"
 os.makedirs(out_dir, exist_ok=True)
+render_workers = None    # figure-rendering processes; None = one per CPU
 
 # helper : same as before ------------------------------------------
 def date_collection_metagenome(df):
@@ -27,7 +30,7 @@ def date_collection_metagenome(df):
 # ------------------------------------------------------------------
 # 1  LOAD + PRE-PROCESS  (add human / Europe filter)
 # ------------------------------------------------------------------
-df = pd.read_csv(input_file, low_memory=False)
+df = pd.read_csv(input_file, usecols=hit_columns + ["WHO_categories"], low_memory=False)
 df = date_collection_metagenome(df)
 
 # -------- filter to human metagenomes collected in Europe ----------
@@ -43,9 +46,6 @@ if df.empty:
 
 df["quarter_bin"] = df["collection_date_sam"].dt.to_period("Q")
 
-df["_drug_lower"]    = df["ARO_DrugClass"].str.lower().fillna("")
-df["_genefam_lower"] = df["AMR_GeneFamily"].str.lower().fillna("")
-
 # ------------------------------------------------------------------
 # 2  DEFINE WINDOW 2016-2022 (re-compute after filtering)
 # ------------------------------------------------------------------
@@ -64,40 +64,16 @@ if all_quarters.empty:
 # ------------------------------------------------------------------
 # 3  DRUG CLASS & COLOUR DEFINITIONS
 # ------------------------------------------------------------------
-drug_classes = {
-    "Access": [
-        "penicillin beta-lactam", "tetracycline antibiotic",
-        "nitrofuran antibiotic", "nitroimidazole antibiotic"
-    ],
-    "Watch": [
-        "fluoroquinolone antibiotic", "macrolide antibiotic",
-        "glycopeptide antibiotic", "carbapenem",
-        "lincosamide antibiotic", "monobactam"
-    ],
-    "Reserve": [
-        "glycylcycline", "phosphonic acid antibiotic",
-        "oxazolidinone antibiotic", "colistin"
-    ],
-    "Mixed": [
-        "aminoglycoside antibiotic", "cephalosporin"
-    ],
-    "Not classified": [
-        "isoniazid-like antibiotic"
-    ]
-}
-
-category_base = {
-    "Access":         "#4b8e0d",  # green
-    "Watch":          "#d95f02",  # orange
-    "Reserve":        "#c51b1b",  # red
-    "Mixed":          "#6a4c93",  # purple
-    "Not classified": "#999999"   # grey
-}
+# drug_classes / category_base are shared by all 07a scripts (who_timeline.py)
+
+# unique accessions per quarter for every drug, from one groupby
+counts = drug_timelines(df, all_quarters)
 
 # ------------------------------------------------------------------
 # 4  PLOTS
 # ------------------------------------------------------------------
-for who_cat, drugs in drug_classes.items():
+def plot_who_category(who_cat, drugs, counts):
+    """One WHO category: a line per drug class."""
     base_colour  = category_base[who_cat]
     palette_full = sns.light_palette(base_colour, n_colors=len(drugs) + 3, reverse=True)
     palette      = palette_full[:-1]          # drop palest shade
@@ -109,22 +85,7 @@ for who_cat, drugs in drug_classes.items():
     fig, ax = plt.subplots(figsize=(12, 4))
 
     for i, drug in enumerate(drugs):
-        if drug == "colistin":
-            mask = df["_genefam_lower"].str.contains("colistin")
-        else:
-            mask = df["_drug_lower"].str.contains(drug)
-
-        subset = (
-            df.loc[mask, ["quarter_bin", "acc"]]
-              .drop_duplicates()                          # one per (quarter, acc)
-        )
-
-        timeline = (
-            subset.groupby("quarter_bin")["acc"]
-                   .nunique()
-                   .reindex(all_quarters, fill_value=0)
-                   .sort_index()
-        )
+        timeline = counts[drug]
 
         ax.plot(x, timeline.values,
                 label=drug,
@@ -139,11 +100,15 @@ for who_cat, drugs in drug_classes.items():
     ax.tick_params(axis="x", rotation=45)
     ax.legend(title="drug class", bbox_to_anchor=(1.02, 1), loc="upper left")
     plt.tight_layout()
+    return fig
 
-    fname = os.path.join(out_dir,
-                         f"timeline_{who_cat.replace(' ', '_').lower()}_human_europe.png")
-    fig.savefig(fname, dpi=600)
-    fig.savefig(fname.replace(".png", ".svg"))
-    plt.close()
+jobs = [
+    dict(func=plot_who_category, args=(who_cat, drugs, counts[drugs]),
+         out=os.path.join(out_dir,
+                          f"timeline_{who_cat.replace(' ', '_').lower()}_human_europe.png"))
+    for who_cat, drugs in drug_classes.items()
+]
+render_jobs(jobs, n_workers=render_workers,
+            manifest=os.path.join(out_dir, "render_manifest.csv"))
 
 print("plots written to:", os.path.abspath(out_dir))
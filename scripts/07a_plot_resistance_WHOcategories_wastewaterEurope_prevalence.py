@@ -3,6 +3,8 @@ import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import numpy as np
+from render_farm import render_jobs
+from who_timeline import drug_classes, category_base, drug_timelines, hit_columns
 
 
 # Inputs and output paths
@@ -10,6 +12,7 @@ amr_csv = "../data/full_card_metadata_aro_allfilters_metagenomes2.csv"
 sra_csv = "../data/SRA_metadata_allfilters_logan.csv"
 out_dir = "../data/who_prevalence_wastewater_europe"
 os.makedirs(out_dir, exist_ok=True)
+render_workers = None    # figure-rendering processes; None = one per CPU
 
 def date_collection_metagenome(df):
     df = df.copy()
@@ -23,8 +26,8 @@ def date_collection_metagenome(df):
 # ------------------------------------------------------------------
 # load & filter: human metagenomes - Europe only
 # ------------------------------------------------------------------
-amr_df = date_collection_metagenome(pd.read_csv(amr_csv, low_memory=False))
-sra_df = date_collection_metagenome(pd.read_csv(sra_csv, low_memory=False))
+amr_df = date_collection_metagenome(pd.read_csv(amr_csv, usecols=hit_columns, low_memory=False))
+sra_df = date_collection_metagenome(pd.read_csv(sra_csv, usecols=hit_columns[:4], low_memory=False))
 
 amr_df = amr_df[
     (amr_df["metagenome_category"] == "wastewater") &
@@ -50,39 +53,7 @@ timeline = pd.period_range("2016Q1", "2022Q4", freq="Q")
 # ------------------------------------------------------------------
 # WHO drug-class lists  (same as before)
 # ------------------------------------------------------------------
-drug_classes = {
-    "Access": [
-        "penicillin beta-lactam", "tetracycline antibiotic",
-        "nitrofuran antibiotic", "nitroimidazole antibiotic"
-    ],
-    "Watch": [
-        "fluoroquinolone antibiotic", "macrolide antibiotic",
-        "glycopeptide antibiotic", "carbapenem",
-        "lincosamide antibiotic", "monobactam"
-    ],
-    "Reserve": [
-        "glycylcycline", "phosphonic acid antibiotic",
-        "oxazolidinone antibiotic", "colistin"
-    ],
-    "Mixed": [
-        "aminoglycoside antibiotic", "cephalosporin"
-    ],
-    "Not classified": [
-        "isoniazid-like antibiotic"
-    ]
-}
-
-category_base = {
-    "Access":         "#4b8e0d",
-    "Watch":          "#d95f02",
-    "Reserve":        "#c51b1b",
-    "Mixed":          "#6a4c93",
-    "Not classified": "#999999"
-}
-
-# lowercase columns for quick matching
-amr_df["_drug_lower"]    = amr_df["ARO_DrugClass"].str.lower().fillna("")
-amr_df["_genefam_lower"] = amr_df["AMR_GeneFamily"].str.lower().fillna("")
+# drug_classes / category_base are shared by all 07a scripts (who_timeline.py)
 
 # total samples (denominator) – one per acc per quarter
 total_per_q = (
@@ -92,12 +63,16 @@ total_per_q = (
           .reindex(timeline, fill_value=0)
 )
 
+# positive samples (numerator) for every drug, from one groupby
+counts = drug_timelines(amr_df, timeline)
+
 # ------------------------------------------------------------------
 # build one figure per WHO category
 # ------------------------------------------------------------------
 sns.set_theme(style="ticks")
 
-for who_cat, drugs in drug_classes.items():
+def plot_who_category(who_cat, drugs, counts):
+    """One WHO category: a line per drug class."""
     base = category_base[who_cat]
     shades = sns.light_palette(base, n_colors=len(drugs) + 1, reverse=True)[:-1]
 
@@ -108,18 +83,7 @@ for who_cat, drugs in drug_classes.items():
 
     # -- one line per drug class ------------------------------------
     for col, drug in zip(shades, drugs):
-        if drug == "colistin":
-            mask = amr_df["_genefam_lower"].str.contains("colistin")
-        else:
-            mask = amr_df["_drug_lower"].str.contains(drug)
-
-        hits = (
-            amr_df.loc[mask, ["quarter_bin", "acc"]]
-                  .drop_duplicates()
-                  .groupby("quarter_bin")["acc"]
-                  .nunique()
-                  .reindex(timeline, fill_value=0)
-        )
+        hits = counts[drug]
 
         prevalence = hits / total_per_q.replace(0, np.nan)   # avoid /0
         ax.plot(x, prevalence.values, label=drug, color=col, linewidth=2)
@@ -134,11 +98,15 @@ for who_cat, drugs in drug_classes.items():
     ax.legend(title="drug class", bbox_to_anchor=(1.02, 1), loc="upper left")
     sns.despine()
     fig.tight_layout()
+    return fig
 
-    fname = os.path.join(out_dir,
-                         f"prev_{who_cat.replace(' ', '_').lower()}_wastewater_europe.png")
-    fig.savefig(fname, dpi=600)
-    fig.savefig(fname.replace(".png", ".svg"))
-    plt.close()
+jobs = [
+    dict(func=plot_who_category, args=(who_cat, drugs, counts[drugs]),
+         out=os.path.join(out_dir,
+                          f"prev_{who_cat.replace(' ', '_').lower()}_wastewater_europe.png"))
+    for who_cat, drugs in drug_classes.items()
+]
+render_jobs(jobs, n_workers=render_workers,
+            manifest=os.path.join(out_dir, "render_manifest.csv"))
 
 print("plots saved to:", os.path.abspath(out_dir))
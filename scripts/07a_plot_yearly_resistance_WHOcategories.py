@@ -4,6 +4,8 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 import numpy as np
+from render_farm import render_jobs
+from who_timeline import drug_classes, category_base, drug_timelines, hit_columns
 
 # ------------------------------------------------------------------
 # 0  CONFIG
@@ -11,8 +13,9 @@ import numpy as np
 input_file = "../data/full_card_metadata_aro_allfilters_metagenomes_WHOcategories.csv"
 out_dir    = "../data/who_category_timelines"
 os.makedirs(out_dir, exist_ok=True)
+render_workers = None    # figure-rendering processes; None = one per CPU
 
-# Same function for quarter years dating
+# Same function for years dating
 def date_collection_metagenome(df):
     df = df.copy()
     df["collection_date_sam"] = pd.to_datetime(
@@ -27,95 +30,45 @@ def date_collection_metagenome(df):
 # ------------------------------------------------------------------
 # 1  LOAD + PRE-PROCESS (using your helper)
 # ------------------------------------------------------------------
-df = pd.read_csv(input_file, low_memory=False)
+df = pd.read_csv(input_file, usecols=hit_columns + ["WHO_categories"], low_memory=False)
 df = date_collection_metagenome(df)
 
-# lowercase helper columns for matching
-df["_drug_lower"]    = df["ARO_DrugClass"].str.lower().fillna("")
-df["_genefam_lower"] = df["AMR_GeneFamily"].str.lower().fillna("")
-
-# full timeline
-all_quarters = pd.period_range(df["quarter_bin"].min(),
-                               df["quarter_bin"].max(),
-                               freq="Q")
-
+# full timeline (one bin per year)
 # Stick to 2016 - 2022 as it has the most reliable data
 # We also have the antibiotic usage data only for that period
-start_q = pd.Period("2016")
-end_q   = pd.Period("2022")
-
-# keep only quarters inside the window
-all_quarters = all_quarters[(all_quarters >= start_q) & (all_quarters <= end_q)]
+all_years = pd.RangeIndex(max(df["year_bin"].min(), 2016),
+                          min(df["year_bin"].max(), 2022) + 1, name="year_bin")
 
 # if no data fall in that range, skip plotting
-if all_quarters.empty:
+if all_years.empty:
     raise ValueError("No data between 2016 and 2022 in the dataset")
 
 # ------------------------------------------------------------------
 # 2  DRUG CLASS DEFINITIONS
 # ------------------------------------------------------------------
-drug_classes = {
-    "Access": [
-        "penicillin beta-lactam", "tetracycline antibiotic",
-        "nitrofuran antibiotic", "nitroimidazole antibiotic"
-    ],
-    "Watch": [
-        "fluoroquinolone antibiotic", "macrolide antibiotic",
-        "glycopeptide antibiotic", "carbapenem",
-        "lincosamide antibiotic", "monobactam"
-    ],
-    "Reserve": [
-        "glycylcycline", "phosphonic acid antibiotic",
-        "oxazolidinone antibiotic", "colistin"
-    ],
-    "Mixed": [
-        "aminoglycoside antibiotic", "cephalosporin"
-    ],
-    "Not classified": [
-        "isoniazid-like antibiotic"
-    ]
-}
-
-category_base = {
-    "Access":         "#4b8e0d",  # green
-    "Watch":          "#d95f02",  # orange
-    "Reserve":        "#c51b1b",  # red
-    "Mixed":          "#6a4c93",  # purple
-    "Not classified": "#999999"   # grey
-}
+# drug_classes / category_base are shared by all 07a scripts (who_timeline.py)
+
+# unique accessions per year for every drug, from one groupby
+counts = drug_timelines(df, all_years, bin_col="year_bin")
 
 # ------------------------------------------------------------------
 # 3  PLOTS
 # ------------------------------------------------------------------
-for who_cat, drugs in drug_classes.items():
+def plot_who_category(who_cat, drugs, counts):
+    """One WHO category: a line per drug class."""
     base_colour = category_base[who_cat]
     palette_full = sns.light_palette(base_colour, n_colors=len(drugs) + 1, reverse=True)
 
     palette = palette_full[:-1] # Don't allow the lightest colour
 
-    x = np.arange(len(all_quarters))
-    year_pos  = [i for i, p in enumerate(all_quarters) if p.quarter == 1]
-    year_labs = [str(p.year) for p in all_quarters if p.quarter == 1]
+    x = np.arange(len(all_years))
+    year_pos  = x
+    year_labs = [str(y) for y in all_years]
 
     fig, ax = plt.subplots(figsize=(12, 4))
 
     for i, drug in enumerate(drugs):
-        if drug == "colistin":
-            mask = df["_genefam_lower"].str.contains("colistin")
-        else:
-            mask = df["_drug_lower"].str.contains(drug)
-
-        subset = (
-            df.loc[mask, ["quarter_bin", "acc"]]
-              .drop_duplicates()                    # one per (quarter, acc)
-        )
-
-        timeline = (
-            subset.groupby("quarter_bin")["acc"]
-                   .nunique()
-                   .reindex(all_quarters, fill_value=0)
-                   .sort_index()
-        )
+        timeline = counts[drug]
 
         ax.plot(x,
                 timeline.values,
@@ -134,11 +87,15 @@ for who_cat, drugs in drug_classes.items():
     ax.legend(title="drug class",
               bbox_to_anchor=(1.02, 1), loc="upper left")
     plt.tight_layout()
-
-    fname = os.path.join(out_dir,
-                         f"timeline_{who_cat.replace(' ', '_').lower()}.png")
-    fig.savefig(fname, dpi=600)
-    fig.savefig(fname.replace(".png", ".svg"))
-    plt.close()
+    return fig
+
+jobs = [
+    dict(func=plot_who_category, args=(who_cat, drugs, counts[drugs]),
+         out=os.path.join(out_dir,
+                          f"timeline_{who_cat.replace(' ', '_').lower()}_yearly.png"))
+    for who_cat, drugs in drug_classes.items()
+]
+render_jobs(jobs, n_workers=render_workers,
+            manifest=os.path.join(out_dir, "render_manifest_yearly.csv"))
 
 print("plots written to:", os.path.abspath(out_dir))
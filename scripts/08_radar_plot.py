@@ -25,8 +25,9 @@ def date_collection_metagenome(df):
 
 keep_meta = ["livestock", "human", "wastewater", "marine", "freshwater", "soil"]
 
-amr = date_collection_metagenome(pd.read_csv(amr_csv, low_memory=False))
-sra = date_collection_metagenome(pd.read_csv(sra_csv, low_memory=False))
+sra_cols = ["acc", "collection_date_sam", "metagenome_category"]
+amr = date_collection_metagenome(pd.read_csv(amr_csv, usecols=sra_cols + ["WHO_categories"], low_memory=False))
+sra = date_collection_metagenome(pd.read_csv(sra_csv, usecols=sra_cols, low_memory=False))
 
 amr = amr.dropna(subset=["WHO_categories"])
 
@@ -2,77 +2,105 @@ import os, math
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from accession_table import to_days, day_bins, no_day
 
 amr_csv = "../data/full_card_metadata_aro_allfilters_metagenomes_WHOcategories.csv"
 sra_csv = "../data/SRA_metadata_allfilters_logan.csv"
 out_dir = "../data/who_radar_mean_prevalence"
 os.makedirs(out_dir, exist_ok=True)
 
-# Yearly bins not used, but might be needed later
-def date_collection_metagenome(df):
-    df = df.copy()
-    df["collection_date_sam"] = pd.to_datetime(
-        df["collection_date_sam"].str.strip("[]"), errors="coerce")
-    
-    required = ["collection_date_sam", "metagenome_category", "WHO_categories"]
-    present  = [col for col in required if col in df.columns]
-    df = df.dropna(subset=present)
-
-    df["year_bin"] = df["collection_date_sam"].dt.year
-    return df
-
 # Stay between 2016‒2021 and keep only selected metagenome categories
-
+years     = list(range(2016, 2022))         # 2021 inclusive
 keep_meta = ["livestock", "human", "wastewater", "marine", "freshwater", "soil"]
 
-amr = date_collection_metagenome(pd.read_csv(amr_csv, low_memory=False))
-sra = date_collection_metagenome(pd.read_csv(sra_csv, low_memory=False))
-
-amr = amr.dropna(subset=["WHO_categories"])
-
-mask_time = amr["collection_date_sam"].between("2016-01-01", "2021-12-31")
-amr = amr.loc[mask_time & amr["metagenome_category"].isin(keep_meta)].copy()
-mask_time = sra["collection_date_sam"].between("2016-01-01", "2021-12-31")
-sra = sra.loc[mask_time & sra["metagenome_category"].isin(keep_meta)].copy()
-
-if amr.empty or sra.empty:
-    print("No rows after filtering")
-    quit()
+# fix naming to match five labels
+wanted_labels = ["Access", "Watch", "Reserve", "Mixed", "Not classified"]
 
-# lowercase for Access/Watch/Reserve detection
-amr["who_class"] = amr["WHO_categories"].str.split(";")
+sample_key = "bioproject"
 
 # --------------------------------------------------------------
-# explode WHO categories so each row has one WHO label
+# distinct (id, year, category[, WHO class]) keys, in file order
 # --------------------------------------------------------------
-amr = amr.explode("who_class").dropna(subset=["who_class"])
-
-# fix naming to match five labels
-wanted_labels = ["Access", "Watch", "Reserve", "Mixed", "Not classified"]
-amr = amr[amr["who_class"].isin(wanted_labels)]
+def first_seen(csv_path, explode_who=False, chunk_size=3_000_000):
+    """
+    Stream csv_path and keep each distinct bioproject / acc key once.
+
+    Rows without a date or metagenome category, outside the years or
+    outside keep_meta are dropped. With explode_who every row gets one
+    row per WHO class in wanted_labels. Keys stay in the order of their
+    first row, so "first row of a bioproject" is the same as in the
+    full table.
+    """
+    usecols = ["acc", sample_key, "collection_date_sam", "metagenome_category"]
+    usecols += ["WHO_categories"] if explode_who else []
+    parts = []
+    for chunk in pd.read_csv(csv_path, usecols=usecols, dtype=str,
+                             chunksize=chunk_size):
+        days = to_days(chunk["collection_date_sam"])
+        chunk = chunk.assign(year=day_bins(days, "Y")).drop(columns="collection_date_sam")
+        chunk = chunk[(days != no_day) & chunk["year"].isin(years) &
+                      chunk["metagenome_category"].isin(keep_meta)]
+        if explode_who:
+            chunk = (chunk.assign(who_class=chunk["WHO_categories"].str.split(";"))
+                          .drop(columns="WHO_categories")
+                          .explode("who_class"))
+            chunk = chunk[chunk["who_class"].isin(wanted_labels)]
+        parts.append(chunk.drop_duplicates())
+    return pd.concat(parts, ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+def count_tensor(keys, id_col):
+    """
+    Distinct id_col counts as a (year × metagenome category [× WHO class]) array.
+
+    The last year slot is the pooled window. As before, an id counts
+    under the category of its first row (per year, or over the window).
+    """
+    keys = keys.dropna(subset=[id_col])
+    who = ["who_class"] if "who_class" in keys else []
+    shape = (len(years) + 1, len(keep_meta)) + ((len(wanted_labels),) if who else ())
+    out = np.zeros(shape, dtype=np.int64)
+    for slot, subset in [(len(years), [id_col] + who),                # pooled
+                         (None,       [id_col, "year"] + who)]:       # per year
+        first = keys.drop_duplicates(subset)
+        year = (first["year"].to_numpy() - years[0]) if slot is None \
+            else np.full(len(first), slot)
+        cat = pd.Categorical(first["metagenome_category"], categories=keep_meta).codes
+        idx = (year, cat) + ((pd.Categorical(first["who_class"], categories=wanted_labels).codes,) if who else ())
+        np.add.at(out, idx, 1)
+    return out
+
+amr_keys = first_seen(amr_csv, explode_who=True)
+sra_keys = first_seen(sra_csv)
+
+if amr_keys.empty or sra_keys.empty:
+    print("No rows after filtering")
+    quit()
 
 # --------------------------------------------------------------
-# total & positive counts   (unique acc per metagenome category)
+# total & positive counts   (unique bioproject / acc per metagenome category)
 # --------------------------------------------------------------
-sample_key = "bioproject"
-
-total_cnt = (
-    sra.drop_duplicates([sample_key])
-       .groupby("metagenome_category")[sample_key]
-       .nunique()
-)
-
-positive_cnt = (
-    amr.drop_duplicates([sample_key, "who_class"])
-       .groupby(["metagenome_category", "who_class"])[sample_key]
-       .nunique()
-).unstack(fill_value=0)
-
-# align tables & compute prevalence matrix
-positive_cnt = positive_cnt.reindex(index=keep_meta, columns=wanted_labels, fill_value=0)
-total_cnt    = total_cnt.reindex(keep_meta, fill_value=0)
-
-prevalence = positive_cnt.div(total_cnt, axis=0).fillna(0)
+positive = {key: count_tensor(amr_keys, key) for key in [sample_key, "acc"]}
+total    = {key: count_tensor(sra_keys, key) for key in [sample_key, "acc"]}
+
+def prevalence_matrix(slot, key=sample_key):
+    """metagenome category × WHO class prevalence for one year slot."""
+    positive_cnt = pd.DataFrame(positive[key][slot], index=keep_meta, columns=wanted_labels)
+    total_cnt    = pd.Series(total[key][slot], index=keep_meta)
+    return positive_cnt.div(total_cnt, axis=0).fillna(0)
+
+# every count behind the radars, one row per year / category / WHO class
+slots = years + ["2016-2021"]
+pd.DataFrame([
+    {"year": slots[i], "metagenome_category": meta, "who_class": who,
+     **{f"positive_{key}": positive[key][i, j, k] for key in positive},
+     **{f"total_{key}": total[key][i, j] for key in total}}
+    for i in range(len(slots))
+    for j, meta in enumerate(keep_meta)
+    for k, who in enumerate(wanted_labels)
+]).to_csv(os.path.join(out_dir, "bioproject_radar_counts.csv"), index=False)
+
+prevalence = prevalence_matrix(len(years))
 
 # --------------------------------------------------------------
 # RADAR PLOT – all six meta categories on one figure
@@ -118,26 +146,8 @@ plt.close()
 
 print("Radar plot saved to:", outfile)
 
-for yr in range(2016, 2022):               # 2021 inclusive
-    amr_yr = amr[amr["collection_date_sam"].dt.year == yr]
-    sra_yr = sra[sra["collection_date_sam"].dt.year == yr]
-
-    total_cnt = (
-        sra_yr.drop_duplicates(sample_key)
-              .groupby("metagenome_category")[sample_key]
-              .nunique()
-              .reindex(keep_meta, fill_value=0)
-    )
-
-    positive_cnt = (
-        amr_yr.drop_duplicates([sample_key, "who_class"])
-              .groupby(["metagenome_category", "who_class"])[sample_key]
-              .nunique()
-              .unstack(fill_value=0)
-              .reindex(index=keep_meta, columns=wanted_labels, fill_value=0)
-    )
-
-    prevalence = positive_cnt.div(total_cnt, axis=0).fillna(0)
+for i, yr in enumerate(years):
+    prevalence = prevalence_matrix(i)
     if prevalence.values.sum() == 0:
         print(f"{yr}: no data - skipping")
         continue
@@ -1,11 +1,10 @@
 import os
-import struct
-import binascii
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 from mpl_toolkits.basemap import Basemap
+from geo_utils import add_lonlat
 
 # -------------------------------------------------------------------
 # CONFIGURATION
@@ -28,36 +27,6 @@ os.makedirs(out_dir, exist_ok=True)
 # -------------------------------------------------------------------
 
 
-def wkb_to_lonlat(hexstr: str):
-    """
-    Decode a WKB POINT (hex) with or without SRID (EPSG:4326) → (lon, lat).
-
-    Handles both:
-        • 25-byte variant 0101… (little endian) or 0001… (big endian) with SRID
-        • 21-byte variant without SRID
-    Returns (np.nan, np.nan) if anything looks wrong.
-    """
-    try:
-        b = binascii.unhexlify(hexstr.strip())
-    except (binascii.Error, AttributeError):
-        return np.nan, np.nan
-
-    if len(b) < 21:         # too short to hold 2 doubles
-        return np.nan, np.nan
-
-    endian = "<" if b[0] == 1 else ">"
-    try:
-        if len(b) == 25:    # SRID header present
-            x = struct.unpack(endian + "d", b[9:17])[0]
-            y = struct.unpack(endian + "d", b[17:25])[0]
-        else:               # plain WKB point
-            x = struct.unpack(endian + "d", b[5:13])[0]
-            y = struct.unpack(endian + "d", b[13:21])[0]
-    except struct.error:
-        return np.nan, np.nan
-    return x, y
-
-
 def main():
     if not os.path.isfile(csv_path):
         raise FileNotFoundError(f"CSV file not found: {csv_path!r}")
@@ -66,9 +35,11 @@ def main():
 
     df = df[df["metagenome_category"].isin(keep)].copy()
 
-    lonlat = df["WTK"].apply(wkb_to_lonlat)
-    df["lon"] = lonlat.str[0]
-    df["lat"] = lonlat.str[1]
+    # lon/lat are stored by the geolocation merge; only older tables need decoding
+    if "lon" not in df.columns:
+        df = add_lonlat(df, "WTK")
+    df["lon"] = pd.to_numeric(df["lon"], errors="coerce")
+    df["lat"] = pd.to_numeric(df["lat"], errors="coerce")
     df = df.dropna(subset=["lon", "lat"])
 
     # one dot per unique positive accession
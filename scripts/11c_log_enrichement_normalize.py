@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from enrichment import category_counts, balanced_enrichment, enrichment_xerr
 
 # -------------------------------------------------
 # file paths
@@ -12,11 +13,14 @@ plot_svg1   = "../data/amr_metagenome_enrichment.svg"
 plot_png2   = "../data/amr_organism_enrichment.png"
 plot_svg2   = "../data/amr_organism_enrichment.svg"
 
+n_boot = 10_000                          # balanced replicates for the CIs
+
 # -------------------------------------------------
 # 1. load data
 # -------------------------------------------------
-df_total = pd.read_csv(total_file, dtype=str, low_memory=False)
-df_amr   = pd.read_csv(amr_file,   dtype=str, low_memory=False)
+usecols  = ["acc", "organism_type", "metagenome_category"]
+df_total = pd.read_csv(total_file, usecols=usecols, dtype=str, low_memory=False)
+df_amr   = pd.read_csv(amr_file,   usecols=usecols, dtype=str, low_memory=False)
 
 # -------------------------------------------------
 # 3. unique-plasmid counts per organism type
@@ -25,35 +29,19 @@ df_amr   = pd.read_csv(amr_file,   dtype=str, low_memory=False)
 # ISOLATE / METAGENOME  –  balanced sample
 # -------------------------------------------------
 
-# 1. unique sets per organism_type
+# 1. unique accession counts per organism_type (total, and AMR-positive among them)
 cats = ["Isolate", "Metagenome"]
+positives, totals = category_counts(df_total, df_amr, "organism_type", "acc", cats)
 
-total_set = {
-    cat: set(df_total.loc[df_total["organism_type"] == cat, "acc"])
-    for cat in cats
-}
-amr_set = {
-    cat: set(df_amr.loc[df_amr["organism_type"] == cat, "acc"])
-    for cat in cats
-}
-
-# 2. smallest bucket size  → sample size
-n_per_cat = min(len(s) for s in total_set.values())
-rng = np.random.default_rng(42)          # reproducible shuffling
-
-totals_sub, amrs_sub = {}, {}
-for cat in cats:
-    sampled = rng.choice(list(total_set[cat]), n_per_cat, replace=False)
-    sampled_set = set(sampled)
-    totals_sub[cat] = n_per_cat
-    amrs_sub[cat]   = len(amr_set[cat] & sampled_set)
-
-totals = pd.Series(totals_sub)
-amrs   = pd.Series(amrs_sub)
+# 2. smallest bucket size → sample size; positives in each balanced
+#    sample are drawn as hypergeometric counts
+rng = np.random.default_rng(42)          # reproducible
 
-# 3. log₂ enrichment
-density_overall = amrs.sum() / totals.sum()
-enrichment = np.log2((amrs / totals) / density_overall).dropna()
+# 3. log₂ enrichment, with percentile CIs over n_boot replicates
+res = balanced_enrichment(positives, totals, rng, n_boot=n_boot)
+res.to_csv(plot_png2.replace(".png", ".csv"))
+print(res)
+enrichment = res["enrichment"].dropna()
 
 # 4. bar plot
 palette = {
@@ -66,7 +54,8 @@ vals      = enrichment.loc[cats_plot]
 colors    = [palette.get(cat, "#bbbbbb") for cat in cats_plot]
 
 fig, ax = plt.subplots(figsize=(7, 4))
-ax.barh(cats_plot, vals, color=colors, edgecolor="black", alpha=0.9)
+ax.barh(cats_plot, vals, color=colors, edgecolor="black", alpha=0.9,
+        xerr=enrichment_xerr(res.loc[cats_plot]), capsize=3)
 ax.axvline(0, color="black", linewidth=1)
 
 ax.set_xlabel("log₂ enrichment of AMR-positive SRA accessions\n"
@@ -103,41 +92,23 @@ df_amr   = df_amr[mask_amr]
 df_total = df_total[mask_total]
 
 # -------------------------------------------------
-# 3. build unique-acc sets per biome
+# 3. unique-acc counts per biome
 # -------------------------------------------------
 cats = sorted(df_total["metagenome_category"].unique())
-
-total_set = {
-    cat: set(df_total.loc[df_total["metagenome_category"] == cat, "acc"])
-    for cat in cats
-}
-amr_set = {
-    cat: set(df_amr.loc[df_amr["metagenome_category"] == cat, "acc"])
-    for cat in cats
-}
+positives, totals = category_counts(df_total, df_amr, "metagenome_category", "acc", cats)
 
 # -------------------------------------------------
-# 4. balance sample sizes
+# 4. balance sample sizes (hypergeometric draws)
 # -------------------------------------------------
-n_per_cat = min(len(s) for s in total_set.values())     # smallest bucket
-
 rng = np.random.default_rng(42)                         # reproducible
-totals_sub, amrs_sub = {}, {}
-
-for cat in cats:
-    sampled = rng.choice(list(total_set[cat]), n_per_cat, replace=False)
-    sampled_set = set(sampled)
-    totals_sub[cat] = n_per_cat
-    amrs_sub[cat]   = len(amr_set[cat] & sampled_set)
-
-totals = pd.Series(totals_sub)
-amrs   = pd.Series(amrs_sub)
 
 # -------------------------------------------------
-# 5. log₂ enrichment
+# 5. log₂ enrichment, with percentile CIs
 # -------------------------------------------------
-density_overall = amrs.sum() / totals.sum()
-enrichment = np.log2((amrs / totals) / density_overall).dropna()
+res = balanced_enrichment(positives, totals, rng, n_boot=n_boot)
+res.to_csv(plot_png1.replace(".png", ".csv"))
+print(res)
+enrichment = res["enrichment"].dropna()
 
 # -------------------------------------------------
 # 6. bar plot (same palette and styling)
@@ -156,7 +127,8 @@ vals      = enrichment.loc[cats_plot]
 colors    = [palette.get(cat, "#bbbbbb") for cat in cats_plot]
 
 fig, ax = plt.subplots(figsize=(7, 4))
-ax.barh(cats_plot, vals, color=colors, edgecolor="black", alpha=0.9)
+ax.barh(cats_plot, vals, color=colors, edgecolor="black", alpha=0.9,
+        xerr=enrichment_xerr(res.loc[cats_plot]), capsize=3)
 ax.axvline(0, color="black", linewidth=1)
 
 ax.set_xlabel("log₂ enrichment of AMR-positive SRA accessions\n"
@@ -0,0 +1,295 @@
+import os
+import sys
+import stat
+import time
+import runpy
+import importlib
+import traceback
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+import pandas as pd
+
+# -------------------------------------------------------------------
+# Plot server: the big tables stay in memory between plot scripts
+# -------------------------------------------------------------------
+# Every plot script is its own process that imports the plotting stack
+# and re-reads the same multi-GB CSVs. The server imports the stack and
+# reads the resident tables once (object columns with few distinct values
+# stored as categoricals), then runs plot scripts unchanged on request:
+# each script runs in a forked child, where pd.read_csv of a resident
+# table is answered from memory. Any other file, or a read_csv call with
+# options that are not handled here (chunksize, parse_dates, ...), still
+# goes to disk. A table is reloaded when its file changes.
+#
+#   python plot_server.py                          start the server
+#   python plot_server.py 06a_plot_multipanel_circles.py 08_radar_plot.py
+#                                                  render through the server
+#   python plot_server.py --local <scripts>        load the tables and render
+#                                                  without a server
+#   python plot_server.py --stop                   stop the server
+
+# The server listens on a Unix socket in a directory only its user can
+# open, and every request must carry a random key kept in a 0600 file next
+# to it, so other users of the host cannot reach it.
+server_dir = os.path.expanduser("~/.amr_plot_server")
+server_address = os.path.join(server_dir, "server.sock")
+server_authkey_path = os.path.join(server_dir, "authkey")
+
+# table path → columns to keep in memory (None = all columns): the union of
+# the usecols of the plot scripts that read it with pd.read_csv. Chunked
+# readers (load_accession_table, load_cube, first_seen) go to disk anyway.
+sample_columns = ["acc", "collection_date_sam", "metagenome_category",
+                  "geo_loc_name_country_continent_calc"]
+hit_columns = sample_columns + ["ARO_DrugClass", "AMR_GeneFamily"]     # who_timeline.hit_columns
+resident_tables = {
+    # 06b_rateofdiscovery_bioproject, 06b_slope_upordown, 07a_*_prevalence
+    "../data/full_card_metadata_aro_allfilters_metagenomes2.csv": hit_columns + ["bioproject"],
+    # 07a_plot_*resistance_WHOcategories*, 08_radar_plot
+    "../data/full_card_metadata_aro_allfilters_metagenomes_WHOcategories.csv": hit_columns + ["WHO_categories"],
+    # 06b_rateofdiscovery_bioproject, 07a_*_prevalence, 08_radar_plot
+    "../data/SRA_metadata_allfilters_logan.csv": sample_columns + ["bioproject"],
+    # 06b_slope_upordown
+    "../data/SRA_metadata_allfilters.csv": sample_columns,
+}
+
+preload_modules = ["numpy", "scipy.stats", "statsmodels.api", "seaborn",
+                   "matplotlib.pyplot", "mpl_toolkits.basemap"]
+
+category_max_ratio = 0.5     # object column → categorical if distinct/rows ≤ this
+
+# read_csv options the in-memory answer reproduces
+served_options = {"usecols", "dtype", "nrows", "low_memory", "sep"}
+
+_read_csv = pd.read_csv
+_tables = {}                 # abspath → {"frame", "header", "categorical", "mtime"}
+_reads = {"memory": 0, "disk": 0}
+
+
+# -------------------------------------------------------------------
+# Resident tables
+# -------------------------------------------------------------------
+def load_table(path, columns=None):
+    """Read one table and store it compactly; returns its size in MB."""
+    t0 = time.perf_counter()
+    header = list(_read_csv(path, nrows=0).columns)
+    if columns is not None:                  # listed columns the file does not have are skipped
+        columns = [c for c in header if c in set(columns)]
+    df = _read_csv(path, usecols=columns, low_memory=False)
+
+    categorical = {}                         # column → dtype it was parsed as
+    for col in df.columns:
+        dtype = df[col].dtype
+        if ((dtype == object or pd.api.types.is_string_dtype(dtype)) and
+                df[col].nunique() <= category_max_ratio * len(df)):
+            df[col] = df[col].astype("category")
+            categorical[col] = dtype
+
+    _tables[os.path.abspath(path)] = {
+        "frame": df, "header": header, "categorical": categorical,
+        "mtime": os.path.getmtime(path),
+    }
+    mb = df.memory_usage(deep=True).sum() / 1e6
+    print(f"resident: {path} {df.shape[0]:,} rows × {df.shape[1]} columns, "
+          f"{mb:,.0f} MB, {len(categorical)} categorical ({time.perf_counter() - t0:.1f} s)")
+    return mb
+
+
+def load_tables(quiet=False):
+    """Import preload_modules and (re)load every resident table that is new or changed."""
+    for module in preload_modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            if not quiet:
+                print(f"not preloaded (not installed): {module}")
+    for path, columns in resident_tables.items():
+        if not os.path.exists(path):
+            if not quiet:
+                print(f"not resident (missing): {path}")
+        elif (os.path.abspath(path) not in _tables or
+                _tables[os.path.abspath(path)]["mtime"] != os.path.getmtime(path)):
+            load_table(path, columns)
+
+
+def _resident(path, kwargs):
+    """The resident entry that can answer this read_csv call, or None."""
+    if not isinstance(path, (str, os.PathLike)) or set(kwargs) - served_options:
+        return None
+    if kwargs.get("sep", ",") != ",":
+        return None
+    entry = _tables.get(os.path.abspath(path))
+    if entry is None or entry["mtime"] != os.path.getmtime(path):
+        return None
+    if kwargs.get("nrows") == 0:             # header reads are cheap from disk
+        return None
+    return entry
+
+
+def resident_read_csv(filepath_or_buffer, *args, **kwargs):
+    """pd.read_csv replacement: resident tables from memory, everything else from disk."""
+    entry = None if args else _resident(filepath_or_buffer, kwargs)
+    if entry is None:
+        _reads["disk"] += 1
+        return _read_csv(filepath_or_buffer, *args, **kwargs)
+
+    frame, header = entry["frame"], entry["header"]
+    usecols = kwargs.get("usecols")
+    if usecols is None:
+        cols = header
+    elif callable(usecols):
+        cols = [c for c in header if usecols(c)]
+    else:
+        wanted = set(usecols)
+        cols = [c for c in header if c in wanted]         # file order, as read_csv
+    unknown = usecols is not None and not callable(usecols) and len(cols) < len(set(usecols))
+    if unknown or not set(cols) <= set(frame.columns):
+        _reads["disk"] += 1               # unknown or non-resident columns
+        return _read_csv(filepath_or_buffer, **kwargs)
+
+    # numbers parsed as text come out differently ("1" vs "1.0"): read those from disk
+    dtype = kwargs.get("dtype") or {}
+    if not isinstance(dtype, dict):
+        dtype = {c: dtype for c in cols}
+    # (also as categories: read_csv makes those from the text, "1" not 1)
+    as_text = [c for c in cols if dtype.get(c) in (str, object, "str", "object", "string")
+               or str(dtype.get(c)) == "category"]
+    if any(c not in entry["categorical"] and not pd.api.types.is_string_dtype(frame[c].dtype)
+           and frame[c].dtype != object for c in as_text):
+        _reads["disk"] += 1
+        return _read_csv(filepath_or_buffer, **kwargs)
+
+    nrows = kwargs.get("nrows")
+    out = frame[cols] if nrows is None else frame[cols].head(nrows)
+    out = out.copy()
+    for col in cols:
+        want = dtype.get(col)
+        if col in entry["categorical"] and str(want) != "category":
+            out[col] = out[col].astype(entry["categorical"][col])   # as parsed from the file
+        if want is not None and str(want) != str(out[col].dtype):
+            out[col] = out[col].astype(want)
+        elif str(want) == "category" and nrows is not None:
+            out[col] = out[col].cat.remove_unused_categories()   # only the rows read
+    _reads["memory"] += 1
+    return out
+
+
+# -------------------------------------------------------------------
+# Running plot scripts
+# -------------------------------------------------------------------
+def _run_script(script, conn):
+    """Child process: run one script with the resident read_csv installed."""
+    import matplotlib
+    matplotlib.use("Agg")
+    os.chdir(os.path.dirname(os.path.abspath(script)))
+    sys.path.insert(0, os.getcwd())
+    pd.read_csv = resident_read_csv
+
+    t0 = time.perf_counter()
+    result = {"script": script, "ok": True, "error": None}
+    try:
+        runpy.run_path(os.path.basename(script), run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            result.update(ok=False, error=f"exit code {e.code}")
+    except Exception:
+        result.update(ok=False, error=traceback.format_exc())
+    result.update(seconds=round(time.perf_counter() - t0, 2), **_reads)
+    conn.send(result)
+    conn.close()
+
+
+def render(scripts):
+    """Run plot scripts one after the other, each in a forked child; returns one result per script."""
+    ctx = multiprocessing.get_context("fork")
+    results = []
+    for script in scripts:
+        parent, child = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_run_script, args=(script, child))
+        proc.start()
+        child.close()
+        try:
+            result = parent.recv()
+        except EOFError:                        # the child died without reporting
+            result = None
+        proc.join()
+        if result is None:
+            result = {"script": script, "ok": False, "seconds": None,
+                      "error": f"process exited with code {proc.exitcode}"}
+        results.append(result)
+        _report(result)
+    return results
+
+
+def _report(result):
+    status = "ok" if result["ok"] else "FAILED"
+    reads = (f", read_csv {result['memory']} from memory / {result['disk']} from disk"
+             if "memory" in result else "")
+    print(f"{result['script']}: {status} in {result['seconds']} s{reads}")
+    if result["error"]:
+        print(result["error"])
+
+
+# -------------------------------------------------------------------
+# Private socket and key
+# -------------------------------------------------------------------
+def _private_dir():
+    """server_dir, created 0700; refuses a directory other users can open."""
+    os.makedirs(server_dir, mode=0o700, exist_ok=True)
+    st = os.stat(server_dir)
+    if st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+        sys.exit(f"{server_dir} must be owned by you and not accessible to others (chmod 700)")
+    return server_dir
+
+
+def server_authkey(create=False):
+    """The per-user random key, generated into a 0600 file by the server."""
+    _private_dir()
+    if create:
+        fd = os.open(server_authkey_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)                    # in case the file already existed
+        with os.fdopen(fd, "wb") as f:
+            f.write(os.urandom(32))
+    with open(server_authkey_path, "rb") as f:
+        return f.read()
+
+
+def serve():
+    load_tables()
+    authkey = server_authkey(create=True)
+    if os.path.exists(server_address):          # left over from a server that died
+        os.remove(server_address)
+    with Listener(server_address, family="AF_UNIX", authkey=authkey) as listener:
+        os.chmod(server_address, 0o600)
+        print(f"plot server listening on {server_address}")
+        while True:
+            with listener.accept() as conn:
+                request = conn.recv()
+                if request["cmd"] == "stop":
+                    conn.send("stopped")
+                    return
+                load_tables(quiet=True)         # picks up changed tables
+                conn.send(render(request["scripts"]))
+
+
+def send(request):
+    try:
+        with Client(server_address, family="AF_UNIX", authkey=server_authkey()) as conn:
+            conn.send(request)
+            return conn.recv()
+    except (FileNotFoundError, ConnectionRefusedError):
+        sys.exit("no plot server running, start it with: python plot_server.py")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args:
+        serve()
+    elif args == ["--stop"]:
+        print(send({"cmd": "stop"}))
+    elif args[0] == "--local":
+        load_tables()
+        render(args[1:])
+    else:
+        # paths are resolved here, the server may run from another directory
+        for result in send({"cmd": "render", "scripts": [os.path.abspath(a) for a in args]}):
+            _report(result)
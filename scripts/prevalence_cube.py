@@ -0,0 +1,250 @@
+import os
+import array
+import pickle
+import numpy as np
+import pandas as pd
+from pyroaring import BitMap
+from accession_table import to_days, day_bins, bin_labels, no_day
+
+# -------------------------------------------------------------------
+# Prevalence cube: one bitmap of accessions per cell
+# -------------------------------------------------------------------
+# Distinct counts are not additive, so a table of counts per cell cannot
+# be rolled up. A bitmap of the (integer-encoded) accessions per cell
+# can: any coarser grouping is the union of its cells, and the count is
+# the size of that union.
+#
+# A cube is a plain dict {"dims": (...), "cells": {key tuple: BitMap}}.
+# The finest grain is quarter × continent × metagenome category
+# (× drug class for the AMR-positive table); quarters are the integer
+# bins of accession_table.day_bins, so year = quarter // 4.
+
+acc_prefixes = ("SRR", "ERR", "DRR")
+bioproject_prefixes = ("PRJNA", "PRJEB", "PRJDB")
+
+id_bits = 30                                     # numbers up to ~1.07e9
+
+source_columns = {
+    "quarter":             "collection_date_sam",
+    "continent":           "geo_loc_name_country_continent_calc",
+    "metagenome_category": "metagenome_category",
+    "drug_class":          "ARO_DrugClass",
+}
+
+total_dims = ("quarter", "continent", "metagenome_category")
+positive_dims = total_dims + ("drug_class",)
+
+
+def encode_ids(ids, prefixes=acc_prefixes, strict=True):
+    """
+    Accession strings → uint32: prefix index << 30 | number (missing ids → -1).
+
+    SRR123 and ERR123 get different codes. With strict=True an id with
+    an unknown prefix, or one that does not parse, raises ValueError;
+    with strict=False it becomes -1 too.
+    """
+    ids = pd.Series(ids, dtype="string")
+    parts = ids.str.extract(r"^([A-Za-z]+)(\d+)$")
+    number = pd.to_numeric(parts[1], errors="coerce").to_numpy(dtype=np.float64)
+    prefix = pd.Categorical(parts[0], categories=list(prefixes)).codes.astype(np.int64)
+
+    ok = ~np.isnan(number) & (number < 2 ** id_bits) & (prefix >= 0)
+    bad = ~ok & ids.notna().to_numpy()
+    if strict and bad.any():
+        raise ValueError(f"{bad.sum()} ids cannot be encoded, e.g. {ids[bad].iloc[0]!r}; "
+                         f"expected a prefix in {prefixes} followed by digits")
+    codes = np.full(len(parts), -1, dtype=np.int64)
+    codes[ok] = (prefix[ok] << id_bits) | number[ok].astype(np.int64)
+    return codes
+
+
+def _bitmap(codes):
+    return BitMap(array.array("I", np.asarray(codes, dtype=np.uint32).tobytes()))
+
+
+def cube_cells(df, dims, id_col="acc", prefixes=acc_prefixes, strict=True):
+    """Bitmap of encoded ids for every combination of dims in df (rows with a missing dim are skipped)."""
+    codes = encode_ids(df[id_col], prefixes, strict)
+    df = df.assign(_id=codes)[list(dims) + ["_id"]].dropna()
+    df = df[df["_id"] >= 0]
+    if df.empty:
+        return {}
+    group, keys = pd.MultiIndex.from_frame(df[list(dims)]).factorize()
+    order = np.argsort(group, kind="stable")
+    bounds = np.flatnonzero(np.diff(group[order])) + 1
+    ids = df["_id"].to_numpy()[order]
+    firsts = np.concatenate([[0], bounds])
+    return {tuple(keys[group[order][s]]): _bitmap(chunk)
+            for s, chunk in zip(firsts, np.split(ids, bounds))}
+
+
+def merge_cells(cells, more):
+    for key, bm in more.items():
+        if key in cells:
+            cells[key] |= bm
+        else:
+            cells[key] = bm
+    return cells
+
+
+def build_cube(csv_path, dims=total_dims, id_col="acc", prefixes=acc_prefixes,
+               chunk_size=3_000_000, strict=True):
+    """
+    Stream a hit / metadata table into a cube over dims.
+
+    The collection date becomes the quarter bin, and drug_class
+    (ARO_DrugClass) is split on ';' so one hit counts towards each of
+    its classes. Hits without a drug class are kept under "". Ids
+    that encode_ids cannot encode raise, or with strict=False are
+    dropped and counted.
+    """
+    usecols = [id_col] + [source_columns[d] for d in dims]
+    cells = {}
+    dropped = set()
+    reader = pd.read_csv(csv_path, usecols=usecols, dtype=str,
+                         chunksize=chunk_size, low_memory=False)
+    for i, chunk in enumerate(reader):
+        chunk = chunk.rename(columns={v: k for k, v in source_columns.items()})
+        chunk = chunk.drop_duplicates()
+        days = to_days(chunk["quarter"])
+        chunk = chunk[days != no_day].assign(quarter=day_bins(days[days != no_day], "Q"))
+        if "drug_class" in dims:
+            chunk["drug_class"] = chunk["drug_class"].fillna("").str.split(";")
+            chunk = chunk.explode("drug_class")
+        if not strict:
+            codes = encode_ids(chunk[id_col], prefixes, strict=False)
+            dropped.update(chunk[id_col][(codes < 0) & chunk[id_col].notna().to_numpy()])
+        merge_cells(cells, cube_cells(chunk, dims, id_col, prefixes, strict))
+        print(f"{csv_path}: chunk {i+1}, {len(cells)} cells")
+    if dropped:
+        print(f"{csv_path}: dropped {len(dropped)} {id_col} values that cannot be encoded, "
+              f"e.g. {sorted(dropped)[:5]}")
+
+    for bm in cells.values():
+        bm.run_optimize()
+    return {"dims": tuple(dims), "cells": cells}
+
+
+def save_cube(path, cube):
+    blobs = {key: bm.serialize() for key, bm in cube["cells"].items()}
+    with open(path, "wb") as f:
+        pickle.dump({"dims": cube["dims"], "cells": blobs}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_cube(path):
+    with open(path, "rb") as f:
+        stored = pickle.load(f)
+    return {"dims": stored["dims"],
+            "cells": {key: BitMap.deserialize(b) for key, b in stored["cells"].items()}}
+
+
+def load_cube(csv_path, dims=total_dims, id_col="acc", prefixes=acc_prefixes,
+              cache_path=None, chunk_size=3_000_000, strict=True):
+    """
+    Cube of csv_path over dims, cached as *.cube.pkl next to the CSV.
+
+    Rebuilt when the cache is missing, older than the CSV or over other dims.
+    """
+    if cache_path is None:
+        cache_path = os.path.splitext(csv_path)[0] + f".{id_col}.cube.pkl"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+        cube = read_cube(cache_path)
+        if cube["dims"] == tuple(dims):
+            return cube
+    cube = build_cube(csv_path, dims, id_col, prefixes, chunk_size, strict)
+    save_cube(cache_path, cube)
+    return cube
+
+
+# -------------------------------------------------------------------
+# Queries
+# -------------------------------------------------------------------
+
+def _key_values(cube, by):
+    """Per cell, the values of the `by` columns ("year" is derived from "quarter")."""
+    pos = {d: i for i, d in enumerate(cube["dims"])}
+    def value(key, d):
+        return key[pos["quarter"]] // 4 if d == "year" else key[pos[d]]
+    return lambda key: tuple(value(key, d) for d in by)
+
+
+def rollup(cube, by, where=None):
+    """
+    Union of the cell bitmaps for every combination of `by`.
+
+    where maps a dim to one allowed value or a collection of them,
+    e.g. {"metagenome_category": "soil", "drug_class": {...}}.
+    Returns {key tuple: BitMap}.
+    """
+    pos = {d: i for i, d in enumerate(cube["dims"])}
+    filters = []
+    for d, allowed in (where or {}).items():
+        allowed = set(allowed) if isinstance(allowed, (set, list, tuple, frozenset)) else {allowed}
+        filters.append((pos[d], allowed))
+    key_of = _key_values(cube, by)
+
+    groups = {}
+    for key, bm in cube["cells"].items():
+        if all(key[i] in allowed for i, allowed in filters):
+            groups.setdefault(key_of(key), []).append(bm)
+    out = {}
+    for k, maps in groups.items():
+        out[k] = maps[0].copy()          # never modify the cube's own cells
+        out[k].update(*maps[1:])
+    return out
+
+
+def distinct_counts(cube, by, where=None):
+    """Distinct ids per combination of `by`, as a Series indexed by `by`."""
+    groups = rollup(cube, by, where)
+    index = pd.MultiIndex.from_tuples(groups, names=by) if len(by) > 1 \
+        else pd.Index([k[0] for k in groups], name=by[0])
+    return pd.Series([len(bm) for bm in groups.values()], index=index,
+                     name="n", dtype=np.int64).sort_index()
+
+
+def prevalence(positive_cube, total_cube, by, where=None, within_total=False):
+    """
+    positive / total distinct ids for every combination of `by`.
+
+    `by` may include drug_class, which only the positive cube has; the
+    total for such a row is that of its other `by` values. Likewise a
+    drug_class filter in `where` only applies to the positive cube.
+    Without drug_class in `by` every total cell gets a row (positive 0
+    if none), with it only combinations that have positives, as in the
+    left merge of positive onto total counts (total NaN where the total
+    cube has no such cell). within_total=True counts only
+    positives that are also in the total cube.
+    """
+    where = dict(where or {})
+    tot_by = [d for d in by if d != "drug_class"]
+    sel = [by.index(d) for d in tot_by]
+    pos = rollup(positive_cube, by, where)
+    tot = rollup(total_cube, tot_by,
+                 {d: v for d, v in where.items() if d in total_cube["dims"]})
+
+    keys = tot.keys() if len(tot_by) == len(by) else pos.keys()
+    rows = []
+    for k in keys:
+        tk = tuple(k[i] for i in sel)
+        p, t = pos.get(k), tot.get(tk)
+        if p is None:
+            n_pos = 0
+        elif within_total:
+            n_pos = p.intersection_cardinality(t) if t is not None else 0
+        else:
+            n_pos = len(p)
+        rows.append((n_pos, len(t) if t is not None else np.nan))
+
+    keys = list(keys)
+    index = pd.MultiIndex.from_tuples(keys, names=by) if len(by) > 1 \
+        else pd.Index([k[0] for k in keys], name=by[0])
+    out = pd.DataFrame(rows, index=index, columns=["positive", "total"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["prevalence"] = out["positive"] / out["total"]
+    return out.sort_index()
+
+
+def quarter_index(quarters):
+    """PeriodIndex for the integer quarter bins of a cube."""
+    return bin_labels(quarters, "Q")
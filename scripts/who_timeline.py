@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------------------------
+# Per-drug timelines for the WHO category plots (07a_*)
+# -------------------------------------------------------------------
+# The hit table has far fewer distinct (ARO_DrugClass, AMR_GeneFamily)
+# pairs than rows. The drug-class membership is decided once per pair,
+# and every per-drug series then comes out of the same groupby instead
+# of one string scan of the whole table per drug.
+
+drug_classes = {
+    "Access": [
+        "penicillin beta-lactam", "tetracycline antibiotic",
+        "nitrofuran antibiotic", "nitroimidazole antibiotic"
+    ],
+    "Watch": [
+        "fluoroquinolone antibiotic", "macrolide antibiotic",
+        "glycopeptide antibiotic", "carbapenem",
+        "lincosamide antibiotic", "monobactam"
+    ],
+    "Reserve": [
+        "glycylcycline", "phosphonic acid antibiotic",
+        "oxazolidinone antibiotic", "colistin"
+    ],
+    "Mixed": [
+        "aminoglycoside antibiotic", "cephalosporin"
+    ],
+    "Not classified": [
+        "isoniazid-like antibiotic"
+    ]
+}
+
+category_base = {
+    "Access":         "#4b8e0d",  # green
+    "Watch":          "#d95f02",  # orange
+    "Reserve":        "#c51b1b",  # red
+    "Mixed":          "#6a4c93",  # purple
+    "Not classified": "#999999"   # grey
+}
+
+all_drugs = [d for drugs in drug_classes.values() for d in drugs]
+
+# matched on AMR_GeneFamily instead of ARO_DrugClass
+gene_family_drugs = {"colistin"}
+
+hit_columns = ["acc", "collection_date_sam", "metagenome_category",
+               "geo_loc_name_country_continent_calc",
+               "ARO_DrugClass", "AMR_GeneFamily"]
+
+
+def drug_flags(df, drugs=all_drugs):
+    """
+    Drug membership of every row, decided once per distinct ARO.
+
+    Returns (codes, flags): codes gives each row its distinct
+    (ARO_DrugClass, AMR_GeneFamily) pair, flags[code, j] tells whether
+    that pair matches drugs[j] (case-insensitive substring, as before).
+    """
+    pairs = df[["ARO_DrugClass", "AMR_GeneFamily"]].fillna("")
+    codes, uniques = pd.MultiIndex.from_frame(pairs).factorize()
+    drug_col = pd.Series(uniques.get_level_values(0)).str.lower()
+    family_col = pd.Series(uniques.get_level_values(1)).str.lower()
+
+    flags = np.zeros((len(uniques), len(drugs)), dtype=bool)
+    for j, drug in enumerate(drugs):
+        col = family_col if drug in gene_family_drugs else drug_col
+        flags[:, j] = col.str.contains(drug, regex=False).to_numpy()
+    return codes, flags
+
+
+def drug_timelines(df, bins, drugs=all_drugs, bin_col="quarter_bin", id_col="acc"):
+    """
+    Unique accessions per bin for every drug, as a bins × drugs table.
+
+    An accession counts once per bin for a drug if any of its hits in
+    that bin matches the drug. The table is reindexed to `bins`.
+    """
+    aro, flags = drug_flags(df, drugs)
+    b, bin_values = pd.factorize(df[bin_col], sort=True)
+    acc, acc_values = pd.factorize(df[id_col])
+    ok = (b >= 0) & (acc >= 0)
+    n_acc, n_aro = len(acc_values), len(flags)
+
+    # distinct (bin, accession, ARO) rows, sorted by bin then accession
+    key = np.unique((b[ok].astype(np.int64) * n_acc + acc[ok]) * n_aro + aro[ok])
+    if not len(key):
+        return pd.DataFrame(0, index=pd.Index(bins, name=bin_col), columns=drugs)
+    sample = key // n_aro                        # (bin, accession)
+    first = np.flatnonzero(np.r_[True, sample[1:] != sample[:-1]])
+    hit = np.logical_or.reduceat(flags[key % n_aro], first, axis=0)   # ≥1 hit → 1 flag
+
+    sample_bin = sample[first] // n_acc
+    starts = np.flatnonzero(np.r_[True, sample_bin[1:] != sample_bin[:-1]])
+    counts = np.add.reduceat(hit.astype(np.int64), starts, axis=0)
+
+    out = pd.DataFrame(counts, columns=drugs,
+                       index=pd.Index(bin_values[sample_bin[starts]], name=bin_col))
+    return out.reindex(bins, fill_value=0).rename_axis(bin_col)